@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "0003_add_qualified_contracts"
+down_revision = "0002_add_order_intents"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "qualified_contracts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("cache_key", sa.String(), nullable=False),
+        sa.Column("con_id", sa.Integer(), nullable=True),
+        sa.Column("symbol", sa.String(), nullable=True),
+        sa.Column("sec_type", sa.String(), nullable=True),
+        sa.Column("contract_json", sa.Text(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("cache_key", name="uq_qualified_contracts_cache_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("qualified_contracts")
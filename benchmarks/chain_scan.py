@@ -0,0 +1,555 @@
+"""
+Offline benchmark for PortfolioManager.find_eligible_contracts.
+
+A synthetic option chain, priced with Black-Scholes, is served by a fake IBKR
+that answers each market data request after a configurable delay, holding one
+market data line (through the same MarketDataScheduler as the real wrapper)
+while it waits. Each scan is run end to end for every chain size and scan
+mode, both with option_chains.strikes capping the strikes scanned and with
+every strike in the chain scanned, and the subscriptions used, peak lines in
+use, wall time and peak memory are reported. With the cap, the lines used stay
+the same however large the chain is; uncapped, they grow with it.
+
+    uv run python -m benchmarks.chain_scan
+    uv run python -m benchmarks.chain_scan --size 10000 --greeks-latency 0.5
+    uv run python -m benchmarks.chain_scan --strikes 0 --mode baseline
+"""
+
+import asyncio
+import itertools
+import math
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+from ib_async import (
+    IB,
+    BarData,
+    Contract,
+    Option,
+    OptionChain,
+    OptionComputation,
+    Stock,
+    Ticker,
+)
+from rich.console import Console
+from rich.table import Table
+
+from thetagang import log
+from thetagang.config import (
+    AccountConfig,
+    Config,
+    OptionChainsConfig,
+    RollWhenConfig,
+    SymbolConfig,
+    TargetConfig,
+)
+from thetagang.greeks import (
+    CALENDAR_DAYS_PER_YEAR,
+    TRADING_DAYS_PER_YEAR,
+    black_scholes_delta,
+    black_scholes_price,
+)
+from thetagang.ibkr import MarketDataPriority, MarketDataScheduler, TickerField
+from thetagang.options import option_dte
+from thetagang.portfolio_manager import NoValidContractsError, PortfolioManager
+
+SYMBOL = "BENCH"
+CHAIN_SIZES = [50, 500, 2000, 10000]
+# option_chains.strikes for the scans, where None scans every strike in the
+# chain
+STRIKE_CAPS: List[Optional[int]] = [15, None]
+
+# Option chain settings for each scan mode, on top of OptionChainsConfig's
+# defaults
+SCAN_MODES: Dict[str, Dict[str, object]] = {
+    "baseline": {},
+    "delta_prefilter": {"delta_prefilter": True},
+    "two_phase": {"two_phase_scan": True},
+    "streaming": {"streaming_scan": True},
+    "prefilter_streaming": {"delta_prefilter": True, "streaming_scan": True},
+}
+
+
+class SyntheticChain:
+    """
+    An option chain with roughly `contracts` contracts, laid out as (at least
+    six) weekly expirations by strikes spread evenly from half to one and a
+    half times the spot price. Quotes and greeks come from Black-Scholes at a
+    fixed volatility, so the same contract always gets the same ticker.
+    """
+
+    def __init__(
+        self,
+        contracts: int,
+        spot: float = 100.0,
+        volatility: float = 0.3,
+        rate: float = 0.04,
+        first_dte: int = 7,
+    ) -> None:
+        self.spot = spot
+        self.volatility = volatility
+        self.rate = rate
+        expiration_count = max(6, round(math.sqrt(contracts / 4)))
+        strike_count = max(2, math.ceil(contracts / expiration_count))
+        today = date.today()
+        self.expirations = [
+            (today + timedelta(days=first_dte + 7 * week)).strftime("%Y%m%d")
+            for week in range(expiration_count)
+        ]
+        self.strikes = sorted(
+            {
+                round(float(strike), 2)
+                for strike in np.linspace(0.5 * spot, 1.5 * spot, strike_count)
+            }
+        )
+        self.underlying = Stock(SYMBOL, "SMART", "USD", primaryExchange="NASDAQ")
+        self.__con_ids: Dict[Tuple[str, float, str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.expirations) * len(self.strikes)
+
+    def option_chain(self) -> OptionChain:
+        return OptionChain("SMART", 1, SYMBOL, "100", self.expirations, self.strikes)
+
+    def con_id(self, contract: Contract) -> int:
+        key = (contract.lastTradeDateOrContractMonth, contract.strike, contract.right)
+        return self.__con_ids.setdefault(key, len(self.__con_ids) + 2)
+
+    def underlying_ticker(self, with_implied_volatility: bool) -> Ticker:
+        ticker = Ticker(contract=self.underlying)
+        ticker.bid, ticker.bidSize = self.spot - 0.01, 100
+        ticker.ask, ticker.askSize = self.spot + 0.01, 100
+        if with_implied_volatility:
+            ticker.impliedVolatility = self.volatility
+        return ticker
+
+    def option_ticker(self, contract: Contract, with_greeks: bool) -> Ticker:
+        years = (
+            option_dte(contract.lastTradeDateOrContractMonth) / CALENDAR_DAYS_PER_YEAR
+        )
+        price = float(
+            black_scholes_price(
+                self.spot,
+                contract.strike,
+                years,
+                self.rate,
+                self.volatility,
+                contract.right,
+            )
+        )
+        # Quotes are a penny wide, with a floor so deep OTM contracts still
+        # have a (worthless) bid
+        ticker = Ticker(contract=contract)
+        ticker.bid, ticker.bidSize = max(0.01, round(price - 0.01, 2)), 10
+        ticker.ask, ticker.askSize = max(0.02, round(price + 0.01, 2)), 10
+        if with_greeks:
+            ticker.modelGreeks = OptionComputation(
+                tickAttrib=0,
+                impliedVol=self.volatility,
+                delta=float(
+                    black_scholes_delta(
+                        self.spot,
+                        contract.strike,
+                        years,
+                        self.rate,
+                        self.volatility,
+                        contract.right,
+                    )
+                ),
+                optPrice=price,
+                pvDividend=0.0,
+                gamma=0.0,
+                vega=0.0,
+                theta=0.0,
+                undPrice=self.spot,
+            )
+        return ticker
+
+    def open_interest(self, contract: Contract) -> float:
+        # Open interest falls off away from the money
+        return float(round(5000 * math.exp(-abs(contract.strike / self.spot - 1) * 10)))
+
+    def daily_bars(self, days: int) -> List[BarData]:
+        # Closes alternating up and down by the same log return have a
+        # realized volatility of (almost exactly) self.volatility
+        step = self.volatility / math.sqrt(TRADING_DAYS_PER_YEAR)
+        start = date.today() - timedelta(days=days)
+        bars = []
+        for day in range(days):
+            close = self.spot * math.exp(step if day % 2 else 0.0)
+            bars.append(
+                BarData(
+                    date=start + timedelta(days=day),
+                    open=close,
+                    high=close,
+                    low=close,
+                    close=close,
+                    volume=0,
+                    average=close,
+                    barCount=0,
+                )
+            )
+        return bars
+
+
+class FakeIBKR:
+    """
+    Stands in for IBKR in find_eligible_contracts. Every quote request holds a
+    market data line for the configured latency: quote_latency for quotes
+    alone, or greeks_latency when greeks were asked for too (whichever is
+    longer).
+    """
+
+    def __init__(
+        self,
+        chain: SyntheticChain,
+        quote_latency: float = 0.0,
+        greeks_latency: float = 0.0,
+        max_market_data_lines: int = 90,
+    ) -> None:
+        self.chain = chain
+        self.quote_latency = quote_latency
+        self.greeks_latency = greeks_latency
+        self.market_data_scheduler = MarketDataScheduler(max_market_data_lines)
+        self.subscriptions = 0
+        self.peak_lines = 0
+
+    async def __subscribe(self, fields: Sequence[TickerField]) -> None:
+        await self.market_data_scheduler.acquire(MarketDataPriority.OPTION_CHAIN)
+        self.subscriptions += 1
+        self.peak_lines = max(self.peak_lines, self.market_data_scheduler.lines_in_use)
+        try:
+            latency = self.quote_latency
+            if TickerField.GREEKS in fields:
+                latency = max(latency, self.greeks_latency)
+            await asyncio.sleep(latency)
+        finally:
+            self.market_data_scheduler.release()
+
+    async def get_ticker_for_contract(
+        self,
+        contract: Contract,
+        generic_tick_list: str = "",
+        required_fields: List[TickerField] = [TickerField.MARKET_PRICE],
+        optional_fields: List[TickerField] = [TickerField.MIDPOINT],
+        priority: MarketDataPriority = MarketDataPriority.OPTION_CHAIN,
+        snapshot: bool = False,
+    ) -> Ticker:
+        fields = required_fields + optional_fields
+        await self.__subscribe(fields)
+        if isinstance(contract, Option):
+            return self.chain.option_ticker(contract, TickerField.GREEKS in fields)
+        return self.chain.underlying_ticker("106" in generic_tick_list)
+
+    async def get_tickers_for_contracts(
+        self,
+        underlying_symbol: str,
+        contracts: List[Contract],
+        generic_tick_list: str = "",
+        required_fields: List[TickerField] = [TickerField.MARKET_PRICE],
+        optional_fields: List[TickerField] = [TickerField.MIDPOINT],
+        priority: MarketDataPriority = MarketDataPriority.OPTION_CHAIN,
+        snapshot: bool = False,
+    ) -> List[Ticker]:
+        return list(
+            await asyncio.gather(
+                *(
+                    self.get_ticker_for_contract(
+                        contract,
+                        generic_tick_list,
+                        required_fields,
+                        optional_fields,
+                        priority,
+                        snapshot,
+                    )
+                    for contract in contracts
+                )
+            )
+        )
+
+    async def get_chains_for_contract(self, contract: Contract) -> List[OptionChain]:
+        return [self.chain.option_chain()]
+
+    async def qualify_contracts(self, *contracts: Contract) -> List[Contract]:
+        for contract in contracts:
+            contract.conId = self.chain.con_id(contract)
+        return list(contracts)
+
+    async def request_historical_data(
+        self, contract: Contract, duration: str
+    ) -> List[BarData]:
+        return self.chain.daily_bars(int(duration.split()[0]))
+
+    async def get_open_interest(
+        self,
+        underlying_symbol: str,
+        contracts: List[Contract],
+        today: Optional[date] = None,
+    ) -> Dict[int, float]:
+        await asyncio.gather(*(self.__subscribe([]) for _ in contracts))
+        return {
+            contract.conId: self.chain.open_interest(contract) for contract in contracts
+        }
+
+
+class ScanResult:
+    def __init__(
+        self,
+        contracts: int,
+        mode: str,
+        strike_cap: Optional[int],
+        subscriptions: int,
+        peak_lines: int,
+        wall_time: float,
+        peak_memory: Optional[int],
+        chosen: Optional[Ticker],
+    ) -> None:
+        self.contracts = contracts
+        self.mode = mode
+        self.strike_cap = strike_cap
+        self.subscriptions = subscriptions
+        self.peak_lines = peak_lines
+        self.wall_time = wall_time
+        self.peak_memory = peak_memory
+        self.chosen = chosen
+
+
+def benchmark_config(
+    mode: str,
+    expirations: int = 4,
+    strikes: int = 15,
+    minimum_open_interest: int = 0,
+    max_market_data_lines: int = 90,
+) -> Config:
+    return Config(
+        account=AccountConfig(number="DU0000000", margin_usage=0.5),
+        option_chains=OptionChainsConfig(
+            expirations=expirations,
+            strikes=strikes,
+            **SCAN_MODES[mode],  # type: ignore
+        ),
+        roll_when=RollWhenConfig(dte=7),
+        target=TargetConfig(dte=30, minimum_open_interest=minimum_open_interest),
+        ib_async={"max_market_data_lines": max_market_data_lines},  # type: ignore
+        symbols={SYMBOL: SymbolConfig(weight=1.0, primary_exchange="NASDAQ")},
+    )
+
+
+async def benchmark_scan(
+    contracts: int,
+    mode: str,
+    right: str = "P",
+    quote_latency: float = 0.0,
+    greeks_latency: float = 0.0,
+    minimum_open_interest: int = 0,
+    trace_memory: bool = False,
+    strike_cap: Optional[int] = 15,
+) -> ScanResult:
+    """
+    Runs one find_eligible_contracts scan over a fresh synthetic chain, with
+    a fresh PortfolioManager so nothing is cached from earlier runs. Memory
+    tracing slows the scan down, so the wall time is only meaningful when
+    trace_memory is off. A strike_cap of None scans every strike in the chain.
+    """
+    chain = SyntheticChain(contracts)
+    config = benchmark_config(
+        mode,
+        strikes=strike_cap or len(chain.strikes),
+        minimum_open_interest=minimum_open_interest,
+    )
+    loop = asyncio.get_running_loop()
+    portfolio_manager = PortfolioManager(
+        config, IB(), loop.create_future(), dry_run=True
+    )
+    ibkr = FakeIBKR(
+        chain,
+        quote_latency,
+        greeks_latency,
+        config.ib_async.max_market_data_lines,
+    )
+    portfolio_manager.ibkr = ibkr  # type: ignore
+
+    if trace_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    try:
+        chosen: Optional[Ticker] = await portfolio_manager.find_eligible_contracts(
+            chain.underlying,
+            right,
+            strike_limit=None,
+            minimum_price=lambda: 0.0,
+        )
+    except NoValidContractsError:
+        # Worth reporting rather than failing on: on dense chains, the nearest
+        # strikes can all be too close to the money for the target delta
+        chosen = None
+    wall_time = time.perf_counter() - started_at
+    peak_memory = None
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return ScanResult(
+        len(chain),
+        mode,
+        strike_cap,
+        ibkr.subscriptions,
+        ibkr.peak_lines,
+        wall_time,
+        peak_memory,
+        chosen,
+    )
+
+
+async def run_benchmarks(
+    sizes: Sequence[int],
+    modes: Sequence[str],
+    right: str = "P",
+    quote_latency: float = 0.0,
+    greeks_latency: float = 0.0,
+    minimum_open_interest: int = 0,
+    strike_caps: Sequence[Optional[int]] = STRIKE_CAPS,
+) -> List[ScanResult]:
+    """Benchmarks each size, strike cap and mode, in that order, timing one
+    scan and measuring the memory of a second."""
+    results = []
+    for contracts, strike_cap, mode in itertools.product(sizes, strike_caps, modes):
+        timed = await benchmark_scan(
+            contracts,
+            mode,
+            right,
+            quote_latency,
+            greeks_latency,
+            minimum_open_interest,
+            strike_cap=strike_cap,
+        )
+        traced = await benchmark_scan(
+            contracts,
+            mode,
+            right,
+            quote_latency,
+            greeks_latency,
+            minimum_open_interest,
+            trace_memory=True,
+            strike_cap=strike_cap,
+        )
+        timed.peak_memory = traced.peak_memory
+        results.append(timed)
+    return results
+
+
+def results_table(results: Sequence[ScanResult]) -> Table:
+    table = Table(title="find_eligible_contracts scans")
+    table.add_column("Contracts", justify="right")
+    table.add_column("Strikes", justify="right")
+    table.add_column("Mode")
+    table.add_column("Subscriptions", justify="right")
+    table.add_column("Peak lines", justify="right")
+    table.add_column("Wall time", justify="right")
+    table.add_column("Peak memory", justify="right")
+    table.add_column("Chosen")
+    previous_contracts = None
+    for result in results:
+        if previous_contracts is not None and result.contracts != previous_contracts:
+            table.add_section()
+        previous_contracts = result.contracts
+        chosen = (
+            f"{result.chosen.contract.lastTradeDateOrContractMonth} "
+            f"{result.chosen.contract.strike}"
+            if result.chosen and result.chosen.contract
+            else "-"
+        )
+        table.add_row(
+            str(result.contracts),
+            str(result.strike_cap) if result.strike_cap else "all",
+            result.mode,
+            str(result.subscriptions),
+            str(result.peak_lines),
+            f"{result.wall_time * 1000:.1f} ms",
+            f"{result.peak_memory / 1024:.0f} KiB"
+            if result.peak_memory is not None
+            else "-",
+            chosen,
+        )
+    return table
+
+
+@click.command()
+@click.option(
+    "--size",
+    "sizes",
+    type=int,
+    multiple=True,
+    help=f"Contracts in the synthetic chain, may be repeated [default: {CHAIN_SIZES}]",
+)
+@click.option(
+    "--mode",
+    "modes",
+    type=click.Choice(list(SCAN_MODES)),
+    multiple=True,
+    help="Scan mode to benchmark, may be repeated [default: all]",
+)
+@click.option(
+    "--strikes",
+    "strike_caps",
+    type=click.IntRange(min=0),
+    multiple=True,
+    help="option_chains.strikes for the scans, or 0 to scan every strike in the "
+    "chain, may be repeated [default: 15 and 0]",
+)
+@click.option("--right", type=click.Choice(["P", "C"]), default="P", show_default=True)
+@click.option(
+    "--quote-latency",
+    type=float,
+    default=0.05,
+    show_default=True,
+    help="Seconds until a contract's quote arrives",
+)
+@click.option(
+    "--greeks-latency",
+    type=float,
+    default=0.2,
+    show_default=True,
+    help="Seconds until a contract's greeks arrive",
+)
+@click.option(
+    "--minimum-open-interest",
+    type=int,
+    default=0,
+    show_default=True,
+    help="target.minimum_open_interest for the scans",
+)
+def main(
+    sizes: Tuple[int, ...],
+    modes: Tuple[str, ...],
+    strike_caps: Tuple[int, ...],
+    right: str,
+    quote_latency: float,
+    greeks_latency: float,
+    minimum_open_interest: int,
+) -> None:
+    # Keep the scans' own logging out of the report
+    log.console.quiet = True
+    try:
+        results = asyncio.run(
+            run_benchmarks(
+                sizes or CHAIN_SIZES,
+                modes or list(SCAN_MODES),
+                right,
+                quote_latency,
+                greeks_latency,
+                minimum_open_interest,
+                [cap or None for cap in strike_caps] or STRIKE_CAPS,
+            )
+        )
+    finally:
+        log.console.quiet = False
+    Console().print(results_table(results))
+
+
+if __name__ == "__main__":
+    main()
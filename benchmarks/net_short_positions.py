@@ -0,0 +1,167 @@
+"""
+Benchmark for util.calculate_net_short_positions against the quadratic
+matching it replaced (kept here as the reference implementation the tests
+compare it to).
+
+    uv run python -m benchmarks.net_short_positions
+    uv run python -m benchmarks.net_short_positions --lots 10000 --no-reference
+"""
+
+import math
+import random
+import time
+from datetime import date, timedelta
+from operator import itemgetter
+from typing import List, Optional, Sequence, Tuple
+
+import click
+from ib_async import PortfolioItem
+from ib_async.contract import Option
+from rich.console import Console
+from rich.table import Table
+
+from thetagang.options import option_dte
+from thetagang.util import (
+    calculate_net_short_positions,
+    get_long_positions,
+    get_short_positions,
+)
+
+
+def quadratic_net_short_positions(positions: List[PortfolioItem], right: str) -> int:
+    """The original calculate_net_short_positions, which walks every long for
+    every short."""
+    shorts: List[Tuple[int, float, float]] = [
+        (
+            option_dte(p.contract.lastTradeDateOrContractMonth),
+            float(p.contract.strike),
+            float(p.position),
+        )
+        for p in get_short_positions(positions, right)
+    ]
+    longs: List[Tuple[int, float, float]] = [
+        (
+            option_dte(p.contract.lastTradeDateOrContractMonth),
+            float(p.contract.strike),
+            float(p.position),
+        )
+        for p in get_long_positions(positions, right)
+    ]
+    shorts = sorted(shorts, key=itemgetter(0, 1), reverse=right.upper().startswith("P"))
+    longs = sorted(longs, key=itemgetter(0, 1), reverse=right.upper().startswith("P"))
+
+    def calc_net(short_dte: int, short_strike: float, short_position: float) -> float:
+        for i in range(len(longs)):
+            if short_position > -1:
+                break
+            (long_dte, long_strike, long_position) = longs[i]
+            if long_position < 1:
+                # ignore empty long positions
+                continue
+            if long_dte >= short_dte:
+                if (
+                    math.isclose(short_strike, long_strike)
+                    or (right.upper().startswith("P") and long_strike >= short_strike)
+                    or (right.upper().startswith("C") and long_strike <= short_strike)
+                ):
+                    if short_position + long_position > 0:
+                        long_position = short_position + long_position
+                        short_position = 0
+                    else:
+                        short_position += long_position
+                        long_position = 0
+            longs[i] = (long_dte, long_strike, long_position)
+        return min([0.0, short_position])
+
+    nets = [calc_net(*short) for short in shorts]
+
+    return math.floor(-sum(nets))
+
+
+def random_lots(
+    count: int,
+    rng: random.Random,
+    expirations: int = 12,
+    strikes: Sequence[float] = tuple(float(strike) for strike in range(80, 121)),
+    max_lot: int = 5,
+) -> List[PortfolioItem]:
+    """Option lots of random right, expiration, strike and (non-zero) size on
+    one underlying."""
+    today = date.today()
+    expiration_dates = [
+        (today + timedelta(days=7 * week)).strftime("%Y%m%d")
+        for week in range(expirations)
+    ]
+    lots = []
+    for _ in range(count):
+        position = float(rng.choice([-1, 1]) * rng.randint(1, max_lot))
+        lots.append(
+            PortfolioItem(
+                contract=Option(
+                    "BENCH",
+                    rng.choice(expiration_dates),
+                    rng.choice(strikes),
+                    rng.choice(["P", "C"]),
+                    "SMART",
+                ),
+                position=position,
+                marketPrice=1.0,
+                marketValue=position * 100,
+                averageCost=100.0,
+                unrealizedPNL=0.0,
+                realizedPNL=0.0,
+                account="DU0000000",
+            )
+        )
+    return lots
+
+
+def time_call(positions: List[PortfolioItem], right: str, reference: bool) -> float:
+    matcher = (
+        quadratic_net_short_positions if reference else calculate_net_short_positions
+    )
+    started_at = time.perf_counter()
+    matcher(positions, right)
+    return time.perf_counter() - started_at
+
+
+@click.command()
+@click.option(
+    "--lots",
+    "lot_counts",
+    type=int,
+    multiple=True,
+    help="Option lots in the portfolio, may be repeated [default: 100 1000 10000]",
+)
+@click.option(
+    "--reference/--no-reference",
+    default=True,
+    show_default=True,
+    help="Also time the quadratic reference implementation",
+)
+@click.option("--seed", type=int, default=0, show_default=True)
+def main(lot_counts: Tuple[int, ...], reference: bool, seed: int) -> None:
+    table = Table(title="calculate_net_short_positions")
+    table.add_column("Lots", justify="right")
+    table.add_column("Right")
+    table.add_column("Net short", justify="right")
+    table.add_column("Sweep", justify="right")
+    table.add_column("Quadratic", justify="right")
+    for count in lot_counts or (100, 1000, 10000):
+        positions = random_lots(count, random.Random(seed))
+        for right in ("P", "C"):
+            quadratic: Optional[float] = (
+                time_call(positions, right, reference=True) if reference else None
+            )
+            table.add_row(
+                str(count),
+                right,
+                str(calculate_net_short_positions(positions, right)),
+                f"{time_call(positions, right, reference=False) * 1000:.1f} ms",
+                f"{quadratic * 1000:.1f} ms" if quadratic is not None else "-",
+            )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import math
+import random
+
+import pytest
+
+from thetagang.allocation import TargetAllocation
+
+
+def test_target_allocation_matches_per_symbol_arithmetic() -> None:
+    rng = random.Random(7)
+    symbols = [f"S{i}" for i in range(250)]
+    weights = [rng.choice([0.0, rng.random() / 100]) for _ in symbols]
+    prices = [rng.uniform(0.5, 2000.0) for _ in symbols]
+    shares = [
+        rng.choice([0, rng.randint(1, 5000), rng.uniform(1, 500)]) for _ in symbols
+    ]
+    total_value = 1_234_567
+
+    for round_to_cents in (True, False):
+        allocation = TargetAllocation(
+            symbols, weights, prices, shares, total_value, round_to_cents
+        )
+        for symbol, weight, price, held in zip(symbols, weights, prices, shares):
+            target_value = weight * total_value
+            if round_to_cents:
+                target_value = round(target_value, 2)
+            current_shares = math.floor(held)
+            current_weight = current_shares * price / total_value
+
+            target = allocation[symbol]
+            assert target.target_value == target_value
+            assert target.target_shares == math.floor(target_value / price)
+            assert target.share_gap == target.target_shares - current_shares
+            assert target.current_shares == current_shares
+            assert target.current_weight == current_weight
+            assert target.weight_delta == current_weight - weight
+            if weight > 0:
+                assert target.relative_drift == abs(current_weight / weight - 1.0)
+
+
+def test_target_allocation_rows_are_python_numbers() -> None:
+    allocation = TargetAllocation(
+        ["AAA", "BBB"], [0.5, 0.5], [10.0, 20.0], [100, 0], 2000
+    )
+
+    assert "AAA" in allocation and "CCC" not in allocation
+    assert len(allocation) == 2
+    assert type(allocation["AAA"].target_shares) is int
+    assert allocation.by_symbol(allocation.share_gaps) == {"AAA": 0, "BBB": 50}
+    assert allocation.by_symbol(allocation.relative_drifts) == {
+        "AAA": pytest.approx(0.0),
+        "BBB": pytest.approx(1.0),
+    }
+    with pytest.raises(KeyError):
+        allocation["CCC"]
+
+
+def test_target_allocation_without_total_value() -> None:
+    allocation = TargetAllocation(["AAA"], [1.0], [10.0], [5], 0)
+
+    assert allocation["AAA"].target_shares == 0
+    assert allocation["AAA"].share_gap == -5
+    assert allocation["AAA"].current_weight == 0
@@ -21,6 +21,9 @@ def mock_config(mocker):
     config.account.number = "TEST123"
     config.ib_async = mocker.Mock()
     config.ib_async.api_response_wait_time = 1
+    config.ib_async.max_market_data_lines = 90
+    config.ib_async.underlying_ticker_ttl = 5.0
+    config.ib_async.option_ticker_ttl = 2.0
     config.orders = mocker.Mock()
     config.orders.exchange = "SMART"
     return config
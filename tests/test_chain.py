@@ -0,0 +1,97 @@
+import random
+from datetime import date, timedelta
+
+import numpy as np
+from ib_async import Option, OptionComputation, Ticker
+
+from thetagang.chain import ChainSnapshot
+from thetagang.options import option_dte
+
+
+def option_ticker(strike, dte, delta, price=1.0, open_interest=100.0, right="P"):
+    expiration = (date.today() + timedelta(days=dte)).strftime("%Y%m%d")
+    ticker = Ticker(contract=Option("TEST", expiration, strike, right, "SMART"))
+    ticker.bid, ticker.bidSize = price - 0.05, 1
+    ticker.ask, ticker.askSize = price + 0.05, 1
+    if right == "P":
+        ticker.putOpenInterest = open_interest
+    else:
+        ticker.callOpenInterest = open_interest
+    if delta is not None:
+        ticker.modelGreeks = OptionComputation(
+            tickAttrib=0,
+            impliedVol=0.2,
+            delta=delta,
+            optPrice=price,
+            pvDividend=0.0,
+            gamma=0.0,
+            vega=0.0,
+            theta=0.0,
+            undPrice=100.0,
+        )
+    return ticker
+
+
+def test_chain_snapshot_columns():
+    tickers = [
+        option_ticker(95.0, 30, -0.25, price=1.5, open_interest=10),
+        option_ticker(90.0, 37, None, price=0.5),
+    ]
+
+    snapshot = ChainSnapshot(tickers, "P")
+
+    assert len(snapshot) == 2
+    assert snapshot.strike.tolist() == [95.0, 90.0]
+    assert snapshot.dte.tolist() == [30, 37]
+    assert snapshot.mid.tolist() == [1.5, 0.5]
+    assert snapshot.open_interest.tolist() == [10.0, 100.0]
+    assert snapshot.delta[0] == -0.25
+    assert np.isnan(snapshot.delta[1])
+
+
+def test_chain_snapshot_filters():
+    tickers = [
+        option_ticker(95.0, 30, -0.25, price=1.5, open_interest=10),
+        option_ticker(90.0, 30, -0.35, price=2.0),
+        option_ticker(85.0, 30, None, price=0.5),
+        option_ticker(250.0, 30, -0.9, price=1.0),
+    ]
+    snapshot = ChainSnapshot(tickers, "P")
+
+    assert snapshot.price_is_valid(0.75, 100.0).tolist() == [True, True, False, False]
+    assert snapshot.delta_is_valid(0.3).tolist() == [True, False, False, False]
+    assert snapshot.open_interest_is_valid(50).tolist() == [False, True, True, True]
+
+    kept = snapshot.take(snapshot.price_is_valid(0.75, 100.0))
+    assert kept.tickers == tickers[:2]
+    assert kept.strike.tolist() == [95.0, 90.0]
+
+
+def test_chain_snapshot_ranking_matches_ticker_sort():
+    rng = random.Random(7)
+    tickers = [
+        option_ticker(
+            float(rng.randint(80, 100)),
+            rng.choice([30, 37, 44]),
+            rng.choice([None, -0.1, -0.2, -0.3, round(-rng.random(), 2)]),
+        )
+        for _ in range(200)
+    ]
+
+    for descending in (True, False):
+        expected = sorted(
+            sorted(
+                tickers,
+                key=lambda t: (
+                    abs(t.modelGreeks.delta)
+                    if t.modelGreeks and t.modelGreeks.delta
+                    else 0
+                ),
+                reverse=descending,
+            ),
+            key=lambda t: option_dte(t.contract.lastTradeDateOrContractMonth),
+        )
+
+        ranked = ChainSnapshot(tickers, "P").ranked(descending)
+
+        assert ranked.tickers == expected
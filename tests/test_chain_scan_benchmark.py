@@ -0,0 +1,62 @@
+import pytest
+
+from benchmarks.chain_scan import (
+    CHAIN_SIZES,
+    SCAN_MODES,
+    SyntheticChain,
+    benchmark_scan,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_synthetic_chain_sizes():
+    for size in CHAIN_SIZES:
+        chain = SyntheticChain(size)
+        assert size <= len(chain) < size * 1.1
+        assert len(chain.option_chain().strikes) == len(chain.strikes)
+
+
+async def test_scan_modes_agree_within_subscription_budget():
+    results = {mode: await benchmark_scan(2000, mode) for mode in SCAN_MODES}
+
+    chosen = {
+        (
+            result.chosen.contract.lastTradeDateOrContractMonth,
+            result.chosen.contract.strike,
+        )
+        for result in results.values()
+    }
+    assert len(chosen) == 1
+    # One line for the underlying, plus 4 expirations x 15 strikes
+    assert results["baseline"].subscriptions == 61
+    # Or 4 expirations x 6 strikes when prefiltering by delta
+    assert results["delta_prefilter"].subscriptions == 25
+    assert results["prefilter_streaming"].subscriptions <= 25
+    assert results["two_phase"].subscriptions < results["baseline"].subscriptions
+
+
+async def test_uncapped_scan_work_grows_with_chain_size():
+    sizes = [500, 2000, 10000]
+    capped = [await benchmark_scan(size, "baseline") for size in sizes]
+    uncapped = [
+        await benchmark_scan(size, "baseline", strike_cap=None) for size in sizes
+    ]
+
+    # Once the chain has more strikes than the cap, the cap holds the lines
+    # used level however large the chain is...
+    assert [result.subscriptions for result in capped] == [61, 61, 61]
+    # ...while scanning every strike takes more of them as the chain grows
+    subscriptions = [result.subscriptions for result in uncapped]
+    assert subscriptions == sorted(set(subscriptions))
+    assert capped[0].subscriptions < subscriptions[0]
+    assert all(result.strike_cap is None for result in uncapped)
+
+
+async def test_scan_holds_no_more_lines_than_budget():
+    result = await benchmark_scan(
+        500, "baseline", quote_latency=0.001, greeks_latency=0.002, trace_memory=True
+    )
+
+    assert 0 < result.peak_lines <= 90
+    assert result.peak_memory
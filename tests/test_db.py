@@ -1,3 +1,4 @@
+import json
 import sqlite3
 from datetime import datetime
 from pathlib import Path
@@ -6,14 +7,19 @@ from types import SimpleNamespace
 from sqlalchemy import select
 
 import thetagang.db as db_module
+from tests.test_portfolio import stock
+from tests.test_util import con
 from thetagang.db import (
     DataStore,
     HistoricalBar,
     OrderIntent,
     OrderRecord,
+    PositionSnapshot,
+    QualifiedContract,
     run_migrations,
     sqlite_db_path,
 )
+from thetagang.portfolio import PositionRecord
 
 
 def test_data_store_records_executions_and_queries(tmp_path) -> None:
@@ -157,6 +163,28 @@ def test_record_historical_bars_upserts_and_parses_dates(tmp_path) -> None:
     assert volume == 20
 
 
+def test_get_historical_bars_returns_window_in_order(tmp_path) -> None:
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+    bars = [
+        SimpleNamespace(date=bar_date, close=close)
+        for bar_date, close in (("20240108", 3.0), ("20240102", 1.0), ("20240105", 2.0))
+    ]
+    data_store.record_historical_bars("AAA", "1 day", bars)
+    data_store.record_historical_bars("BBB", "1 day", bars)
+
+    rows = data_store.get_historical_bars("AAA", "1 day", datetime(2024, 1, 3))
+
+    assert [row["bar_time"] for row in rows] == [
+        datetime(2024, 1, 5),
+        datetime(2024, 1, 8),
+    ]
+    assert [row["close"] for row in rows] == [2.0, 3.0]
+
+
 def test_record_executions_parses_string_times(tmp_path) -> None:
     db_path = tmp_path / "state.db"
     data_store = DataStore(
@@ -253,3 +281,97 @@ def test_get_last_event_payload_ignores_dry_run(tmp_path) -> None:
     payload = live_store.get_last_event_payload("regime_rebalance_state")
 
     assert payload == {"flow_active": False}
+
+
+def test_qualified_contracts_round_trip_and_expire(tmp_path) -> None:
+    db_path = tmp_path / "state.db"
+    data_store = DataStore(
+        f"sqlite:///{db_path}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+        config_text="test",
+    )
+
+    stock_fields = {"conId": 101, "symbol": "AAA", "secType": "STK"}
+    with data_store.session_scope() as session:
+        # As stored by older versions, which never expired stocks
+        session.add(
+            QualifiedContract(
+                cache_key="legacy",
+                contract_json=json.dumps(stock_fields),
+                expires_at=None,
+            )
+        )
+        # And contracts that couldn't be qualified, for a day
+        session.add(
+            QualifiedContract(
+                cache_key="missing", contract_json=None, expires_at=datetime(2999, 1, 1)
+            )
+        )
+    assert data_store.get_qualified_contracts(["legacy", "missing"]) == {}
+
+    data_store.record_qualified_contracts(
+        [
+            ("stock", stock_fields, datetime(2999, 1, 1)),
+            ("expired", {"conId": 102, "symbol": "AAA"}, datetime(2000, 1, 1)),
+        ]
+    )
+
+    cached = data_store.get_qualified_contracts(
+        ["stock", "missing", "expired", "legacy", "x"]
+    )
+
+    assert cached == {"stock": (stock_fields, datetime(2999, 1, 1))}
+    with data_store.session_scope() as session:
+        keys = session.execute(select(QualifiedContract.cache_key)).scalars().all()
+    assert keys == ["stock"]
+
+
+def test_option_chains_round_trip_and_expire(tmp_path) -> None:
+    db_path = tmp_path / "state.db"
+    data_store = DataStore(
+        f"sqlite:///{db_path}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+        config_text="test",
+    )
+    chains = [{"exchange": "SMART", "expirations": ["20250117"], "strikes": [1.0]}]
+
+    data_store.record_option_chains("1|AAA|STK", "AAA", chains, datetime(2999, 1, 1))
+    data_store.record_option_chains("2|BBB|STK", "BBB", chains, datetime(2000, 1, 1))
+
+    assert data_store.get_option_chains("1|AAA|STK") == (
+        chains,
+        datetime(2999, 1, 1),
+    )
+    assert data_store.get_option_chains("2|BBB|STK") is None
+
+
+def test_record_positions_snapshot_takes_items_and_records(tmp_path) -> None:
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+    option = con("20240119", 100.0, "P", -2)
+    positions = [stock("AAA", 100, 50.0), option]
+
+    data_store.record_positions_snapshot({"AAA": positions})
+    data_store.record_positions_snapshot(
+        {"AAA": [PositionRecord.from_portfolio_item(p) for p in positions]}
+    )
+
+    with data_store.session_scope() as session:
+        rows = session.execute(
+            select(
+                PositionSnapshot.sec_type,
+                PositionSnapshot.position,
+                PositionSnapshot.avg_cost,
+                PositionSnapshot.expiry,
+                PositionSnapshot.strike,
+                PositionSnapshot.right,
+            ).order_by(PositionSnapshot.id)
+        ).all()
+
+    assert [tuple(row) for row in rows[:2]] == [tuple(row) for row in rows[2:]]
+    assert tuple(rows[1]) == ("OPT", -2, option.averageCost, "20240119", 100.0, "P")
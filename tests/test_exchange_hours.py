@@ -5,7 +5,12 @@ import pandas as pd
 
 import thetagang.exchange_hours as exchange_hours
 from thetagang.config import ActionWhenClosedEnum, ExchangeHoursConfig
-from thetagang.exchange_hours import determine_action, waited_for_open
+from thetagang.exchange_hours import (
+    determine_action,
+    next_session_open,
+    seconds_until_open,
+    waited_for_open,
+)
 
 
 def test_determine_action_continue_when_closed():
@@ -213,3 +218,38 @@ def test_waited_for_open_no_upcoming_sessions(mock_sleep, monkeypatch):
 
     assert waited_for_open(config, now) is False
     mock_sleep.assert_not_called()
+
+
+def test_seconds_until_open_before_session():
+    config = ExchangeHoursConfig(
+        exchange="XNYS",
+        delay_after_open=60,
+        delay_before_close=60,
+        action_when_closed=ActionWhenClosedEnum.wait,
+    )
+    # The session opens at 14:30 UTC, and we start 60s after that
+    now = datetime(2025, 1, 21, 14, 0, tzinfo=timezone.utc)
+
+    assert seconds_until_open(config, now) == 31 * 60
+
+
+def test_seconds_until_open_after_start_is_zero():
+    config = ExchangeHoursConfig(
+        exchange="XNYS",
+        delay_after_open=60,
+        delay_before_close=60,
+        action_when_closed=ActionWhenClosedEnum.wait,
+    )
+    now = datetime(2025, 1, 21, 15, 0, tzinfo=timezone.utc)
+
+    assert seconds_until_open(config, now) == 0.0
+
+
+def test_next_session_open_skips_session_in_progress():
+    during_session = datetime(2025, 1, 24, 15, 0, tzinfo=timezone.utc)
+    before_open = datetime(2025, 1, 21, 12, 0, tzinfo=timezone.utc)
+    after_close = datetime(2025, 1, 24, 22, 0, tzinfo=timezone.utc)
+
+    assert next_session_open("XNYS", during_session) == datetime(2025, 1, 27, 14, 30)
+    assert next_session_open("XNYS", after_close) == datetime(2025, 1, 27, 14, 30)
+    assert next_session_open("XNYS", before_open) == datetime(2025, 1, 21, 14, 30)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from thetagang.greeks import (
+    annualized_volatility,
+    black_scholes_delta,
+    black_scholes_price,
+    norm_cdf,
+    strikes_near_target_delta,
+)
+
+
+def test_norm_cdf_matches_known_values():
+    assert norm_cdf([0.0, 1.0, -1.96]) == pytest.approx(
+        [0.5, 0.841345, 0.024998], abs=1e-6
+    )
+
+
+def test_black_scholes_matches_textbook_values():
+    # S=100, K=100, T=1y, r=5%, sigma=20%
+    assert black_scholes_price(100, 100, 1.0, 0.05, 0.2, "C") == pytest.approx(
+        10.4506, abs=1e-4
+    )
+    assert black_scholes_price(100, 100, 1.0, 0.05, 0.2, "P") == pytest.approx(
+        5.5735, abs=1e-4
+    )
+    assert black_scholes_delta(100, 100, 1.0, 0.05, 0.2, "C") == pytest.approx(
+        0.6368, abs=1e-4
+    )
+    assert black_scholes_delta(100, 100, 1.0, 0.05, 0.2, "P") == pytest.approx(
+        -0.3632, abs=1e-4
+    )
+
+
+def test_black_scholes_delta_broadcasts_over_chain_grid():
+    years = np.array([[30 / 365], [60 / 365]])
+    strikes = np.array([[90.0, 100.0, 110.0]])
+
+    deltas = black_scholes_delta(100, strikes, years, 0.04, 0.25, "C")
+
+    assert deltas.shape == (2, 3)
+    # Call deltas fall as the strike rises
+    assert np.all(np.diff(deltas, axis=1) < 0)
+
+
+def test_black_scholes_handles_expiring_contracts():
+    deltas = black_scholes_delta(100, [90.0, 110.0], 0.0, 0.04, 0.25, "P")
+
+    assert deltas == pytest.approx([0.0, -1.0], abs=1e-6)
+
+
+def test_annualized_volatility():
+    closes = [101.5 if day % 2 else 100.0 for day in range(21)]
+
+    assert annualized_volatility(closes) == pytest.approx(0.2425, abs=1e-4)
+    assert annualized_volatility([100.0, 101.0]) is None
+    assert annualized_volatility([100.0] * 10) is None
+
+
+def test_strikes_near_target_delta_selects_per_expiration():
+    strikes = [float(strike) for strike in range(80, 106)]
+
+    mask = strikes_near_target_delta(100.0, strikes, [35, 90], 0.04, 0.25, "P", 0.3, 3)
+
+    assert mask.shape == (2, len(strikes))
+    assert mask.sum(axis=1).tolist() == [3, 3]
+    for row, dte in zip(mask, [35, 90]):
+        selected = np.array(strikes)[row]
+        deltas = black_scholes_delta(100.0, selected, dte / 365, 0.04, 0.25, "P")
+        # The selected strikes straddle the target delta
+        assert np.min(np.abs(deltas)) <= 0.3 <= np.max(np.abs(deltas))
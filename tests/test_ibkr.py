@@ -1,12 +1,17 @@
 import asyncio
+import random
+from datetime import date, datetime, timedelta
 from types import SimpleNamespace
 
 import pytest
 from ib_async import (
     IB,
     AccountValue,
+    BarData,
     Contract,
     Index,
+    Option,
+    OptionChain,
     Order,
     OrderStatus,
     Stock,
@@ -15,11 +20,18 @@ from ib_async import (
 )
 
 from thetagang import log
+from thetagang.db import DataStore, utcnow
 from thetagang.ibkr import (
     IBKR,
+    NON_EXPIRING_CONTRACT_TTL,
     IBKRRequestTimeout,
+    MarketDataPriority,
+    MarketDataScheduler,
+    RequestPacer,
     RequiredFieldValidationError,
+    TickerCache,
     TickerField,
+    contract_expires_at,
 )
 
 # Mark all tests in this module as asyncio
@@ -69,121 +81,119 @@ def mock_trade(mocker):
     return trade
 
 
-async def test_get_ticker_for_contract_success(ibkr, mock_ib, mock_ticker, mocker):
-    """Test get_ticker_for_contract when all waits succeed."""
-    mocker.patch.object(
-        ibkr, "__market_data_streaming_handler__", return_value=mock_ticker
-    )
-    # Mock the internal wait methods to return True (success)
-    mocker.patch.object(
-        ibkr, "__ticker_wait_for_condition__", return_value=asyncio.Future()
-    )
-    ibkr.__ticker_wait_for_condition__.return_value.set_result(True)
-
+async def test_get_ticker_for_contract_success(ibkr, mock_ib, mocker):
+    """Test get_ticker_for_contract when all fields arrive."""
     contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    ticker = Ticker(contract=contract)
+    mock_ib.reqMktData = mocker.Mock(return_value=ticker)
+    mock_ib.cancelMktData = mocker.Mock()
+
+    async def deliver_quote():
+        await asyncio.sleep(0)
+        ticker.bid, ticker.bidSize = 9.9, 1
+        ticker.ask, ticker.askSize = 10.1, 1
+        ticker.updateEvent.emit(ticker)
+
+    asyncio.ensure_future(deliver_quote())
     result = await ibkr.get_ticker_for_contract(
         contract,
         required_fields=[TickerField.MARKET_PRICE],
         optional_fields=[TickerField.MIDPOINT],
     )
 
-    assert result == mock_ticker
-    # Check that the wait was attempted (indirectly, via the handler logic patch)
-    ibkr.__market_data_streaming_handler__.assert_awaited_once()
+    assert result is ticker
+    assert len(ticker.updateEvent) == 0
+    mock_ib.cancelMktData.assert_called_once_with(contract)
 
 
-async def test_get_ticker_for_contract_required_timeout(
-    ibkr, mock_ib, mock_ticker, mocker
-):
+async def test_get_ticker_for_contract_required_timeout(ibkr, mock_ib, mocker):
     """Test get_ticker_for_contract when a required field wait times out."""
-    # Mock ib methods called by __market_data_streaming_handler__
-    mock_ib.qualifyContractsAsync = mocker.AsyncMock()
-    mock_ib.reqMktData = mocker.Mock(return_value=mock_ticker)
-
-    # Mock __ticker_field_handler__ to return appropriate async functions
-    async def succeed_wait(ticker):
-        return True
-
-    async def fail_wait(ticker):
-        return False
-
-    def mock_handler_logic(field):
-        if field == TickerField.MARKET_PRICE:  # Required field
-            return fail_wait
-        elif field == TickerField.MIDPOINT:  # Optional field
-            return succeed_wait
-        else:
-            pytest.fail(f"Unexpected field: {field}")
-
-    mocker.patch.object(
-        ibkr, "__ticker_field_handler__", side_effect=mock_handler_logic
-    )
-
     contract = Stock("TEST", "SMART", "USD")
     contract.conId = 1
-    mocker.patch.object(
-        ibkr, "qualify_contracts", new=mocker.AsyncMock(return_value=[contract])
-    )
+    ticker = Ticker(contract=contract)
+    ticker.last = 10.0
+    mock_ib.reqMktData = mocker.Mock(return_value=ticker)
+    mock_ib.cancelMktData = mocker.Mock()
+    ibkr.api_response_wait_time = 0.01
+
     with pytest.raises(RequiredFieldValidationError) as excinfo:
         await ibkr.get_ticker_for_contract(
             contract,
-            required_fields=[TickerField.MARKET_PRICE],
-            optional_fields=[TickerField.MIDPOINT],
+            required_fields=[TickerField.MARKET_PRICE, TickerField.MIDPOINT],
+            optional_fields=[],
         )
 
     assert "Required fields timed out" in str(excinfo.value)
-    assert "MARKET_PRICE" in str(excinfo.value)
-    # Ensure the handler was called for both fields
-    assert ibkr.__ticker_field_handler__.call_count == 2
+    assert "MIDPOINT" in str(excinfo.value)
+    assert "MARKET_PRICE" not in str(excinfo.value)
+    assert ibkr.market_data_scheduler.lines_in_use == 0
 
 
-async def test_get_ticker_for_contract_optional_timeout(
-    ibkr, mock_ib, mock_ticker, mocker
-):
+async def test_get_ticker_for_contract_optional_timeout(ibkr, mock_ib, mocker):
     """Test get_ticker_for_contract when an optional field wait times out."""
-    # Mock ib methods called by __market_data_streaming_handler__
-    mock_ib.qualifyContractsAsync = mocker.AsyncMock()
-    mock_ib.reqMktData = mocker.Mock(return_value=mock_ticker)
-    mock_log_warning = mocker.patch.object(log, "warning")
-
-    # Mock __ticker_field_handler__ to return appropriate async functions
-    async def succeed_wait(ticker):
-        return True
-
-    async def fail_wait(ticker):
-        return False
-
-    def mock_handler_logic(field):
-        if field == TickerField.MARKET_PRICE:  # Required field
-            return succeed_wait
-        elif field == TickerField.MIDPOINT:  # Optional field
-            return fail_wait
-        else:
-            pytest.fail(f"Unexpected field: {field}")
-
-    mocker.patch.object(
-        ibkr, "__ticker_field_handler__", side_effect=mock_handler_logic
-    )
-
     contract = Stock("TEST", "SMART", "USD")
     contract.conId = 1
-    mocker.patch.object(
-        ibkr, "qualify_contracts", new=mocker.AsyncMock(return_value=[contract])
-    )
+    ticker = Ticker(contract=contract)
+    ticker.last = 10.0
+    mock_ib.reqMktData = mocker.Mock(return_value=ticker)
+    mock_ib.cancelMktData = mocker.Mock()
+    mock_log_warning = mocker.patch.object(log, "warning")
+    ibkr.api_response_wait_time = 0.01
+
     result = await ibkr.get_ticker_for_contract(
         contract,
         required_fields=[TickerField.MARKET_PRICE],
         optional_fields=[TickerField.MIDPOINT],
     )
 
-    assert result == mock_ticker
-    # Ensure the handler was called for both fields
-    assert ibkr.__ticker_field_handler__.call_count == 2
+    assert result is ticker
     mock_log_warning.assert_called_once()
     assert "Optional fields timed out" in mock_log_warning.call_args[0][0]
     assert "MIDPOINT" in mock_log_warning.call_args[0][0]
 
 
+async def test_ticker_wait_for_fields_uses_one_handler(ibkr):
+    """All pending fields are checked by a single updateEvent handler."""
+    contract = Option("TEST", "20250117", 100.0, "P", "SMART")
+    ticker = Ticker(contract=contract)
+    fields = [
+        TickerField.MARKET_PRICE,
+        TickerField.MIDPOINT,
+        TickerField.OPEN_INTEREST,
+    ]
+
+    wait = asyncio.ensure_future(
+        ibkr.__ticker_wait_for_fields__(ticker, fields[:2], fields[2:], 1)
+    )
+    await asyncio.sleep(0)
+    assert len(ticker.updateEvent) == 1
+
+    ticker.bid, ticker.bidSize = 1.0, 1
+    ticker.ask, ticker.askSize = 1.2, 1
+    ticker.updateEvent.emit(ticker)
+    await asyncio.sleep(0)
+    assert not wait.done()
+
+    ticker.putOpenInterest = 250
+    ticker.updateEvent.emit(ticker)
+
+    assert await wait == ([], [])
+    assert len(ticker.updateEvent) == 0
+
+
+async def test_ticker_wait_for_fields_returns_immediately_when_ready(ibkr):
+    ticker = Ticker(contract=Stock("TEST", "SMART", "USD"))
+    ticker.last = 10.0
+
+    missing = await ibkr.__ticker_wait_for_fields__(
+        ticker, [TickerField.MARKET_PRICE], [], 60
+    )
+
+    assert missing == ([], [])
+    assert len(ticker.updateEvent) == 0
+
+
 async def test_get_ticker_for_stock_falls_back_to_index(ibkr, mock_ticker, mocker):
     """Fallback to an index contract when stock qualification fails."""
     index_contract = Index("SPX", "CBOE", "USD")
@@ -225,6 +235,650 @@ async def test_market_data_streaming_handler_requires_conid(ibkr, mock_ib, mocke
     mock_ib.reqMktData.assert_not_called()
 
 
+async def test_market_data_streaming_handler_shares_subscription(
+    ibkr, mock_ib, mock_ticker, mocker
+):
+    """Concurrent requests for the same contract share one market data line."""
+    mock_ib.reqMktData = mocker.Mock(return_value=mock_ticker)
+    mock_ib.cancelMktData = mocker.Mock()
+    ready = asyncio.Event()
+
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+
+    async def handler(_ticker):
+        await ready.wait()
+
+    first = asyncio.ensure_future(
+        ibkr.__market_data_streaming_handler__(contract, "101", handler)
+    )
+    second = asyncio.ensure_future(
+        ibkr.__market_data_streaming_handler__(contract, "", handler)
+    )
+    await asyncio.sleep(0)
+
+    mock_ib.reqMktData.assert_called_once_with(contract, genericTickList="101")
+    assert ibkr.subscriptions[1].ref_count == 2
+    assert ibkr.market_data_scheduler.lines_in_use == 1
+
+    ready.set()
+    assert await first is await second
+    mock_ib.cancelMktData.assert_called_once_with(mock_ticker.contract)
+    assert ibkr.subscriptions == {}
+    assert ibkr.market_data_scheduler.lines_in_use == 0
+
+
+async def test_market_data_streaming_handler_resubscribes_for_new_ticks(
+    ibkr, mock_ib, mock_ticker, mocker
+):
+    """Requesting extra generic ticks re-requests the line with the union."""
+    mock_ib.reqMktData = mocker.Mock(return_value=mock_ticker)
+    mock_ib.cancelMktData = mocker.Mock()
+
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+
+    await ibkr.acquire_ticker(contract, "100")
+    await ibkr.acquire_ticker(contract, "101")
+
+    mock_ib.cancelMktData.assert_called_once_with(mock_ticker.contract)
+    assert mock_ib.reqMktData.call_args_list[-1] == mocker.call(
+        contract, genericTickList="100,101"
+    )
+    assert ibkr.subscriptions[1].ref_count == 2
+    assert ibkr.market_data_scheduler.lines_in_use == 1
+
+
+async def test_market_data_streaming_handler_releases_on_failure(
+    ibkr, mock_ib, mock_ticker, mocker
+):
+    """A failing handler doesn't leave the market data line open."""
+    mock_ib.reqMktData = mocker.Mock(return_value=mock_ticker)
+    mock_ib.cancelMktData = mocker.Mock()
+
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+
+    async def handler(_ticker):
+        raise RequiredFieldValidationError("boom")
+
+    with pytest.raises(RequiredFieldValidationError):
+        await ibkr.__market_data_streaming_handler__(contract, "", handler)
+
+    mock_ib.cancelMktData.assert_called_once_with(mock_ticker.contract)
+    assert ibkr.subscriptions == {}
+    assert ibkr.market_data_scheduler.lines_in_use == 0
+
+
+async def test_release_all_tickers_cancels_every_line(ibkr, mock_ib, mocker):
+    mock_ib.cancelMktData = mocker.Mock()
+    tickers = []
+    for con_id in (1, 2):
+        contract = Stock("TEST", "SMART", "USD")
+        contract.conId = con_id
+        tickers.append(Ticker(contract=contract))
+    mock_ib.reqMktData = mocker.Mock(side_effect=tickers)
+
+    for ticker in tickers:
+        await ibkr.acquire_ticker(ticker.contract)
+        await ibkr.acquire_ticker(ticker.contract)
+    ibkr.release_all_tickers()
+
+    assert mock_ib.cancelMktData.call_count == 2
+    assert ibkr.subscriptions == {}
+    assert ibkr.market_data_scheduler.lines_in_use == 0
+
+
+async def test_get_ticker_for_contract_uses_snapshot(ibkr, mock_ib, mocker):
+    """Snapshot-capable fields are fetched with a one-shot snapshot request."""
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    snapshot = Ticker(contract=contract)
+    snapshot.bid, snapshot.bidSize = 10.0, 1
+    snapshot.ask, snapshot.askSize = 10.2, 1
+    snapshot.last = 10.1
+    mock_ib.reqTickersAsync = mocker.AsyncMock(return_value=[snapshot])
+    mock_ib.reqMktData = mocker.Mock()
+
+    result = await ibkr.get_ticker_for_contract(contract, snapshot=True)
+
+    assert result is snapshot
+    mock_ib.reqTickersAsync.assert_awaited_once_with(contract)
+    mock_ib.reqMktData.assert_not_called()
+    assert ibkr.market_data_scheduler.lines_in_use == 0
+
+
+async def test_get_ticker_for_contract_streams_fields_snapshots_lack(
+    ibkr, mock_ib, mock_ticker, mocker
+):
+    """Greeks can't be snapshotted, so the streaming path is used instead."""
+    streaming = mocker.patch.object(
+        ibkr, "__market_data_streaming_handler__", return_value=mock_ticker
+    )
+    mock_ib.reqTickersAsync = mocker.AsyncMock()
+
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    result = await ibkr.get_ticker_for_contract(
+        contract,
+        required_fields=[TickerField.GREEKS],
+        optional_fields=[],
+        snapshot=True,
+    )
+
+    assert result == mock_ticker
+    streaming.assert_awaited_once()
+    mock_ib.reqTickersAsync.assert_not_called()
+
+
+async def test_get_ticker_snapshot_required_field_missing(ibkr, mock_ib, mocker):
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    mock_ib.reqTickersAsync = mocker.AsyncMock(return_value=[Ticker(contract=contract)])
+
+    with pytest.raises(RequiredFieldValidationError) as excinfo:
+        await ibkr.get_ticker_snapshot(contract)
+
+    assert "MARKET_PRICE" in str(excinfo.value)
+    assert ibkr.market_data_scheduler.lines_in_use == 0
+
+
+async def test_get_ticker_snapshot_timeout_keeps_partial_data(ibkr, mock_ib, mocker):
+    """A snapshot that never completes still returns the fields that arrived."""
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    partial = Ticker(contract=contract)
+    partial.last = 10.1
+
+    async def never_completes(*_contracts):
+        await asyncio.sleep(10)
+
+    mock_ib.reqTickersAsync = mocker.Mock(side_effect=never_completes)
+    mock_ib.ticker = mocker.Mock(return_value=partial)
+    mock_log_warning = mocker.patch.object(log, "warning")
+    ibkr.api_response_wait_time = 0.01
+
+    result = await ibkr.get_ticker_snapshot(contract)
+
+    assert result is partial
+    mock_log_warning.assert_called_once()
+    assert "MIDPOINT" in mock_log_warning.call_args[0][0]
+
+
+def quoted_ticker(contract, price=10.0):
+    ticker = Ticker(contract=contract)
+    ticker.bid, ticker.bidSize = price - 0.1, 1
+    ticker.ask, ticker.askSize = price + 0.1, 1
+    ticker.last = price
+    return ticker
+
+
+async def test_get_ticker_for_contract_reuses_cached_quote(ibkr, mock_ib, mocker):
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    mock_ib.reqTickersAsync = mocker.AsyncMock(return_value=[quoted_ticker(contract)])
+
+    first = await ibkr.get_ticker_for_contract(contract, snapshot=True)
+    second = await ibkr.get_ticker_for_contract(contract, snapshot=True)
+
+    assert first is second
+    mock_ib.reqTickersAsync.assert_awaited_once()
+    assert (ibkr.ticker_cache.hits, ibkr.ticker_cache.misses) == (1, 1)
+
+
+async def test_ticker_cache_expires_per_contract_kind(mocker):
+    now = mocker.patch("thetagang.ibkr.time.monotonic", return_value=100.0)
+    cache = TickerCache(underlying_ttl=5.0, option_ttl=2.0)
+    stock = Stock("TEST", "SMART", "USD")
+    stock.conId = 1
+    option = Option("TEST", "20250117", 100.0, "P", "SMART")
+    option.conId = 2
+    fields = [TickerField.MARKET_PRICE]
+    cache.put(quoted_ticker(stock), fields)
+    cache.put(quoted_ticker(option), fields)
+
+    now.return_value = 103.0
+    assert cache.get(stock, fields, []) is not None
+    assert cache.get(option, fields, []) is None
+
+    now.return_value = 106.0
+    assert cache.get(stock, fields, []) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+async def test_ticker_cache_requires_fields_to_be_present():
+    cache = TickerCache(underlying_ttl=5.0, option_ttl=2.0)
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    cache.put(quoted_ticker(contract), [TickerField.MARKET_PRICE])
+
+    # Greeks were never fetched, so they can't come from the cache
+    assert cache.get(contract, [TickerField.GREEKS], []) is None
+    assert cache.get(contract, [], [TickerField.GREEKS]) is None
+    assert cache.get(contract, [TickerField.MIDPOINT], []) is not None
+
+
+async def test_ticker_cache_zero_ttl_disables_caching():
+    cache = TickerCache(underlying_ttl=0, option_ttl=0)
+    contract = Stock("TEST", "SMART", "USD")
+    contract.conId = 1
+    cache.put(quoted_ticker(contract), [TickerField.MARKET_PRICE])
+
+    assert cache.get(contract, [TickerField.MARKET_PRICE], []) is None
+
+
+async def test_request_historical_data_shares_in_flight_requests(ibkr, mock_ib, mocker):
+    release = asyncio.Event()
+    bars = [SimpleNamespace(close=1.0)]
+
+    async def fake_request(*_args):
+        await release.wait()
+        return bars
+
+    mock_ib.reqHistoricalDataAsync = mocker.Mock(side_effect=fake_request)
+    contract = Stock("TEST", "SMART", "USD")
+
+    first = asyncio.ensure_future(ibkr.request_historical_data(contract, "30 D"))
+    second = asyncio.ensure_future(ibkr.request_historical_data(contract, "30 D"))
+    other = asyncio.ensure_future(ibkr.request_historical_data(contract, "60 D"))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await first is bars
+    assert await second is bars
+    assert await other is bars
+    assert mock_ib.reqHistoricalDataAsync.call_count == 2
+
+    # Finished requests aren't reused
+    await ibkr.request_historical_data(contract, "30 D")
+    assert mock_ib.reqHistoricalDataAsync.call_count == 3
+
+
+def daily_bars(start, days, close=1.0):
+    return [
+        BarData(date=start + timedelta(days=offset), close=close + offset)
+        for offset in range(days)
+    ]
+
+
+async def test_request_historical_data_fetches_only_missing_tail(
+    mock_ib, mocker, tmp_path
+):
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+    today = date.today()
+    data_store.record_historical_bars(
+        "TEST", "1 day", daily_bars(today - timedelta(days=40), 38)
+    )
+    fresh = daily_bars(today - timedelta(days=3), 4, close=100.0)
+    mock_ib.reqHistoricalDataAsync = mocker.AsyncMock(return_value=fresh)
+    ibkr = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+
+    bars = await ibkr.request_historical_data(Stock("TEST", "SMART", "USD"), "30 D")
+
+    assert mock_ib.reqHistoricalDataAsync.call_args.args[2] == "4 D"
+    assert [bar.date for bar in bars] == [
+        today - timedelta(days=offset) for offset in range(30, -1, -1)
+    ]
+    # Fresh bars replace the possibly partial stored ones
+    assert bars[-4:] == fresh
+    assert bars[0].close == 11.0
+
+
+async def test_request_historical_data_refetches_window_with_gaps(
+    mock_ib, mocker, tmp_path
+):
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+    today = date.today()
+    # Only the last 10 days were stored by an earlier, shorter request
+    data_store.record_historical_bars(
+        "TEST", "1 day", daily_bars(today - timedelta(days=10), 10)
+    )
+    fresh = daily_bars(today - timedelta(days=60), 61)
+    mock_ib.reqHistoricalDataAsync = mocker.AsyncMock(return_value=fresh)
+    ibkr = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+
+    bars = await ibkr.request_historical_data(Stock("TEST", "SMART", "USD"), "60 D")
+
+    assert mock_ib.reqHistoricalDataAsync.call_args.args[2] == "60 D"
+    assert bars is fresh
+
+
+async def test_bar_dates_are_read_as_dates(ibkr):
+    day = date(2024, 1, 2)
+
+    assert ibkr.__bar_date__(day) == day
+    assert ibkr.__bar_date__(datetime(2024, 1, 2, 16, 0)) == day
+    assert ibkr.__bar_date__("20240102") == day
+
+
+async def test_request_pacer_waits_once_bucket_is_empty():
+    pacer = RequestPacer(capacity=2, period=0.2)
+    loop = asyncio.get_running_loop()
+
+    start = loop.time()
+    await pacer.acquire()
+    await pacer.acquire()
+    assert loop.time() - start < 0.05
+
+    await pacer.acquire()
+    assert loop.time() - start >= 0.09
+
+
+async def test_request_pacer_never_exceeds_capacity_in_a_period():
+    now = 0.0
+
+    def clock():
+        return now
+
+    async def sleep(seconds):
+        nonlocal now
+        now += seconds
+
+    capacity, period = 60, 600.0
+    pacer = RequestPacer(capacity, period, clock=clock, sleep=sleep)
+    rng = random.Random(1)
+    arrived = []
+    sent = []
+    for _ in range(500):
+        # Bursts of back to back requests, with the odd pause between them
+        now += rng.choice([0.0, 0.0, 0.0, rng.uniform(0, 30)])
+        arrived.append(now)
+        await pacer.acquire()
+        sent.append(now)
+
+    for first, last in zip(sent, sent[capacity:]):
+        assert last - first >= period - 1e-9
+    # No request waits longer than it has to
+    assert sent[:capacity] == arrived[:capacity]
+    for i in range(capacity, len(sent)):
+        assert sent[i] == pytest.approx(max(arrived[i], sent[i - capacity] + period))
+
+
+async def test_qualify_contracts_reuses_earlier_qualifications(ibkr, mock_ib, mocker):
+    async def qualify(*contracts):
+        qualified = []
+        for contract in contracts:
+            if contract.symbol == "SPX":
+                qualified.append(None)
+                continue
+            contract.conId = 101
+            contract.primaryExchange = "NASDAQ"
+            qualified.append(contract)
+        return qualified
+
+    mock_ib.qualifyContractsAsync = mocker.Mock(side_effect=qualify)
+
+    first = await ibkr.qualify_contracts(
+        Stock("AAA", "SMART", "USD"), Stock("SPX", "SMART", "USD")
+    )
+    second = await ibkr.qualify_contracts(
+        Stock("SPX", "SMART", "USD"), Stock("AAA", "SMART", "USD")
+    )
+
+    assert mock_ib.qualifyContractsAsync.call_count == 1
+    assert [c.conId for c in first] == [101]
+    assert [c.conId for c in second] == [101]
+    assert second[0].primaryExchange == "NASDAQ"
+
+    # The miss may have been a timeout, so the next run tries it again
+    ibkr.forget_unqualified_contracts()
+    await ibkr.qualify_contracts(Stock("SPX", "SMART", "USD"))
+
+    assert mock_ib.qualifyContractsAsync.call_count == 2
+
+
+async def test_qualify_contracts_does_not_persist_misses(mock_ib, mocker, tmp_path):
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+    mock_ib.qualifyContractsAsync = mocker.AsyncMock(return_value=[None])
+    cold = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    assert await cold.qualify_contracts(Stock("SPY", "SMART", "USD")) == []
+
+    def qualify(contract):
+        contract.conId = 756733
+        return [contract]
+
+    mock_ib.qualifyContractsAsync = mocker.AsyncMock(side_effect=qualify)
+    mock_ib.orderStatusEvent = mocker.MagicMock()
+    warm = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    (stock,) = await warm.qualify_contracts(Stock("SPY", "SMART", "USD"))
+
+    assert stock.conId == 756733
+
+
+async def test_qualify_contracts_persists_in_data_store(mock_ib, mocker, tmp_path):
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+
+    async def qualify(*contracts):
+        for contract in contracts:
+            contract.conId = 202
+        return list(contracts)
+
+    mock_ib.qualifyContractsAsync = mocker.Mock(side_effect=qualify)
+    option = Option("AAA", "29991231", 100.0, "P", "SMART")
+    expired_option = Option("AAA", "20000121", 100.0, "P", "SMART")
+
+    cold = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    await cold.qualify_contracts(option, expired_option)
+    mock_ib.orderStatusEvent = mocker.MagicMock()
+    warm = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    result = await warm.qualify_contracts(
+        Option("AAA", "29991231", 100.0, "P", "SMART"),
+        Option("AAA", "20000121", 100.0, "P", "SMART"),
+    )
+
+    assert [c.conId for c in result] == [202, 202]
+    # Only the expired option had to be qualified again
+    assert mock_ib.qualifyContractsAsync.call_count == 2
+    (requalified,) = mock_ib.qualifyContractsAsync.call_args.args
+    assert requalified.lastTradeDateOrContractMonth == "20000121"
+
+
+async def test_qualify_contracts_requalifies_old_stocks(mock_ib, mocker, tmp_path):
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+    con_ids = iter([303, 404])
+
+    async def qualify(*contracts):
+        for contract in contracts:
+            contract.conId = next(con_ids)
+        return list(contracts)
+
+    mock_ib.qualifyContractsAsync = mocker.Mock(side_effect=qualify)
+    cold = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    (first,) = await cold.qualify_contracts(Stock("AAA", "SMART", "USD"))
+
+    # A few days later, say after a merger, the stored conId is stale
+    later = utcnow() + NON_EXPIRING_CONTRACT_TTL + timedelta(hours=1)
+    mocker.patch("thetagang.ibkr.utcnow", return_value=later)
+    mocker.patch("thetagang.db.utcnow", return_value=later)
+    mock_ib.orderStatusEvent = mocker.MagicMock()
+    warm = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    (second,) = await warm.qualify_contracts(Stock("AAA", "SMART", "USD"))
+
+    assert (first.conId, second.conId) == (303, 404)
+    assert mock_ib.qualifyContractsAsync.call_count == 2
+
+
+async def test_contract_expires_at():
+    now = datetime(2025, 1, 2, 15, 30)
+    assert contract_expires_at(Stock("AAA", "SMART", "USD"), now) == (
+        now + NON_EXPIRING_CONTRACT_TTL
+    )
+    assert contract_expires_at(
+        Option("AAA", "20250117", 100.0, "P", "SMART")
+    ) == datetime(2025, 1, 18)
+    assert contract_expires_at(Contract(lastTradeDateOrContractMonth="202503")) == (
+        datetime(2025, 4, 1)
+    )
+
+
+async def test_get_chains_for_contract_cached_until_next_session(
+    mock_ib, mocker, tmp_path
+):
+    data_store = DataStore(
+        f"sqlite:///{tmp_path / 'state.db'}",
+        str(tmp_path / "thetagang.toml"),
+        dry_run=False,
+    )
+    chain = OptionChain("SMART", 1, "AAA", "100", ["20250117"], [95.0, 100.0])
+    mock_ib.reqSecDefOptParamsAsync = mocker.AsyncMock(return_value=[chain])
+    next_open = mocker.patch(
+        "thetagang.ibkr.next_session_open", return_value=datetime(2999, 1, 1)
+    )
+    underlying = Stock("AAA", "SMART", "USD")
+    underlying.conId = 1
+
+    ibkr = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    assert await ibkr.get_chains_for_contract(underlying) == [chain]
+    assert await ibkr.get_chains_for_contract(underlying) == [chain]
+    mock_ib.orderStatusEvent = mocker.MagicMock()
+    warm = IBKR(mock_ib, 1, "SMART", data_store=data_store)
+    assert await warm.get_chains_for_contract(underlying) == [chain]
+
+    mock_ib.reqSecDefOptParamsAsync.assert_awaited_once()
+    assert next_open.call_args.args[0] == "XNYS"
+
+
+async def test_get_chains_for_contract_refetches_after_expiry(ibkr, mock_ib, mocker):
+    chain = OptionChain("SMART", 1, "AAA", "100", ["20250117"], [100.0])
+    mock_ib.reqSecDefOptParamsAsync = mocker.AsyncMock(
+        side_effect=[[], [chain], [chain]]
+    )
+    mocker.patch("thetagang.ibkr.next_session_open", return_value=datetime(2000, 1, 1))
+    underlying = Stock("AAA", "SMART", "USD")
+    underlying.conId = 1
+
+    # Empty responses aren't cached
+    assert await ibkr.get_chains_for_contract(underlying) == []
+    assert await ibkr.get_chains_for_contract(underlying) == [chain]
+    # The chain "expired" at the (patched) next session open
+    assert await ibkr.get_chains_for_contract(underlying) == [chain]
+    assert mock_ib.reqSecDefOptParamsAsync.await_count == 3
+
+
+async def test_get_open_interest_cached_for_the_day(ibkr, mocker):
+    put = Option("AAA", "29991231", 100.0, "P", "SMART", conId=1)
+    call = Option("AAA", "29991231", 100.0, "C", "SMART", conId=2)
+    quiet = Option("AAA", "29991231", 90.0, "P", "SMART", conId=3)
+
+    def with_open_interest(contract, value):
+        ticker = Ticker(contract=contract)
+        if contract.right == "P":
+            ticker.putOpenInterest = value
+        else:
+            ticker.callOpenInterest = value
+        return ticker
+
+    ibkr.get_tickers_for_contracts = mocker.AsyncMock(
+        return_value=[
+            with_open_interest(put, 150.0),
+            with_open_interest(call, 75.0),
+            Ticker(contract=quiet),
+        ]
+    )
+
+    first = await ibkr.get_open_interest("AAA", [put, call, quiet])
+    second = await ibkr.get_open_interest("AAA", [put, call])
+
+    assert first == {1: 150.0, 2: 75.0}
+    assert second == first
+    ibkr.get_tickers_for_contracts.assert_awaited_once()
+    assert ibkr.get_tickers_for_contracts.call_args.kwargs["generic_tick_list"] == "101"
+    # Nothing was reported for the quiet contract, and asking again would
+    # only wait out the timeout again
+    assert await ibkr.get_open_interest("AAA", [quiet]) == {}
+    ibkr.get_tickers_for_contracts.assert_awaited_once()
+
+    # A run that started yesterday keeps to yesterday's values, but a run
+    # started today loads them again
+    yesterday = date.today() - timedelta(days=1)
+    await ibkr.get_open_interest("AAA", [put], today=yesterday)
+    assert ibkr.get_tickers_for_contracts.await_count == 2
+    assert await ibkr.get_open_interest("AAA", [put], today=yesterday) == {1: 150.0}
+    assert ibkr.get_tickers_for_contracts.await_count == 2
+    await ibkr.get_open_interest("AAA", [put])
+    assert ibkr.get_tickers_for_contracts.await_count == 3
+
+    # Until the next run
+    ibkr.forget_missing_open_interest()
+    await ibkr.get_open_interest("AAA", [quiet])
+    assert ibkr.get_tickers_for_contracts.await_count == 4
+
+
+async def test_market_data_scheduler_waits_for_free_line():
+    scheduler = MarketDataScheduler(max_lines=1)
+    await scheduler.acquire(MarketDataPriority.OPTION_CHAIN)
+
+    waiter = asyncio.ensure_future(scheduler.acquire(MarketDataPriority.OPTION_CHAIN))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    assert scheduler.queued() == 1
+
+    scheduler.release()
+    await waiter
+    assert scheduler.lines_in_use == 1
+    scheduler.release()
+    assert scheduler.lines_in_use == 0
+
+
+async def test_market_data_scheduler_serves_higher_priority_first():
+    scheduler = MarketDataScheduler(max_lines=1)
+    await scheduler.acquire(MarketDataPriority.UNDERLYING)
+    served = []
+
+    async def request(priority, name):
+        await scheduler.acquire(priority)
+        served.append(name)
+
+    tasks = [
+        asyncio.ensure_future(request(MarketDataPriority.REPRICE, "reprice")),
+        asyncio.ensure_future(request(MarketDataPriority.OPTION_CHAIN, "chain-1")),
+        asyncio.ensure_future(request(MarketDataPriority.UNDERLYING, "underlying")),
+        asyncio.ensure_future(request(MarketDataPriority.OPTION_CHAIN, "chain-2")),
+    ]
+    await asyncio.sleep(0)
+    for _ in tasks:
+        scheduler.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    assert served == ["underlying", "chain-1", "chain-2", "reprice"]
+
+
+async def test_market_data_scheduler_skips_cancelled_waiters():
+    scheduler = MarketDataScheduler(max_lines=1)
+    await scheduler.acquire(MarketDataPriority.OPTION_CHAIN)
+
+    cancelled = asyncio.ensure_future(scheduler.acquire(MarketDataPriority.UNDERLYING))
+    waiting = asyncio.ensure_future(scheduler.acquire(MarketDataPriority.REPRICE))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+
+    scheduler.release()
+    await waiting
+    assert scheduler.lines_in_use == 1
+
+
 async def test_wait_for_submitting_orders_success(ibkr, mock_trade, mocker):
     """Test wait_for_submitting_orders when all waits succeed."""
     mocker.patch.object(
@@ -0,0 +1,61 @@
+import math
+from datetime import date
+
+from thetagang.options import (
+    contract_date_to_datetime,
+    option_dte,
+    option_dtes,
+    sample_strikes,
+    strikes_bracketing_delta,
+)
+
+
+def test_option_dte_counts_from_given_day():
+    today = date(2024, 12, 30)
+
+    assert option_dte("20250117", today) == 18
+    assert option_dte("202501", today) == 2
+    # A run that started yesterday keeps yesterday's DTEs
+    assert option_dte("20250117", date(2024, 12, 31)) == 17
+
+
+def test_option_dtes_matches_option_dte():
+    today = date(2024, 12, 30)
+    expirations = ["20250117", "20241230", "20241220", "202503", "20250117"]
+
+    dtes = option_dtes(expirations, today)
+
+    assert dtes.tolist() == [option_dte(exp, today) for exp in expirations]
+    assert option_dtes([], today).tolist() == []
+
+
+def test_expirations_are_parsed_once():
+    contract_date_to_datetime.cache_clear()
+
+    for _ in range(3):
+        option_dte("20250321", date(2025, 3, 1))
+
+    assert contract_date_to_datetime.cache_info().misses == 1
+
+
+def test_sample_strikes_spreads_across_chain():
+    strikes = [float(strike) for strike in range(10)]
+
+    assert sample_strikes(strikes, 4) == [0.0, 3.0, 6.0, 9.0]
+    assert sample_strikes(strikes, 20) == strikes
+    assert sample_strikes(strikes, 1) == [5.0]
+
+
+def test_strikes_bracketing_delta_finds_crossing():
+    # Put deltas rise with the strike
+    samples = [(80.0, 0.05), (90.0, 0.15), (100.0, 0.5), (110.0, 0.9)]
+
+    assert strikes_bracketing_delta(samples, 0.3) == (90.0, 100.0)
+    assert strikes_bracketing_delta(samples, 0.15) == (80.0, 90.0)
+
+
+def test_strikes_bracketing_delta_runs_off_chain_end():
+    samples = [(80.0, 0.05), (90.0, 0.1), (100.0, 0.2)]
+
+    assert strikes_bracketing_delta(samples, 0.3) == (90.0, math.inf)
+    assert strikes_bracketing_delta([(100.0, 0.2)], 0.3) == (-math.inf, math.inf)
@@ -0,0 +1,139 @@
+import random
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from ib_async import PortfolioItem
+from ib_async.contract import Stock
+
+from tests.test_util import con
+from thetagang.options import option_dte
+from thetagang.portfolio import PortfolioIndex, PositionRecord
+from thetagang.util import (
+    calculate_net_short_positions,
+    count_long_option_positions,
+    count_short_option_positions,
+    get_short_positions,
+    weighted_avg_long_strike,
+    weighted_avg_short_strike,
+)
+
+
+def stock(symbol: str, position: float, average_cost: float) -> PortfolioItem:
+    return PortfolioItem(
+        contract=Stock(symbol, "SMART", "USD"),
+        position=position,
+        marketPrice=average_cost,
+        marketValue=position * average_cost,
+        averageCost=average_cost,
+        unrealizedPNL=0.0,
+        realizedPNL=0.0,
+        account="DU2962946",
+    )
+
+
+def test_portfolio_index_matches_util_helpers() -> None:
+    rng = random.Random(3)
+    expirations = [
+        (date.today() + timedelta(days=days)).strftime("%Y%m%d") for days in (3, 30, 90)
+    ]
+    portfolio_positions = {
+        "SPY": [stock("SPY", 300, 410.5)]
+        + [
+            con(
+                rng.choice(expirations),
+                rng.choice([340, 345, 350, 355, 360]),
+                rng.choice(["P", "C"]),
+                rng.choice([-3, -2, -1, 1, 2, 3]),
+            )
+            for _ in range(40)
+        ],
+        "QQQ": [stock("QQQ", 50, 300.0)],
+    }
+
+    index = PortfolioIndex(portfolio_positions)
+
+    for symbol, positions in portfolio_positions.items():
+        for right in ("P", "C"):
+            indexed = index[symbol]
+            assert indexed.short_count(right) == count_short_option_positions(
+                positions, right
+            )
+            assert indexed.long_count(right) == count_long_option_positions(
+                positions, right
+            )
+            assert indexed.avg_short_strike(right) == weighted_avg_short_strike(
+                positions, right
+            )
+            assert indexed.avg_long_strike(right) == weighted_avg_long_strike(
+                positions, right
+            )
+            assert indexed.net_short_count(right) == calculate_net_short_positions(
+                positions, right
+            )
+    assert index["SPY"].stock_quantity == 300
+    assert index["SPY"].stock_average_costs == [410.5]
+    assert index.stocks() == {
+        "SPY": portfolio_positions["SPY"][0],
+        "QQQ": portfolio_positions["QQQ"][0],
+    }
+    assert index.short_options("P") == get_short_positions(
+        portfolio_positions["SPY"], "P"
+    )
+
+
+def test_portfolio_index_reads_missing_symbols_as_empty() -> None:
+    index = PortfolioIndex({})
+
+    assert "TSLA" not in index
+    assert index["TSLA"].stock is None
+    assert index["TSLA"].stock_quantity == 0
+    assert index["TSLA"].short_count("P") == 0
+    assert index["TSLA"].net_short_count("C") == 0
+    assert index["TSLA"].avg_short_strike("P") is None
+
+
+def test_portfolio_index_matches_full_right_names() -> None:
+    index = PortfolioIndex({"SPY": [con("20990101", 100, "PUT", -2)]})
+
+    assert index["SPY"].short_count("P") == 2
+    assert index["SPY"].short_count("C") == 0
+
+
+def test_position_record_copies_portfolio_item() -> None:
+    today = date(2024, 1, 2)
+    record = PositionRecord.from_portfolio_item(con("20240119", 352.5, "P", -2))
+
+    assert (record.con_id, record.symbol, record.sec_type) == (458705534, "SPY", "OPT")
+    assert (record.right, record.strike, record.expiry) == ("P", 352.5, "20240119")
+    assert (record.quantity, record.avg_cost, record.multiplier) == (
+        -2,
+        528.9025,
+        "100",
+    )
+    assert record.dte(today) == option_dte("20240119", today) == 17
+    assert record.lot(today) == (17, 352.5, -2.0)
+    with pytest.raises(AttributeError):
+        record.note = "no __dict__"  # type: ignore[attr-defined]
+
+
+def test_position_record_tolerates_partial_items() -> None:
+    record = PositionRecord.from_portfolio_item(
+        SimpleNamespace(contract=SimpleNamespace(symbol="AAPL", conId=1), position=5)
+    )
+
+    assert (record.symbol, record.con_id, record.quantity) == ("AAPL", 1, 5)
+    assert record.avg_cost is None
+    assert record.expiry_ordinal is None
+    assert (
+        PositionRecord.from_portfolio_item(stock("SPY", 10, 1.0)).expiry_ordinal is None
+    )
+
+
+def test_portfolio_index_records_follow_positions() -> None:
+    positions = [stock("SPY", 300, 410.5), con("20990101", 100, "P", -2)]
+    index = PortfolioIndex({"SPY": positions})
+
+    records = index.records()["SPY"]
+    assert [r.quantity for r in records] == [300, -2]
+    assert [r.sec_type for r in records] == ["STK", "OPT"]
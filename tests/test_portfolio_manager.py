@@ -1,10 +1,20 @@
+import asyncio
+import inspect
+import math
+from datetime import date, datetime, timedelta
 from types import SimpleNamespace
 
 import pytest
-from ib_async import IB, Stock, Ticker
+from ib_async import IB, Option, OptionChain, OptionComputation, Stock, Ticker
 
+from thetagang.greeks import (
+    annualized_volatility,
+    black_scholes_delta,
+    black_scholes_price,
+)
 from thetagang.ibkr import IBKRRequestTimeout
-from thetagang.portfolio_manager import PortfolioManager
+from thetagang.options import option_dte
+from thetagang.portfolio_manager import NoValidContractsError, PortfolioManager
 
 
 @pytest.fixture
@@ -24,6 +34,9 @@ def mock_config(mocker):
     config.account.number = "TEST123"
     config.ib_async = mocker.Mock()
     config.ib_async.api_response_wait_time = 1
+    config.ib_async.max_market_data_lines = 90
+    config.ib_async.underlying_ticker_ttl = 5.0
+    config.ib_async.option_ticker_ttl = 2.0
     config.orders = mocker.Mock()
     config.orders.exchange = "SMART"
     config.cash_management = mocker.Mock()
@@ -38,6 +51,90 @@ def portfolio_manager(mock_ib, mock_config, mocker):
     return PortfolioManager(mock_config, mock_ib, completion_future, dry_run=False)
 
 
+@pytest.fixture
+def chain_scan(portfolio_manager, mocker):
+    """Fixture to fake a put chain priced with Black-Scholes around a $100
+    underlying, recording the contracts each market data request asked for."""
+    config = portfolio_manager.config
+    config.get_target_dte.return_value = 30
+    config.get_target_delta.return_value = 0.3
+    config.get_max_dte_for.return_value = None
+    config.option_chains.expirations = 2
+    config.option_chains.strikes = 15
+    config.option_chains.delta_prefilter = False
+    config.option_chains.risk_free_rate = 0.04
+    config.option_chains.two_phase_scan = False
+    config.option_chains.streaming_scan = False
+    config.option_chains.scan_cache_ttl = 120.0
+    config.constants.daily_stddev_window = "30 D"
+    config.target.minimum_open_interest = 0
+
+    underlying = Stock("TEST", "SMART", "USD")
+    underlying_ticker = Ticker(contract=underlying)
+    underlying_ticker.bid, underlying_ticker.bidSize = 99.9, 1
+    underlying_ticker.ask, underlying_ticker.askSize = 100.1, 1
+    expirations = [
+        (date.today() + timedelta(days=days)).strftime("%Y%m%d")
+        for days in (35, 42, 49)
+    ]
+    strikes = [float(strike) for strike in range(50, 151)]
+    closes = [101.5 if day % 2 else 100.0 for day in range(21)]
+    volatility = annualized_volatility(closes)
+    requested = []
+
+    def option_ticker(contract):
+        years = option_dte(contract.lastTradeDateOrContractMonth) / 365.0
+        price = float(
+            black_scholes_price(100.0, contract.strike, years, 0.04, volatility, "P")
+        )
+        ticker = Ticker(contract=contract)
+        ticker.bid, ticker.bidSize = price - 0.01, 1
+        ticker.ask, ticker.askSize = price + 0.01, 1
+        ticker.modelGreeks = OptionComputation(
+            tickAttrib=0,
+            impliedVol=volatility,
+            delta=float(
+                black_scholes_delta(
+                    100.0, contract.strike, years, 0.04, volatility, "P"
+                )
+            ),
+            optPrice=price,
+            pvDividend=0.0,
+            gamma=0.0,
+            vega=0.0,
+            theta=0.0,
+            undPrice=100.0,
+        )
+        return ticker
+
+    async def get_tickers(_symbol, contracts, **_kwargs):
+        requested.append(list(contracts))
+        return [option_ticker(contract) for contract in contracts]
+
+    async def get_ticker(contract, **_kwargs):
+        if isinstance(contract, Option):
+            return option_ticker(contract)
+        return underlying_ticker
+
+    ibkr = portfolio_manager.ibkr
+    ibkr.get_ticker_for_contract = mocker.AsyncMock(side_effect=get_ticker)
+    ibkr.get_chains_for_contract = mocker.AsyncMock(
+        return_value=[OptionChain("SMART", 1, "TEST", "100", expirations, strikes)]
+    )
+    ibkr.request_historical_data = mocker.AsyncMock(
+        return_value=[SimpleNamespace(close=close) for close in closes]
+    )
+    ibkr.qualify_contracts = mocker.AsyncMock(side_effect=lambda *c: list(c))
+    ibkr.get_tickers_for_contracts = mocker.AsyncMock(side_effect=get_tickers)
+    return SimpleNamespace(
+        underlying=underlying,
+        underlying_ticker=underlying_ticker,
+        volatility=volatility,
+        expirations=expirations,
+        requested=requested,
+    )
+
+
 class TestPortfolioManager:
     """Test cases for PortfolioManager class."""
 
@@ -834,3 +931,628 @@ class TestPortfolioManager:
         # Even though 6 shares meets min shares (1), $900 < $2000 min amount
         # Should not buy due to amount threshold
         assert len(to_buy) == 0
+
+    def test_reset_run_state_clears_previous_run(self, portfolio_manager, mocker):
+        """Test reset_run_state drops orders and targets left by a previous run."""
+        previous_orders = portfolio_manager.orders
+        previous_trades = portfolio_manager.trades
+        previous_orders.add_order(mocker.Mock(), mocker.Mock(), None)
+        portfolio_manager.target_quantities["AAPL"] = 100
+        portfolio_manager.has_excess_calls.add("AAPL")
+        portfolio_manager.has_excess_puts.add("AAPL")
+        ibkr = portfolio_manager.ibkr
+
+        portfolio_manager.reset_run_state()
+
+        assert portfolio_manager.orders is not previous_orders
+        assert portfolio_manager.orders.records() == []
+        assert portfolio_manager.trades is not previous_trades
+        assert portfolio_manager.target_quantities == {}
+        assert portfolio_manager.has_excess_calls == set()
+        assert portfolio_manager.has_excess_puts == set()
+        # The IBKR wrapper (and any caches it holds) is kept across runs
+        assert portfolio_manager.ibkr is ibkr
+
+    @pytest.mark.asyncio
+    async def test_find_eligible_contracts_prefilters_by_estimated_delta(
+        self, portfolio_manager, chain_scan
+    ):
+        """Test only strikes near the target delta are subscribed to."""
+        portfolio_manager.config.option_chains.delta_prefilter = True
+        portfolio_manager.config.option_chains.delta_prefilter_strikes = 3
+
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+
+        (requested,) = chain_scan.requested
+        # Without the pre-filter, the 15 strikes nearest the money would be
+        # requested for each expiration
+        assert len(requested) == 2 * 3
+        assert [
+            contract.strike
+            for contract in requested
+            if contract.lastTradeDateOrContractMonth == chain_scan.expirations[0]
+        ] == [96.0, 97.0, 98.0]
+        assert chosen.contract.lastTradeDateOrContractMonth == chain_scan.expirations[0]
+        assert chosen.contract.strike == 96.0
+
+    @pytest.mark.asyncio
+    async def test_delta_prefilter_prefers_implied_volatility(
+        self, portfolio_manager, chain_scan
+    ):
+        """Test the pre-filter prices the chain with the underlying's implied
+        volatility, only falling back to realized volatility without one."""
+        portfolio_manager.config.option_chains.delta_prefilter = True
+        portfolio_manager.config.option_chains.delta_prefilter_strikes = 3
+        chain_scan.underlying_ticker.impliedVolatility = chain_scan.volatility
+        ibkr = portfolio_manager.ibkr
+
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+
+        assert (
+            ibkr.get_ticker_for_contract.call_args_list[0].kwargs["generic_tick_list"]
+            == "106"
+        )
+        ibkr.request_historical_data.assert_not_awaited()
+        assert chosen.contract.strike == 96.0
+
+        ticker = Ticker(contract=chain_scan.underlying)
+        ticker.impliedVolatility = 0.45
+        assert (
+            await portfolio_manager.estimate_volatility(chain_scan.underlying, ticker)
+            == 0.45
+        )
+        ticker.impliedVolatility = math.nan
+        assert await portfolio_manager.estimate_volatility(
+            chain_scan.underlying, ticker
+        ) == pytest.approx(chain_scan.volatility)
+        ibkr.request_historical_data.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_find_eligible_contracts_two_phase_scan(
+        self, portfolio_manager, chain_scan
+    ):
+        """Test the second phase only scans strikes bracketing the target delta."""
+        portfolio_manager.config.option_chains.strikes = 40
+        portfolio_manager.config.option_chains.two_phase_scan = True
+        portfolio_manager.config.option_chains.two_phase_sample_strikes = 4
+
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+
+        sampled, bracketing = chain_scan.requested
+        assert sorted({contract.strike for contract in sampled}) == [
+            66.0,
+            79.0,
+            92.0,
+            105.0,
+        ]
+        assert [
+            contract.strike
+            for contract in bracketing
+            if contract.lastTradeDateOrContractMonth == chain_scan.expirations[0]
+        ] == [float(strike) for strike in range(93, 105)]
+        # 32 contracts instead of 2 x 40
+        assert len(sampled) + len(bracketing) == 32
+        assert chosen.contract.lastTradeDateOrContractMonth == chain_scan.expirations[0]
+        assert chosen.contract.strike == 96.0
+
+    @pytest.mark.asyncio
+    async def test_find_eligible_contracts_loads_open_interest_for_survivors(
+        self, portfolio_manager, chain_scan, mocker
+    ):
+        """Test open interest is only requested for contracts that pass the
+        price and delta filters."""
+        portfolio_manager.config.target.minimum_open_interest = 10
+
+        async def get_open_interest(_symbol, contracts, today=None):
+            return {contract.conId: 100.0 for contract in contracts}
+
+        ibkr = portfolio_manager.ibkr
+        ibkr.qualify_contracts = mocker.AsyncMock(
+            side_effect=lambda *contracts: [
+                Option(
+                    c.symbol,
+                    c.lastTradeDateOrContractMonth,
+                    c.strike,
+                    c.right,
+                    c.exchange,
+                    conId=idx + 1,
+                )
+                for idx, c in enumerate(contracts)
+            ]
+        )
+        ibkr.get_open_interest = mocker.AsyncMock(side_effect=get_open_interest)
+
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+
+        (scanned,) = chain_scan.requested
+        (_, with_open_interest), kwargs = ibkr.get_open_interest.call_args
+        assert kwargs["today"] == portfolio_manager.today
+        # Strikes above 96 are past the target delta
+        assert len(scanned) == 30
+        assert sorted({c.strike for c in with_open_interest}) == [
+            float(strike) for strike in range(91, 97)
+        ]
+        assert chosen.contract.strike == 96.0
+
+        # The 96 strikes are too thinly traded
+        ibkr.get_open_interest = mocker.AsyncMock(
+            side_effect=lambda _symbol, contracts, today=None: {
+                c.conId: 5.0 if c.strike == 96.0 else 100.0 for c in contracts
+            }
+        )
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+        assert chosen.contract.strike == 95.0
+
+    @pytest.mark.asyncio
+    async def test_find_eligible_contracts_reuses_earlier_scan(
+        self, portfolio_manager, chain_scan
+    ):
+        """Test a later scan of the same chain only loads contracts it lacks."""
+        first = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+        second = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying,
+            "P",
+            None,
+            minimum_price=lambda: 0.0,
+            exclude_exp_strike=(96.0, chain_scan.expirations[0]),
+        )
+        # Rolling out further needs the next expiration too
+        await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying,
+            "P",
+            None,
+            minimum_price=lambda: 0.0,
+            exclude_expirations_before=chain_scan.expirations[1],
+        )
+
+        assert first.contract.strike == 96.0
+        # The excluded strike is filtered out of the cached scan
+        assert second is not first
+        assert second.contract.strike == 95.0
+        assert [len(requested) for requested in chain_scan.requested] == [30, 15]
+        assert {
+            contract.lastTradeDateOrContractMonth
+            for contract in chain_scan.requested[1]
+        } == {chain_scan.expirations[2]}
+
+        portfolio_manager.reset_run_state()
+        await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+        assert len(chain_scan.requested) == 3
+
+    @pytest.mark.asyncio
+    async def test_find_eligible_contracts_keeps_contracts_ibkr_renames(
+        self, portfolio_manager, chain_scan
+    ):
+        """Test scanned contracts stay under the expiry they were requested
+        with, even when qualifying them changes it."""
+        con_ids = iter(range(1, 1000))
+
+        async def qualify(*contracts):
+            for contract in contracts:
+                # e.g. the last trading day rather than the chain's expiration
+                expiry = datetime.strptime(
+                    contract.lastTradeDateOrContractMonth, "%Y%m%d"
+                ) - timedelta(days=1)
+                contract.lastTradeDateOrContractMonth = expiry.strftime("%Y%m%d")
+                contract.conId = next(con_ids)
+            return list(contracts)
+
+        portfolio_manager.ibkr.qualify_contracts.side_effect = qualify
+
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+
+        assert chosen is not None
+        scanned = {
+            key[2]
+            for key, (ticker, _) in portfolio_manager.scanned_chain_tickers.items()
+            if ticker is not None
+        }
+        assert scanned == set(chain_scan.expirations[:2])
+
+    @pytest.mark.asyncio
+    async def test_roll_reuses_write_scan_for_the_run(
+        self, portfolio_manager, chain_scan
+    ):
+        """Test a roll minutes after a write on the same symbol reuses its
+        scan by default, quoting only the chosen contract again."""
+        portfolio_manager.config.option_chains.scan_cache_ttl = None
+        cache = portfolio_manager.scanned_chain_tickers
+
+        written = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", 100.0, minimum_price=lambda: 0.0
+        )
+        for key, (ticker, scanned_at) in cache.items():
+            cache[key] = (ticker, scanned_at - 600)
+        rolled = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying,
+            "P",
+            100.0,
+            minimum_price=lambda: 0.0,
+            exclude_expirations_before=chain_scan.expirations[0],
+            exclude_exp_strike=(written.contract.strike, chain_scan.expirations[0]),
+        )
+
+        assert len(chain_scan.requested) == 1
+        requoted = [
+            call.args[0]
+            for call in portfolio_manager.ibkr.get_ticker_for_contract.call_args_list
+            if isinstance(call.args[0], Option)
+        ]
+        assert requoted == [rolled.contract]
+        assert rolled.contract.strike == 95.0
+        assert cache[("TEST", "P", chain_scan.expirations[0], 95.0)][0] is rolled
+
+    @pytest.mark.asyncio
+    async def test_scan_cache_ttl_limits_reuse(self, portfolio_manager, chain_scan):
+        """Test scanned quotes are only reused for scan_cache_ttl, if set."""
+        portfolio_manager.config.option_chains.scan_cache_ttl = 2.0
+        cache = portfolio_manager.scanned_chain_tickers
+
+        def age(seconds):
+            for key, (ticker, scanned_at) in cache.items():
+                cache[key] = (ticker, scanned_at - seconds)
+
+        for seconds in (0.0, 1.5, 3.0):
+            age(seconds)
+            await portfolio_manager.find_eligible_contracts(
+                chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+            )
+
+        # The first scan is reused 1.5s later, but not 3s later
+        assert len(chain_scan.requested) == 2
+
+    @pytest.mark.asyncio
+    async def test_find_eligible_contracts_streaming_scan_stops_early(
+        self, portfolio_manager, chain_scan, mocker
+    ):
+        """Test later expirations are cancelled once the nearest one settles."""
+        portfolio_manager.config.option_chains.streaming_scan = True
+        get_tickers = portfolio_manager.ibkr.get_tickers_for_contracts.side_effect
+        cancelled = []
+
+        async def slow_later_expirations(symbol, contracts, **kwargs):
+            if contracts[0].lastTradeDateOrContractMonth != chain_scan.expirations[0]:
+                try:
+                    await asyncio.Event().wait()
+                except asyncio.CancelledError:
+                    cancelled.append(contracts[0].lastTradeDateOrContractMonth)
+                    raise
+            return await get_tickers(symbol, contracts, **kwargs)
+
+        portfolio_manager.ibkr.get_tickers_for_contracts = mocker.AsyncMock(
+            side_effect=slow_later_expirations
+        )
+
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying, "P", None, minimum_price=lambda: 0.0
+        )
+
+        assert chosen.contract.lastTradeDateOrContractMonth == chain_scan.expirations[0]
+        assert chosen.contract.strike == 96.0
+        assert cancelled == [chain_scan.expirations[1]]
+
+    @pytest.mark.asyncio
+    async def test_find_eligible_contracts_streaming_scan_waits_when_unsettled(
+        self, portfolio_manager, chain_scan
+    ):
+        """Test every expiration is used when the nearest can't settle the pick."""
+        portfolio_manager.config.option_chains.streaming_scan = True
+
+        chosen = await portfolio_manager.find_eligible_contracts(
+            chain_scan.underlying,
+            "P",
+            None,
+            minimum_price=lambda: 0.0,
+            fallback_minimum_price=lambda: 100.0,
+        )
+
+        # No contract beats the fallback price, so the priciest one is picked,
+        # which could have been in any expiration
+        assert len(chain_scan.requested) == 2
+        assert chosen.contract.lastTradeDateOrContractMonth == chain_scan.expirations[1]
+
+    @pytest.mark.asyncio
+    async def test_write_puts_scans_concurrently_and_enqueues_in_order(
+        self, portfolio_manager, mocker
+    ):
+        """Test chain scans overlap up to the cap but orders keep their order."""
+        option_chains = portfolio_manager.config.option_chains
+        option_chains.expirations = 2
+        option_chains.strikes = 10
+        option_chains.delta_prefilter = False
+        option_chains.max_concurrent_scans = 2
+        portfolio_manager.config.orders.minimum_credit = 0.0
+        portfolio_manager.config.orders.algo.strategy = "Adaptive"
+        portfolio_manager.config.orders.algo.params = []
+        in_flight = 0
+        max_in_flight = 0
+
+        async def find_eligible_contracts(underlying, *_args, **_kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Later symbols finish first
+            await asyncio.sleep(0.01 * (5 - len(underlying.symbol)))
+            in_flight -= 1
+            if underlying.symbol == "BBB":
+                raise NoValidContractsError("no contracts")
+            ticker = Ticker(contract=Stock(underlying.symbol, "SMART", "USD"))
+            ticker.bid, ticker.bidSize = 1.0, 1
+            ticker.ask, ticker.askSize = 1.2, 1
+            return ticker
+
+        portfolio_manager.find_eligible_contracts = find_eligible_contracts
+        portfolio_manager.enqueue_order = mocker.Mock()
+
+        await portfolio_manager.write_puts(
+            [
+                ("A", "NYSE", 1, None),
+                ("BBB", "NYSE", 2, None),
+                ("CC", "NYSE", 3, None),
+                ("DDDD", "NYSE", 4, None),
+            ]
+        )
+
+        assert max_in_flight == 2
+        enqueued = [
+            (call.args[0].symbol, call.args[1].totalQuantity)
+            for call in portfolio_manager.enqueue_order.call_args_list
+        ]
+        assert enqueued == [("A", 1), ("CC", 3), ("DDDD", 4)]
+
+    @pytest.mark.asyncio
+    async def test_roll_positions_skips_positions_that_raise(
+        self, portfolio_manager, mocker
+    ):
+        """Test an unexpected error rolling one position doesn't stop the
+        other rolls on the same or other underlyings."""
+        option_chains = portfolio_manager.config.option_chains
+        option_chains.expirations = 2
+        option_chains.strikes = 10
+        option_chains.delta_prefilter = False
+        option_chains.max_concurrent_scans = 4
+        positions = [
+            mocker.Mock(contract=Option(symbol, "20250101", strike, "P", "SMART"))
+            for symbol, strike in [("AAA", 10.0), ("AAA", 11.0), ("BBB", 20.0)]
+        ]
+
+        async def roll_position(position, *_args, **_kwargs):
+            if position.contract.strike == 10.0:
+                raise ValueError("contract won't qualify")
+            return ((position.contract, position.contract.strike), False)
+
+        portfolio_manager.ibkr.get_ticker_for_contract = mocker.AsyncMock()
+        portfolio_manager.get_primary_exchange = mocker.Mock(return_value="NASDAQ")
+        portfolio_manager._roll_position = roll_position
+        portfolio_manager.enqueue_order = mocker.Mock()
+
+        closeable = await portfolio_manager.roll_positions(positions, "P", {})
+
+        assert closeable == []
+        assert [
+            call.args[1] for call in portfolio_manager.enqueue_order.call_args_list
+        ] == [11.0, 20.0]
+
+    @pytest.mark.asyncio
+    async def test_write_puts_skips_symbols_whose_scan_raises(
+        self, portfolio_manager, mocker
+    ):
+        """Test an unexpected error scanning one symbol only drops its order."""
+        option_chains = portfolio_manager.config.option_chains
+        option_chains.expirations = 2
+        option_chains.strikes = 10
+        option_chains.delta_prefilter = False
+        option_chains.max_concurrent_scans = 2
+        portfolio_manager.config.orders.minimum_credit = 0.0
+        portfolio_manager.config.orders.algo.strategy = "Adaptive"
+        portfolio_manager.config.orders.algo.params = []
+
+        async def find_eligible_contracts(underlying, *_args, **_kwargs):
+            if underlying.symbol == "BBB":
+                raise ValueError("contract won't qualify")
+            ticker = Ticker(contract=Stock(underlying.symbol, "SMART", "USD"))
+            ticker.bid, ticker.bidSize = 1.0, 1
+            ticker.ask, ticker.askSize = 1.2, 1
+            return ticker
+
+        portfolio_manager.find_eligible_contracts = find_eligible_contracts
+        portfolio_manager.enqueue_order = mocker.Mock()
+
+        await portfolio_manager.write_puts(
+            [
+                ("AAA", "NYSE", 1, None),
+                ("BBB", "NYSE", 2, None),
+                ("CCC", "NYSE", 3, None),
+            ]
+        )
+
+        assert [
+            call.args[0].symbol
+            for call in portfolio_manager.enqueue_order.call_args_list
+        ] == ["AAA", "CCC"]
+
+    @pytest.mark.asyncio
+    async def test_run_chain_scans_cancels_the_rest_on_failure(self, portfolio_manager):
+        """Test a failing scan cancels the scans still running or queued."""
+        option_chains = portfolio_manager.config.option_chains
+        option_chains.expirations = 2
+        option_chains.strikes = 10
+        option_chains.delta_prefilter = False
+        option_chains.max_concurrent_scans = 1
+        cancelled = []
+
+        async def slow_scan(name):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+
+        async def failing_scan():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        queued = slow_scan("queued")
+        with pytest.raises(ValueError):
+            await portfolio_manager.run_chain_scans(
+                [failing_scan(), slow_scan("next"), queued]
+            )
+        await asyncio.sleep(0)
+
+        # The scan that took the failed one's slot is cancelled
+        assert cancelled == ["next"]
+        # The scan that never got a slot is closed rather than left unawaited
+        assert inspect.getcoroutinestate(queued) == inspect.CORO_CLOSED
+
+    def test_get_portfolio_index_is_reused_for_same_positions(self, portfolio_manager):
+        """Test the portfolio index is only rebuilt for different positions."""
+        portfolio_positions = {"AAPL": []}
+
+        index = portfolio_manager.get_portfolio_index(portfolio_positions)
+
+        assert portfolio_manager.get_portfolio_index(portfolio_positions) is index
+        assert portfolio_manager.get_portfolio_index({"AAPL": []}) is not index
+
+    def test_chain_scan_concurrency_respects_line_budget(self, portfolio_manager):
+        """Test the scan cap is limited by the market data line budget."""
+        option_chains = portfolio_manager.config.option_chains
+        option_chains.expirations = 4
+        option_chains.strikes = 15
+        option_chains.delta_prefilter = False
+        option_chains.max_concurrent_scans = 4
+
+        # 90 lines fill up with two 60-line scans
+        assert portfolio_manager.chain_scan_concurrency() == 2
+
+        option_chains.delta_prefilter = True
+        option_chains.delta_prefilter_strikes = 6
+        assert portfolio_manager.chain_scan_concurrency() == 4
+
+    @pytest.mark.asyncio
+    async def test_close_positions_quotes_concurrently(self, portfolio_manager, mocker):
+        """Test close quotes are fetched together, a failed quote only skips its
+        own position, and orders keep their order."""
+        portfolio_manager.get_order_exchange = mocker.Mock(return_value="SMART")
+        portfolio_manager.get_algo_strategy = mocker.Mock(return_value="Adaptive")
+        portfolio_manager.get_algo_params = mocker.Mock(return_value=[])
+        portfolio_manager.enqueue_order = mocker.Mock()
+        positions = [
+            mocker.Mock(
+                contract=Option(symbol, "20250101", 10.0, "P", "SMART"),
+                position=quantity,
+            )
+            for symbol, quantity in [("AAA", -1), ("BBB", -2), ("CCC", 3), ("DDD", 1)]
+        ]
+        in_flight = 0
+        max_in_flight = 0
+
+        async def get_ticker_for_contract(contract, **_kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Later positions are quoted first
+            await asyncio.sleep(0.01 * (ord("E") - ord(contract.symbol[0])))
+            in_flight -= 1
+            if contract.symbol == "BBB":
+                raise RuntimeError("no quote")
+            if contract.symbol == "DDD":
+                raise asyncio.TimeoutError()
+            ticker = Ticker(contract=contract)
+            ticker.bid, ticker.bidSize = 1.0, 1
+            ticker.ask, ticker.askSize = 1.2, 1
+            return ticker
+
+        mocker.patch.object(
+            portfolio_manager.ibkr,
+            "get_ticker_for_contract",
+            side_effect=get_ticker_for_contract,
+        )
+
+        await portfolio_manager.close_positions("P", positions)
+
+        assert max_in_flight == 4
+        enqueued = [
+            (call.args[0].symbol, call.args[1].action, call.args[1].totalQuantity)
+            for call in portfolio_manager.enqueue_order.call_args_list
+        ]
+        assert enqueued == [("AAA", "BUY", 1), ("CCC", "SELL", 3)]
+
+    @pytest.mark.asyncio
+    async def test_roll_positions_groups_by_underlying(self, portfolio_manager, mocker):
+        """Test rolls on one underlying run in turn on one underlying quote,
+        while underlyings overlap and orders are enqueued in position order."""
+        option_chains = portfolio_manager.config.option_chains
+        option_chains.expirations = 2
+        option_chains.strikes = 10
+        option_chains.delta_prefilter = False
+        option_chains.max_concurrent_scans = 4
+        positions = [
+            mocker.Mock(contract=Option(symbol, "20250101", strike, "P", "SMART"))
+            for symbol, strike in [
+                ("AAA", 10.0),
+                ("BBB", 20.0),
+                ("AAA", 11.0),
+                ("CCC", 30.0),
+                ("BBB", 21.0),
+            ]
+        ]
+        in_flight = {}
+        max_in_flight = 0
+        underlying_tickers = {}
+
+        async def get_ticker_for_contract(contract, **_kwargs):
+            return Ticker(contract=contract)
+
+        async def roll_position(position, *_args, underlying_ticker):
+            nonlocal max_in_flight
+            symbol = position.contract.symbol
+            assert underlying_ticker.contract.symbol == symbol
+            assert underlying_tickers.setdefault(symbol, underlying_ticker) is (
+                underlying_ticker
+            )
+            assert symbol not in in_flight
+            in_flight[symbol] = position
+            max_in_flight = max(max_in_flight, len(in_flight))
+            # Later positions finish first
+            await asyncio.sleep(0.01 * (40 - position.contract.strike) / 10)
+            del in_flight[symbol]
+            if position.contract.strike == 30.0:
+                return (None, True)
+            if position.contract.strike == 21.0:
+                return (None, False)
+            return ((position.contract, position.contract.strike), False)
+
+        mocker.patch.object(
+            portfolio_manager.ibkr,
+            "get_ticker_for_contract",
+            side_effect=get_ticker_for_contract,
+        )
+        portfolio_manager.get_primary_exchange = mocker.Mock(return_value="NASDAQ")
+        portfolio_manager._roll_position = roll_position
+        portfolio_manager.enqueue_order = mocker.Mock()
+
+        closeable = await portfolio_manager.roll_positions(positions, "P", {})
+
+        # One underlying quote per symbol
+        assert portfolio_manager.ibkr.get_ticker_for_contract.call_count == 3
+        assert max_in_flight == 3
+        assert closeable == [positions[3]]
+        assert [
+            call.args[1] for call in portfolio_manager.enqueue_order.call_args_list
+        ] == [10.0, 20.0, 11.0]
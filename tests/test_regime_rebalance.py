@@ -26,6 +26,9 @@ def portfolio_manager(mock_ib, mocker):
     config.account.margin_usage = 1.0
     config.ib_async = mocker.Mock()
     config.ib_async.api_response_wait_time = 1
+    config.ib_async.max_market_data_lines = 90
+    config.ib_async.underlying_ticker_ttl = 5.0
+    config.ib_async.option_ticker_ttl = 2.0
     config.orders = mocker.Mock()
     config.orders.exchange = "SMART"
     config.orders.algo = mocker.Mock()
@@ -71,6 +74,9 @@ def portfolio_manager_with_db(mock_ib, mocker, tmp_path):
     config.account.margin_usage = 1.0
     config.ib_async = mocker.Mock()
     config.ib_async.api_response_wait_time = 1
+    config.ib_async.max_market_data_lines = 90
+    config.ib_async.underlying_ticker_ttl = 5.0
+    config.ib_async.option_ticker_ttl = 2.0
     config.orders = mocker.Mock()
     config.orders.exchange = "SMART"
     config.orders.algo = mocker.Mock()
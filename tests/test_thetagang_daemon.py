@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import thetagang.thetagang as tg
+from thetagang.config import DaemonConfig, ExchangeHoursConfig
+
+
+class StopDaemon(Exception):
+    pass
+
+
+def make_config(interval: int = 60) -> SimpleNamespace:
+    return SimpleNamespace(
+        daemon=DaemonConfig(interval=interval),
+        exchange_hours=ExchangeHoursConfig(),
+    )
+
+
+def run_until_stopped(coro) -> None:
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(StopDaemon):
+            loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_run_daemon_reuses_portfolio_manager(monkeypatch, mocker):
+    monkeypatch.setattr(tg, "determine_action", lambda *_: "continue")
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) == 3:
+            raise StopDaemon()
+
+    monkeypatch.setattr(tg.asyncio, "sleep", fake_sleep)
+    ib = mocker.Mock()
+    ib.isConnected.return_value = True
+    portfolio_manager = mocker.Mock()
+    portfolio_manager.manage = mocker.AsyncMock()
+
+    run_until_stopped(tg.run_daemon(ib, portfolio_manager, make_config(120)))
+
+    assert portfolio_manager.manage.await_count == 3
+    assert sleeps == [120, 120, 120]
+
+
+def test_run_daemon_continues_after_failed_run(monkeypatch, mocker):
+    monkeypatch.setattr(tg, "determine_action", lambda *_: "continue")
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) == 2:
+            raise StopDaemon()
+
+    monkeypatch.setattr(tg.asyncio, "sleep", fake_sleep)
+    ib = mocker.Mock()
+    ib.isConnected.return_value = True
+    portfolio_manager = mocker.Mock()
+    portfolio_manager.manage = mocker.AsyncMock(
+        side_effect=[RuntimeError("boom"), None]
+    )
+
+    run_until_stopped(tg.run_daemon(ib, portfolio_manager, make_config()))
+
+    assert portfolio_manager.manage.await_count == 2
+
+
+def test_run_daemon_sleeps_until_open_when_closed(monkeypatch, mocker):
+    monkeypatch.setattr(tg, "determine_action", lambda *_: "exit")
+    monkeypatch.setattr(tg, "seconds_until_open", lambda *_: 900.0)
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        raise StopDaemon()
+
+    monkeypatch.setattr(tg.asyncio, "sleep", fake_sleep)
+    ib = mocker.Mock()
+    portfolio_manager = mocker.Mock()
+    portfolio_manager.manage = mocker.AsyncMock()
+
+    run_until_stopped(tg.run_daemon(ib, portfolio_manager, make_config()))
+
+    portfolio_manager.manage.assert_not_awaited()
+    assert sleeps == [900.0]
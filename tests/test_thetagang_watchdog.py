@@ -69,7 +69,15 @@ def test_watchdog_runs_inside_task(monkeypatch, tmp_path):
             loop.close()
 
     class FakePortfolioManager:
-        def __init__(self, _config, _ib, completion_future, _dry_run, data_store=None):
+        def __init__(
+            self,
+            _config,
+            _ib,
+            completion_future,
+            _dry_run,
+            data_store=None,
+            daemon=False,
+        ):
             if not completion_future.done():
                 completion_future.set_result(True)
 
@@ -1,9 +1,11 @@
 import math
+import random
 from datetime import date, timedelta
 
 from ib_async import Option, Order, PortfolioItem
 from ib_async.contract import Stock
 
+from benchmarks.net_short_positions import quadratic_net_short_positions, random_lots
 from tests.test_config import (
     ConfigFactory,
     SymbolConfigFactory,
@@ -495,6 +497,38 @@ def test_calculate_net_short_positions() -> None:
     )
 
 
+def test_calculate_net_short_positions_matches_quadratic_matching() -> None:
+    for seed in range(300):
+        rng = random.Random(seed)
+        lots = random_lots(
+            rng.randint(0, 40),
+            rng,
+            expirations=rng.randint(1, 4),
+            strikes=[69.0, 70.0, 70.0 + 1e-12, 71.0, 72.5],
+            max_lot=rng.choice([1, 3, 10]),
+        )
+        if seed % 3 == 0:
+            # Partial lots, which only count once they add up to a contract
+            lots = [
+                lot._replace(position=lot.position * rng.choice([0.5, 1.0, 1.5]))
+                for lot in lots
+            ]
+
+        for right in ("P", "C"):
+            assert calculate_net_short_positions(
+                lots, right
+            ) == quadratic_net_short_positions(lots, right), (seed, right)
+
+
+def test_calculate_net_short_positions_matches_on_large_portfolio() -> None:
+    lots = random_lots(2000, random.Random(0))
+
+    for right in ("P", "C"):
+        assert calculate_net_short_positions(
+            lots, right
+        ) == quadratic_net_short_positions(lots, right)
+
+
 def test_weighted_avg_strike() -> None:
     today = date.today()
     exp3dte = (today + timedelta(days=3)).strftime("%Y%m%d")
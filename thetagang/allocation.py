@@ -0,0 +1,134 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+
+class SymbolTarget:
+    """One symbol's row of a TargetAllocation, as plain Python numbers."""
+
+    __slots__ = (
+        "weight",
+        "price",
+        "current_shares",
+        "current_value",
+        "current_weight",
+        "target_value",
+        "target_shares",
+        "share_gap",
+        "weight_delta",
+        "relative_drift",
+    )
+
+    def __init__(
+        self,
+        weight: float,
+        price: float,
+        current_shares: int,
+        current_value: float,
+        current_weight: float,
+        target_value: float,
+        target_shares: int,
+        share_gap: int,
+        weight_delta: float,
+        relative_drift: float,
+    ) -> None:
+        self.weight = weight
+        self.price = price
+        self.current_shares = current_shares
+        self.current_value = current_value
+        self.current_weight = current_weight
+        self.target_value = target_value
+        self.target_shares = target_shares
+        self.share_gap = share_gap
+        self.weight_delta = weight_delta
+        self.relative_drift = relative_drift
+
+
+class TargetAllocation:
+    """
+    Target value and shares for each symbol from its weight of the total
+    value, with how far the current shares are from it, worked out for every
+    symbol at once on arrays rather than symbol by symbol. Arrays are in the
+    order of `symbols`; `allocation[symbol]` reads one symbol's row.
+
+    Prices must be valid (positive) quotes, which the caller checks, as what
+    to do about a bad one differs between phases. With round_to_cents, the
+    target values are rounded to cents before the target shares are worked
+    out from them, as the put writing and buy/sell-only phases do.
+    """
+
+    def __init__(
+        self,
+        symbols: Sequence[str],
+        weights: npt.ArrayLike,
+        prices: npt.ArrayLike,
+        current_shares: npt.ArrayLike,
+        total_value: float,
+        round_to_cents: bool = True,
+    ) -> None:
+        self.symbols: List[str] = list(symbols)
+        self.index: Dict[str, int] = {
+            symbol: i for i, symbol in enumerate(self.symbols)
+        }
+        self.total_value = total_value
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.current_shares = np.floor(
+            np.asarray(current_shares, dtype=np.float64)
+        ).astype(np.int64)
+
+        self.target_values = self.weights * total_value
+        if round_to_cents:
+            self.target_values = np.round(self.target_values, 2)
+        self.target_shares = np.floor(self.target_values / self.prices).astype(np.int64)
+        self.share_gaps = self.target_shares - self.current_shares
+
+        self.current_values = self.current_shares * self.prices
+        if total_value > 0:
+            self.current_weights = self.current_values / total_value
+        else:
+            self.current_weights = np.zeros_like(self.current_values)
+        self.weight_deltas = self.current_weights - self.weights
+        # How far each symbol's weight is from its target, relative to the
+        # target (symbols without a target weight read as 0)
+        self.relative_ratios = np.divide(
+            self.current_weights,
+            self.weights,
+            out=np.zeros_like(self.current_weights),
+            where=self.weights > 0,
+        )
+        self.relative_drifts = np.abs(self.relative_ratios - 1.0)
+        self.__targets: Optional[Dict[str, SymbolTarget]] = None
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.index
+
+    def __getitem__(self, symbol: str) -> SymbolTarget:
+        if self.__targets is None:
+            self.__targets = {
+                symbol: SymbolTarget(*row)
+                for symbol, row in zip(
+                    self.symbols,
+                    zip(
+                        self.weights.tolist(),
+                        self.prices.tolist(),
+                        self.current_shares.tolist(),
+                        self.current_values.tolist(),
+                        self.current_weights.tolist(),
+                        self.target_values.tolist(),
+                        self.target_shares.tolist(),
+                        self.share_gaps.tolist(),
+                        self.weight_deltas.tolist(),
+                        self.relative_drifts.tolist(),
+                    ),
+                )
+            }
+        return self.__targets[symbol]
+
+    def by_symbol(self, values: npt.NDArray[Any]) -> Dict[str, Any]:
+        """One of the arrays as a dict by symbol, of plain Python numbers."""
+        return dict(zip(self.symbols, values.tolist()))
@@ -0,0 +1,138 @@
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+from ib_async import Ticker
+from ib_async.contract import Option
+
+from thetagang.options import option_dte
+from thetagang.util import midpoint_or_market_price
+
+
+def _float_or_nan(value: Optional[float]) -> float:
+    return float("nan") if value is None else float(value)
+
+
+class ChainSnapshot:
+    """
+    Columnar view of the tickers returned by a chain scan.
+
+    Each contract's quote is read out of its Ticker once, into NumPy columns,
+    so that filtering and ranking the chain are mask and sort operations over
+    the whole chain rather than per-ticker Python calls. Rows are kept in the
+    order they were scanned, and take() keeps only the tickers of the
+    selected rows so the rest can be dropped.
+    """
+
+    def __init__(
+        self, tickers: Sequence[Ticker], right: str, today: Optional[date] = None
+    ) -> None:
+        self.right = right
+        self.tickers: List[Ticker] = list(tickers)
+        is_put = right.upper().startswith("P")
+
+        def greek(ticker: Ticker, name: str) -> float:
+            if not ticker.modelGreeks:
+                return float("nan")
+            return _float_or_nan(getattr(ticker.modelGreeks, name))
+
+        self.strike = np.array(
+            [t.contract.strike if t.contract else np.nan for t in self.tickers],
+            dtype=np.float64,
+        )
+        self.dte = np.array(
+            [
+                option_dte(t.contract.lastTradeDateOrContractMonth, today)
+                if t.contract
+                else 0
+                for t in self.tickers
+            ],
+            dtype=np.int64,
+        )
+        self.bid = np.array(
+            [_float_or_nan(t.bid) for t in self.tickers], dtype=np.float64
+        )
+        self.ask = np.array(
+            [_float_or_nan(t.ask) for t in self.tickers], dtype=np.float64
+        )
+        self.mid = np.array(
+            [midpoint_or_market_price(t) for t in self.tickers], dtype=np.float64
+        )
+        self.model_price = np.array(
+            [greek(t, "optPrice") for t in self.tickers], dtype=np.float64
+        )
+        self.delta = np.array(
+            [greek(t, "delta") for t in self.tickers], dtype=np.float64
+        )
+        self.open_interest = np.array(
+            [
+                _float_or_nan(t.putOpenInterest if is_put else t.callOpenInterest)
+                for t in self.tickers
+            ],
+            dtype=np.float64,
+        )
+        self.is_option = np.array(
+            [isinstance(t.contract, Option) for t in self.tickers], dtype=bool
+        )
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def set_open_interest(self, open_interest: Dict[int, float]) -> None:
+        """Fills in open interest (by conId) loaded after the scan."""
+        for row, ticker in enumerate(self.tickers):
+            if ticker.contract and ticker.contract.conId in open_interest:
+                self.open_interest[row] = open_interest[ticker.contract.conId]
+
+    def take(
+        self, rows: npt.NDArray[np.bool_] | npt.NDArray[np.intp]
+    ) -> "ChainSnapshot":
+        """Returns a snapshot of just the given rows (a mask or indices)."""
+        indices = np.flatnonzero(rows) if rows.dtype == bool else rows
+        snapshot = ChainSnapshot.__new__(ChainSnapshot)
+        snapshot.right = self.right
+        snapshot.tickers = [self.tickers[idx] for idx in indices]
+        for column in (
+            "strike",
+            "dte",
+            "bid",
+            "ask",
+            "mid",
+            "model_price",
+            "delta",
+            "open_interest",
+            "is_option",
+        ):
+            setattr(snapshot, column, getattr(self, column)[indices])
+        return snapshot
+
+    def price_is_valid(
+        self, minimum_price: float, underlying_price: float
+    ) -> npt.NDArray[np.bool_]:
+        valid = self.mid > minimum_price
+        if not self.right.upper().startswith("C"):
+            # when writing puts, we need to be sure that the strike + credit is
+            # less than or equal to the current market price, so that we don't
+            # exceed the target capital allocation for this position
+            valid &= self.is_option & (self.strike <= self.mid + underlying_price)
+        return valid
+
+    def delta_is_valid(self, target_delta: float) -> npt.NDArray[np.bool_]:
+        # NaN deltas compare False, so contracts without greeks are invalid
+        return np.abs(self.delta) <= target_delta
+
+    def open_interest_is_valid(
+        self, minimum_open_interest: int
+    ) -> npt.NDArray[np.bool_]:
+        return self.open_interest >= minimum_open_interest
+
+    def ranked(self, delta_descending: bool) -> "ChainSnapshot":
+        """
+        Returns the snapshot sorted by DTE, then by absolute delta (contracts
+        without a delta rank as zero). Both sorts are stable, so ties keep
+        their scan order.
+        """
+        abs_delta = np.nan_to_num(np.abs(self.delta), nan=0.0)
+        order = np.lexsort((-abs_delta if delta_descending else abs_delta, self.dte))
+        return self.take(order)
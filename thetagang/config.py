@@ -74,6 +74,14 @@ class ConstantsConfig(BaseModel, DisplayMixin):
 class OptionChainsConfig(BaseModel):
     expirations: int = Field(..., ge=1)
     strikes: int = Field(..., ge=1)
+    delta_prefilter: bool = Field(default=False)
+    delta_prefilter_strikes: int = Field(default=6, ge=1)
+    risk_free_rate: float = Field(default=0.04, ge=0.0)
+    two_phase_scan: bool = Field(default=False)
+    two_phase_sample_strikes: int = Field(default=4, ge=2)
+    streaming_scan: bool = Field(default=False)
+    max_concurrent_scans: int = Field(default=4, ge=1)
+    scan_cache_ttl: Optional[float] = Field(default=None, ge=0.0)
 
 
 class AlgoSettingsConfig(BaseModel):
@@ -108,6 +116,9 @@ class OrdersConfig(BaseModel, DisplayMixin):
 
 class IBAsyncConfig(BaseModel):
     api_response_wait_time: int = Field(default=60, ge=0)
+    max_market_data_lines: int = Field(default=90, ge=1)
+    underlying_ticker_ttl: float = Field(default=5.0, ge=0)
+    option_ticker_ttl: float = Field(default=2.0, ge=0)
     logfile: Optional[str] = None
 
 
@@ -622,6 +633,15 @@ class RegimeRebalanceConfig(BaseModel, DisplayMixin):
             self.ratio_gate.add_to_table(table, section)
 
 
+class DaemonConfig(BaseModel, DisplayMixin):
+    interval: int = Field(default=1800, ge=1)
+
+    def add_to_table(self, table: Table, section: str = "") -> None:
+        table.add_section()
+        table.add_row("[spring_green1]Daemon mode")
+        table.add_row("", "Run interval", "=", f"{self.interval}s")
+
+
 class ActionWhenClosedEnum(str, Enum):
     wait = "wait"
     exit = "exit"
@@ -650,6 +670,7 @@ class Config(BaseModel, DisplayMixin):
     roll_when: RollWhenConfig
     target: TargetConfig
     exchange_hours: ExchangeHoursConfig = Field(default_factory=ExchangeHoursConfig)
+    daemon: DaemonConfig = Field(default_factory=DaemonConfig)
 
     orders: OrdersConfig = Field(default_factory=OrdersConfig)
     database: DatabaseConfig = Field(default_factory=DatabaseConfig)
@@ -832,6 +853,7 @@ class Config(BaseModel, DisplayMixin):
         # Add all component tables
         self.account.add_to_table(config_table)
         self.exchange_hours.add_to_table(config_table)
+        self.daemon.add_to_table(config_table)
         if self.constants:
             self.constants.add_to_table(config_table)
         self.orders.add_to_table(config_table)
@@ -8,7 +8,7 @@ import shutil
 from contextlib import contextmanager
 from datetime import date, datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterable, Iterator, Mapping, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 from alembic.config import Config as AlembicConfig
 from sqlalchemy import (
@@ -29,6 +29,7 @@ from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
 
 from alembic import command
 from thetagang import log
+from thetagang.portfolio import PositionRecord
 
 
 class Base(DeclarativeBase):
@@ -187,6 +188,31 @@ class HistoricalBar(Base):
     average: Mapped[Optional[float]] = mapped_column(Float)
 
 
+class QualifiedContract(Base):
+    __tablename__ = "qualified_contracts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    cache_key: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    con_id: Mapped[Optional[int]] = mapped_column(Integer)
+    symbol: Mapped[Optional[str]] = mapped_column(String)
+    sec_type: Mapped[Optional[str]] = mapped_column(String)
+    # NULL when IBKR couldn't qualify the contract
+    contract_json: Mapped[Optional[str]] = mapped_column(Text)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
+
+
+class OptionChainRecord(Base):
+    __tablename__ = "option_chains"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    cache_key: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    symbol: Mapped[Optional[str]] = mapped_column(String)
+    chains_json: Mapped[str] = mapped_column(Text, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
+
+
 def sqlite_db_path(db_url: str) -> Optional[Path]:
     url = make_url(db_url)
     if not url.drivername.startswith("sqlite"):
@@ -372,28 +398,30 @@ class DataStore:
             rows = []
             for symbol, items in positions.items():
                 for position in items:
-                    contract = getattr(position, "contract", None)
+                    record = (
+                        position
+                        if isinstance(position, PositionRecord)
+                        else PositionRecord.from_portfolio_item(position)
+                    )
                     rows.append(
                         PositionSnapshot(
                             run_id=self.run_id,
                             created_at=now,
                             symbol=symbol,
-                            con_id=getattr(contract, "conId", None),
-                            sec_type=getattr(contract, "secType", None),
-                            position=getattr(position, "position", None),
-                            avg_cost=getattr(position, "averageCost", None),
-                            market_price=getattr(position, "marketPrice", None),
-                            market_value=getattr(position, "marketValue", None),
-                            unrealized_pnl=getattr(position, "unrealizedPNL", None),
-                            realized_pnl=getattr(position, "realizedPNL", None),
-                            currency=getattr(contract, "currency", None),
-                            exchange=getattr(contract, "exchange", None),
-                            multiplier=getattr(contract, "multiplier", None),
-                            expiry=getattr(
-                                contract, "lastTradeDateOrContractMonth", None
-                            ),
-                            strike=getattr(contract, "strike", None),
-                            right=getattr(contract, "right", None),
+                            con_id=record.con_id,
+                            sec_type=record.sec_type,
+                            position=record.quantity,
+                            avg_cost=record.avg_cost,
+                            market_price=record.market_price,
+                            market_value=record.market_value,
+                            unrealized_pnl=record.unrealized_pnl,
+                            realized_pnl=record.realized_pnl,
+                            currency=record.currency,
+                            exchange=record.exchange,
+                            multiplier=record.multiplier,
+                            expiry=record.expiry,
+                            strike=record.strike,
+                            right=record.right,
                         )
                     )
             if rows:
@@ -559,6 +587,159 @@ class DataStore:
         except Exception as exc:
             log.warning(f"Failed to record historical bars: {exc}")
 
+    def get_historical_bars(
+        self, symbol: str, timeframe: str, start: datetime
+    ) -> List[Dict[str, Any]]:
+        """Return the stored bars for symbol from start onwards, oldest first."""
+        try:
+            with self.session_scope() as session:
+                stmt = (
+                    select(HistoricalBar)
+                    .where(HistoricalBar.symbol == symbol)
+                    .where(HistoricalBar.timeframe == timeframe)
+                    .where(HistoricalBar.bar_time >= start)
+                    .order_by(HistoricalBar.bar_time)
+                )
+                return [
+                    dict(
+                        bar_time=row.bar_time,
+                        open=row.open,
+                        high=row.high,
+                        low=row.low,
+                        close=row.close,
+                        volume=row.volume,
+                        bar_count=row.bar_count,
+                        average=row.average,
+                    )
+                    for row in session.execute(stmt).scalars()
+                ]
+        except Exception as exc:
+            log.warning(f"Failed to read historical bars: {exc}")
+            return []
+
+    def get_qualified_contracts(
+        self, cache_keys: Iterable[str]
+    ) -> Dict[str, Tuple[Dict[str, Any], datetime]]:
+        """Return the unexpired cached qualifications for the given keys, as
+        (contract fields, expires_at)."""
+        try:
+            keys = list(cache_keys)
+            if not keys:
+                return {}
+            now = utcnow()
+            with self.session_scope() as session:
+                stmt = (
+                    select(QualifiedContract)
+                    .where(QualifiedContract.cache_key.in_(keys))
+                    .where(QualifiedContract.expires_at > now)
+                    .where(QualifiedContract.contract_json.is_not(None))
+                )
+                return {
+                    row.cache_key: (json.loads(row.contract_json), row.expires_at)
+                    for row in session.execute(stmt).scalars()
+                }
+        except Exception as exc:
+            log.warning(f"Failed to read qualified contracts: {exc}")
+            return {}
+
+    def record_qualified_contracts(
+        self,
+        entries: List[Tuple[str, Dict[str, Any], datetime]],
+    ) -> None:
+        """Store (cache key, contract fields, expires_at) entries, dropping any
+        that have already expired."""
+        try:
+            now = utcnow()
+            rows = [
+                dict(
+                    cache_key=cache_key,
+                    con_id=fields.get("conId"),
+                    symbol=fields.get("symbol"),
+                    sec_type=fields.get("secType"),
+                    contract_json=json.dumps(fields),
+                    expires_at=expires_at,
+                    updated_at=now,
+                )
+                for cache_key, fields, expires_at in entries
+                if expires_at > now
+            ]
+            with self.session_scope() as session:
+                # Rows without an expiry or contract were stored by older
+                # versions, which kept stocks forever and contracts that
+                # couldn't be qualified for a day
+                session.query(QualifiedContract).filter(
+                    (QualifiedContract.expires_at.is_(None))
+                    | (QualifiedContract.expires_at <= now)
+                    | (QualifiedContract.contract_json.is_(None))
+                ).delete(synchronize_session=False)
+                if rows:
+                    stmt = sqlite_insert(QualifiedContract).values(rows)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["cache_key"],
+                        set_={
+                            "con_id": stmt.excluded.con_id,
+                            "symbol": stmt.excluded.symbol,
+                            "sec_type": stmt.excluded.sec_type,
+                            "contract_json": stmt.excluded.contract_json,
+                            "expires_at": stmt.excluded.expires_at,
+                            "updated_at": stmt.excluded.updated_at,
+                        },
+                    )
+                    session.execute(stmt)
+        except Exception as exc:
+            log.warning(f"Failed to record qualified contracts: {exc}")
+
+    def get_option_chains(
+        self, cache_key: str
+    ) -> Optional[Tuple[List[Dict[str, Any]], datetime]]:
+        """Return the cached option chains and their expiry, if still valid."""
+        try:
+            with self.session_scope() as session:
+                row = session.execute(
+                    select(OptionChainRecord.chains_json, OptionChainRecord.expires_at)
+                    .where(OptionChainRecord.cache_key == cache_key)
+                    .where(OptionChainRecord.expires_at > utcnow())
+                ).one_or_none()
+            if row is None:
+                return None
+            return json.loads(row.chains_json), row.expires_at
+        except Exception as exc:
+            log.warning(f"Failed to read option chains for {cache_key}: {exc}")
+            return None
+
+    def record_option_chains(
+        self,
+        cache_key: str,
+        symbol: str,
+        chains: List[Dict[str, Any]],
+        expires_at: datetime,
+    ) -> None:
+        try:
+            now = utcnow()
+            with self.session_scope() as session:
+                session.query(OptionChainRecord).filter(
+                    OptionChainRecord.expires_at <= now
+                ).delete(synchronize_session=False)
+                stmt = sqlite_insert(OptionChainRecord).values(
+                    cache_key=cache_key,
+                    symbol=symbol,
+                    chains_json=json.dumps(chains),
+                    expires_at=expires_at,
+                    updated_at=now,
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["cache_key"],
+                    set_={
+                        "symbol": stmt.excluded.symbol,
+                        "chains_json": stmt.excluded.chains_json,
+                        "expires_at": stmt.excluded.expires_at,
+                        "updated_at": stmt.excluded.updated_at,
+                    },
+                )
+                session.execute(stmt)
+        except Exception as exc:
+            log.warning(f"Failed to record option chains for {symbol}: {exc}")
+
     def get_last_regime_rebalance_time(
         self,
         symbols: Iterable[str],
@@ -21,8 +21,10 @@ def _session_times_from_schedule(
 
 
 def _next_session_open_from_schedule(
-    calendar: xcals.ExchangeCalendar, now: datetime
+    calendar: xcals.ExchangeCalendar, now: datetime, skip_started: bool = False
 ) -> pd.Timestamp | None:
+    # Today's session counts until it closes, or only until it opens with
+    # skip_started
     session = pd.Timestamp(now.date())
     sessions = calendar.sessions
     idx = int(sessions.searchsorted(session.to_datetime64(), side="left"))
@@ -30,7 +32,8 @@ def _next_session_open_from_schedule(
         return None
     candidate = sessions[idx]
     schedule = calendar.schedule.loc[candidate]
-    if candidate == session and schedule["close"] <= pd.Timestamp(now):
+    cutoff = schedule["open"] if skip_started else schedule["close"]
+    if candidate == session and cutoff <= pd.Timestamp(now):
         idx += 1
         if idx >= len(sessions):
             return None
@@ -39,6 +42,16 @@ def _next_session_open_from_schedule(
     return schedule["open"]
 
 
+def next_session_open(exchange: str, now: datetime) -> datetime | None:
+    """Returns the open (as a naive UTC datetime) of the first session on the
+    exchange that starts after now, which must be timezone aware."""
+    calendar = xcals.get_calendar(exchange)
+    session_open = _next_session_open_from_schedule(calendar, now, skip_started=True)
+    if session_open is None:
+        return None
+    return session_open.tz_convert("UTC").tz_localize(None).to_pydatetime()
+
+
 def determine_action(config: ExchangeHoursConfig, now: datetime) -> str:
     if config.action_when_closed == "continue":
         return "continue"
@@ -82,14 +95,27 @@ def determine_action(config: ExchangeHoursConfig, now: datetime) -> str:
     return "exit"
 
 
-def waited_for_open(config: ExchangeHoursConfig, now: datetime) -> bool:
+def _next_start(config: ExchangeHoursConfig, now: datetime) -> pd.Timestamp | None:
     calendar = xcals.get_calendar(config.exchange)
     next_open = _next_session_open_from_schedule(calendar, now)
     if next_open is None:
         log.warning(f"No upcoming exchange session found for {config.exchange}.")
-        return False
+        return None
+
+    return next_open + pd.Timedelta(seconds=config.delay_after_open)
 
-    start = next_open + pd.Timedelta(seconds=config.delay_after_open)
+
+def seconds_until_open(config: ExchangeHoursConfig, now: datetime) -> float | None:
+    start = _next_start(config, now)
+    if start is None:
+        return None
+    return max(0.0, (start - now).total_seconds())
+
+
+def waited_for_open(config: ExchangeHoursConfig, now: datetime) -> bool:
+    start = _next_start(config, now)
+    if start is None:
+        return False
 
     seconds_until_start = (start - now).total_seconds()
 
@@ -0,0 +1,128 @@
+import math
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+FloatArray = npt.NDArray[np.float64]
+
+TRADING_DAYS_PER_YEAR = 252
+CALENDAR_DAYS_PER_YEAR = 365.0
+
+# Floor on time to expiry, so that contracts expiring today still get a
+# well-defined (if very steep) delta
+MIN_YEARS_TO_EXPIRY = 1 / (CALENDAR_DAYS_PER_YEAR * 24)
+
+
+def norm_cdf(x: npt.ArrayLike) -> FloatArray:
+    """
+    Standard normal CDF, vectorized over x.
+
+    Uses the Abramowitz & Stegun 7.1.26 approximation of erf (absolute error
+    below 1.5e-7), which is plenty for estimating deltas and avoids pulling in
+    scipy.
+    """
+    z = np.abs(np.asarray(x, dtype=np.float64)) / math.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (
+        0.254829592
+        + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429)))
+    )
+    erf = 1.0 - poly * np.exp(-z * z)
+    return np.where(np.asarray(x) >= 0, 0.5 * (1.0 + erf), 0.5 * (1.0 - erf))
+
+
+def _d1_d2(
+    spot: float,
+    strikes: npt.ArrayLike,
+    years: npt.ArrayLike,
+    rate: float,
+    volatility: float,
+) -> tuple[FloatArray, FloatArray]:
+    k = np.asarray(strikes, dtype=np.float64)
+    t = np.maximum(np.asarray(years, dtype=np.float64), MIN_YEARS_TO_EXPIRY)
+    vol_sqrt_t = volatility * np.sqrt(t)
+    d1 = (np.log(spot / k) + (rate + 0.5 * volatility**2) * t) / vol_sqrt_t
+    return d1, d1 - vol_sqrt_t
+
+
+def black_scholes_delta(
+    spot: float,
+    strikes: npt.ArrayLike,
+    years: npt.ArrayLike,
+    rate: float,
+    volatility: float,
+    right: str,
+) -> FloatArray:
+    """
+    Black-Scholes delta for European options on a non-dividend paying
+    underlying. strikes and years are broadcast against each other, so passing
+    a column of expiries and a row of strikes gives the delta for the whole
+    chain grid at once. Put deltas are negative.
+    """
+    d1, _ = _d1_d2(spot, strikes, years, rate, volatility)
+    if right.upper().startswith("P"):
+        return norm_cdf(d1) - 1.0
+    return norm_cdf(d1)
+
+
+def black_scholes_price(
+    spot: float,
+    strikes: npt.ArrayLike,
+    years: npt.ArrayLike,
+    rate: float,
+    volatility: float,
+    right: str,
+) -> FloatArray:
+    """Black-Scholes price, broadcast the same way as black_scholes_delta."""
+    k = np.asarray(strikes, dtype=np.float64)
+    t = np.maximum(np.asarray(years, dtype=np.float64), MIN_YEARS_TO_EXPIRY)
+    d1, d2 = _d1_d2(spot, k, t, rate, volatility)
+    discounted_strike = k * np.exp(-rate * t)
+    if right.upper().startswith("P"):
+        return discounted_strike * norm_cdf(-d2) - spot * norm_cdf(-d1)
+    return spot * norm_cdf(d1) - discounted_strike * norm_cdf(d2)
+
+
+def annualized_volatility(closes: Iterable[float]) -> Optional[float]:
+    """Annualized volatility of daily log returns, or None if there isn't
+    enough usable data to estimate it."""
+    prices = np.asarray(list(closes), dtype=np.float64)
+    prices = prices[np.isfinite(prices) & (prices > 0)]
+    if prices.size < 3:
+        return None
+    volatility = float(np.std(np.diff(np.log(prices)), ddof=1)) * math.sqrt(
+        TRADING_DAYS_PER_YEAR
+    )
+    if not math.isfinite(volatility) or volatility <= 0:
+        return None
+    return volatility
+
+
+def strikes_near_target_delta(
+    spot: float,
+    strikes: Sequence[float],
+    dtes: Sequence[int],
+    rate: float,
+    volatility: float,
+    right: str,
+    target_delta: float,
+    strikes_per_expiration: int,
+) -> npt.NDArray[np.bool_]:
+    """
+    Returns a len(dtes) x len(strikes) mask selecting, for each expiration,
+    the strikes_per_expiration strikes whose estimated absolute delta is
+    closest to target_delta.
+    """
+    years = np.asarray(dtes, dtype=np.float64)[:, np.newaxis] / CALENDAR_DAYS_PER_YEAR
+    deltas = np.abs(
+        black_scholes_delta(
+            spot, np.asarray(strikes)[np.newaxis, :], years, rate, volatility, right
+        )
+    )
+    distance = np.abs(deltas - target_delta)
+    keep = min(strikes_per_expiration, len(strikes))
+    nearest = np.argsort(distance, axis=1, kind="stable")[:, :keep]
+    mask = np.zeros(distance.shape, dtype=bool)
+    np.put_along_axis(mask, nearest, True, axis=1)
+    return mask
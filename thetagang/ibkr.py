@@ -1,11 +1,29 @@
 import asyncio
-from enum import Enum
-from typing import Any, Awaitable, Callable, Coroutine, List, Optional, TypeVar, cast
+import heapq
+import itertools
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from enum import Enum, IntEnum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
 
 from ib_async import (
     IB,
     AccountValue,
-    BarDataList,
+    BarData,
     Contract,
     ExecutionFilter,
     Fill,
@@ -22,7 +40,8 @@ from ib_async import (
 from rich.console import Console
 
 from thetagang import log
-from thetagang.db import DataStore
+from thetagang.db import DataStore, utcnow
+from thetagang.exchange_hours import next_session_open
 
 console = Console()
 
@@ -32,6 +51,35 @@ class TickerField(Enum):
     MARKET_PRICE = "market_price"
     GREEKS = "greeks"
     OPEN_INTEREST = "open_interest"
+    IMPLIED_VOLATILITY = "implied_volatility"
+
+
+# Fields that a one-shot snapshot quote can provide. Greeks rely on streamed
+# model computations, and open interest and implied volatility on generic
+# ticks, so requests for them always use a streaming subscription.
+SNAPSHOT_TICKER_FIELDS = {TickerField.MIDPOINT, TickerField.MARKET_PRICE}
+
+
+def ticker_field_is_ready(ticker: Ticker, field: TickerField) -> bool:
+    if field == TickerField.MIDPOINT:
+        return not util.isNan(ticker.midpoint())
+    if field == TickerField.MARKET_PRICE:
+        return not util.isNan(ticker.marketPrice())
+    if field == TickerField.GREEKS:
+        return not (
+            ticker.modelGreeks is None
+            or ticker.modelGreeks.delta is None
+            or util.isNan(ticker.modelGreeks.delta)
+        )
+    if field == TickerField.OPEN_INTEREST:
+        if not ticker.contract:
+            return True
+        if ticker.contract.right.startswith("P"):
+            return not util.isNan(ticker.putOpenInterest)
+        return not util.isNan(ticker.callOpenInterest)
+    if field == TickerField.IMPLIED_VOLATILITY:
+        return not util.isNan(ticker.impliedVolatility)
+    raise ValueError(f"Unknown ticker field: {field}")
 
 
 class RequiredFieldValidationError(Exception):
@@ -52,8 +100,239 @@ class IBKRRequestTimeout(RuntimeError):
 T = TypeVar("T")
 
 
+class MarketDataPriority(IntEnum):
+    """Order in which queued market data requests are given a free line,
+    lowest value first."""
+
+    UNDERLYING = 0
+    OPTION_CHAIN = 1
+    REPRICE = 2
+
+
+class MarketDataScheduler:
+    """
+    Hands out a fixed budget of market data lines.
+
+    IBKR only allows a limited number of simultaneous market data lines
+    (usually 100), and requests beyond that silently never receive data. When
+    the budget is exhausted, callers queue up and are handed a line in
+    priority order (ties are served first come, first served) as soon as
+    another one is released.
+    """
+
+    def __init__(self, max_lines: int) -> None:
+        self.max_lines = max_lines
+        self.lines_in_use = 0
+        self.__waiters: List[Tuple[int, int, asyncio.Future[None]]] = []
+        self.__sequence = itertools.count()
+
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self.__waiters if not future.done())
+
+    async def acquire(self, priority: MarketDataPriority) -> None:
+        if self.lines_in_use < self.max_lines:
+            self.lines_in_use += 1
+            return
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.__waiters, (priority, next(self.__sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The line was handed over just as we were cancelled, so pass
+                # it on to the next waiter
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self.__waiters:
+            _, _, future = heapq.heappop(self.__waiters)
+            if not future.done():
+                # Hand the line straight to the next waiter
+                future.set_result(None)
+                return
+        self.lines_in_use = max(0, self.lines_in_use - 1)
+
+
+class RequestPacer:
+    """
+    Sliding window used to pace requests that IBKR rate limits.
+
+    At most `capacity` requests go out in any `period` seconds. The send
+    times of the last `capacity` requests are kept, and once there are that
+    many, callers wait in FIFO order until the oldest of them is `period`
+    old. This keeps bursts of historical data requests under IBKR's pacing
+    limits, which otherwise show up as requests that never complete.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        period: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.capacity = capacity
+        self.period = period
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__sent: Deque[float] = deque()
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.__lock:
+            if len(self.__sent) >= self.capacity:
+                wait = self.__sent[0] + self.period - self.__clock()
+                if wait > 0:
+                    await self.__sleep(wait)
+                self.__sent.popleft()
+            self.__sent.append(self.__clock())
+
+
+class MarketDataSubscription:
+    """A live market data line shared by every caller that asked for the
+    same contract."""
+
+    def __init__(self, ticker: Ticker, generic_ticks: Set[str]) -> None:
+        self.ticker = ticker
+        self.generic_ticks = generic_ticks
+        self.ref_count = 0
+
+
+# How long a qualification is trusted for contracts that don't expire (stocks,
+# indices), so that a rename, merger or reverse split is picked up within days
+NON_EXPIRING_CONTRACT_TTL = timedelta(days=3)
+
+
+def contract_cache_key(contract: Contract) -> str:
+    return "|".join(
+        str(value)
+        for value in (
+            contract.conId,
+            contract.symbol,
+            contract.secType,
+            contract.exchange,
+            contract.primaryExchange,
+            contract.currency,
+            contract.lastTradeDateOrContractMonth,
+            contract.strike,
+            contract.right,
+            contract.tradingClass,
+            contract.multiplier,
+        )
+    )
+
+
+def contract_expires_at(contract: Contract, now: Optional[datetime] = None) -> datetime:
+    """Returns when a qualified contract stops being valid, or when it should
+    be qualified again (NON_EXPIRING_CONTRACT_TTL from now) for contracts that
+    don't expire (stocks, indices)."""
+    expiry = contract.lastTradeDateOrContractMonth[:8]
+    try:
+        if len(expiry) == 8:
+            return datetime.strptime(expiry, "%Y%m%d") + timedelta(days=1)
+        if len(expiry) == 6:
+            month_start = datetime.strptime(expiry, "%Y%m")
+            return (month_start + timedelta(days=32)).replace(day=1)
+    except ValueError:
+        pass
+    return (now or utcnow()) + NON_EXPIRING_CONTRACT_TTL
+
+
+# Stored daily bars further apart than this (weekends plus a holiday) mean
+# something is missing, so the stored window can't be trusted
+MAX_DAILY_BAR_GAP = timedelta(days=5)
+
+HISTORICAL_DURATION_DAYS = {"D": 1, "W": 7, "M": 31, "Y": 366}
+
+
+def historical_duration_days(duration: str) -> Optional[int]:
+    """Converts an IBKR duration string such as "30 D" into the number of
+    calendar days it covers, or None for units that aren't whole days."""
+    parts = duration.split()
+    if len(parts) != 2 or not parts[0].isdigit():
+        return None
+    days_per_unit = HISTORICAL_DURATION_DAYS.get(parts[1].upper())
+    if days_per_unit is None:
+        return None
+    return int(parts[0]) * days_per_unit
+
+
+class TickerCache:
+    """
+    Short-lived cache of tickers keyed by conId, so that the various phases of
+    a run don't each go back to IBKR for the same quote.
+
+    A cached ticker is only handed out while it's younger than the TTL for its
+    kind of contract (options move faster than their underlyings), and only
+    if it has every required field. Optional fields must either be present or
+    have already been waited for when the ticker was fetched. A TTL of 0
+    disables caching for that kind of contract.
+    """
+
+    OPTION_SEC_TYPES = {"OPT", "FOP"}
+
+    def __init__(self, underlying_ttl: float, option_ttl: float) -> None:
+        self.underlying_ttl = underlying_ttl
+        self.option_ttl = option_ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries: Dict[int, Tuple[Ticker, float, Set[TickerField]]] = {}
+
+    def ttl_for(self, contract: Contract) -> float:
+        if contract.secType in self.OPTION_SEC_TYPES:
+            return self.option_ttl
+        return self.underlying_ttl
+
+    def get(
+        self,
+        contract: Contract,
+        required_fields: List[TickerField],
+        optional_fields: List[TickerField],
+    ) -> Optional[Ticker]:
+        entry = self.__entries.get(contract.conId) if contract.conId else None
+        if entry:
+            ticker, fetched_at, fetched_fields = entry
+            if (
+                time.monotonic() - fetched_at <= self.ttl_for(contract)
+                and all(ticker_field_is_ready(ticker, f) for f in required_fields)
+                and all(
+                    f in fetched_fields or ticker_field_is_ready(ticker, f)
+                    for f in optional_fields
+                )
+            ):
+                self.hits += 1
+                return ticker
+        self.misses += 1
+        return None
+
+    def put(self, ticker: Ticker, fields: List[TickerField]) -> None:
+        contract = ticker.contract
+        if not contract or not contract.conId or self.ttl_for(contract) <= 0:
+            return
+        self.__entries[contract.conId] = (ticker, time.monotonic(), set(fields))
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def log_stats(self) -> None:
+        lookups = self.hits + self.misses
+        if not lookups:
+            return
+        log.info(
+            f"Ticker cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hits / lookups:.0%} hit rate)"
+        )
+
+
 class IBKR:
     ACCOUNT_VALUE_HEALTH_TAGS = {"NetLiquidation", "TotalCashValue", "BuyingPower"}
+    # IBKR allows about 60 historical data requests per 10 minutes
+    HISTORICAL_REQUESTS_PER_PERIOD = 60
+    HISTORICAL_REQUEST_PERIOD_SECONDS = 600
 
     def __init__(
         self,
@@ -61,12 +340,31 @@ class IBKR:
         api_response_wait_time: int,
         default_order_exchange: str,
         data_store: Optional[DataStore] = None,
+        max_market_data_lines: int = 90,
+        underlying_ticker_ttl: float = 5.0,
+        option_ticker_ttl: float = 2.0,
+        exchange_calendar: str = "XNYS",
     ) -> None:
         self.ib = ib
         self.ib.orderStatusEvent += self.orderStatusEvent
         self.api_response_wait_time = api_response_wait_time
         self.default_order_exchange = default_order_exchange
         self.data_store = data_store
+        self.subscriptions: Dict[int, MarketDataSubscription] = {}
+        self.market_data_scheduler = MarketDataScheduler(max_market_data_lines)
+        self.ticker_cache = TickerCache(underlying_ticker_ttl, option_ticker_ttl)
+        self.historical_pacer = RequestPacer(
+            self.HISTORICAL_REQUESTS_PER_PERIOD, self.HISTORICAL_REQUEST_PERIOD_SECONDS
+        )
+        self.__historical_requests: Dict[
+            Tuple[Any, ...], asyncio.Future[List[BarData]]
+        ] = {}
+        self.__qualified_contracts: Dict[str, Tuple[Dict[str, Any], datetime]] = {}
+        self.__unqualified_contracts: Set[str] = set()
+        self.exchange_calendar = exchange_calendar
+        self.__option_chains: Dict[str, Tuple[List[OptionChain], datetime]] = {}
+        self.__open_interest: Dict[int, Tuple[float, date]] = {}
+        self.__open_interest_misses: Set[int] = set()
 
     def portfolio(self, account: str) -> List[PortfolioItem]:
         return self.ib.portfolio(account)
@@ -78,19 +376,116 @@ class IBKR:
         self,
         contract: Contract,
         duration: str,
-    ) -> BarDataList:
+    ) -> List[BarData]:
+        """
+        Requests daily bars for the contract, paced by historical_pacer.
+        Identical requests that are already in flight are shared rather than
+        sent again.
+
+        Bars already stored in the data store are read back first, and only
+        the tail since the last stored bar is requested from IBKR, then merged
+        with them.
+        """
+        key = (
+            contract.conId,
+            contract.symbol,
+            contract.secType,
+            contract.exchange,
+            contract.primaryExchange,
+            duration,
+        )
+        request = self.__historical_requests.get(key)
+        if request is None:
+            request = asyncio.ensure_future(
+                self.__request_historical_data__(contract, duration)
+            )
+            self.__historical_requests[key] = request
+            request.add_done_callback(
+                lambda _: self.__historical_requests.pop(key, None)
+            )
+        # Shield the shared request so one caller being cancelled doesn't
+        # cancel it for everyone else
+        return await asyncio.shield(request)
+
+    async def __request_historical_data__(
+        self, contract: Contract, duration: str
+    ) -> List[BarData]:
+        stored_bars = self.__stored_historical_bars__(contract, duration)
+        request_duration = duration
+        if stored_bars:
+            # Re-request the last stored bar too, since it may have been
+            # recorded before the session closed
+            tail_days = (date.today() - stored_bars[-1].date).days + 1
+            request_duration = f"{max(tail_days, 1)} D"
+
+        await self.historical_pacer.acquire()
         bars = await self.ib.reqHistoricalDataAsync(
             contract,
             "",
-            duration,
+            request_duration,
             "1 day",
             "TRADES",
             True,
         )
         if self.data_store:
             self.data_store.record_historical_bars(contract.symbol, "1 day", bars)
+        if not stored_bars:
+            return bars
+
+        merged = {bar.date: bar for bar in stored_bars}
+        merged.update({self.__bar_date__(bar.date): bar for bar in bars})
+        return [merged[bar_date] for bar_date in sorted(merged)]
+
+    def __stored_historical_bars__(
+        self, contract: Contract, duration: str
+    ) -> List[BarData]:
+        """
+        Returns the daily bars already stored for the requested window, or an
+        empty list if they don't cover the whole window and it needs to be
+        requested in full.
+        """
+        window_days = historical_duration_days(duration)
+        if not self.data_store or window_days is None:
+            return []
+        today = date.today()
+        window_start = today - timedelta(days=window_days)
+        rows = self.data_store.get_historical_bars(
+            contract.symbol,
+            "1 day",
+            datetime.combine(window_start, datetime.min.time()),
+        )
+        bars = [
+            BarData(
+                date=row["bar_time"].date(),
+                open=row["open"],
+                high=row["high"],
+                low=row["low"],
+                close=row["close"],
+                volume=row["volume"],
+                average=row["average"],
+                barCount=row["bar_count"],
+            )
+            for row in rows
+        ]
+        if not bars:
+            return []
+        bar_dates = [window_start] + [bar.date for bar in bars]
+        if any(
+            later - earlier > MAX_DAILY_BAR_GAP
+            for earlier, later in zip(bar_dates, bar_dates[1:])
+        ):
+            return []
         return bars
 
+    def __bar_date__(self, value: date | datetime | str) -> date:
+        # Daily bars carry a date and intraday ones a datetime; a bar date
+        # that's still a YYYYMMDD string is read as that day
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, str):
+            return datetime.strptime(value[:8], "%Y%m%d").date()
+        return value
+
     async def request_executions(
         self,
         exec_filter: Optional[ExecutionFilter] = None,
@@ -149,12 +544,98 @@ class IBKR:
         return self.ib.positions(account)
 
     async def get_chains_for_contract(self, contract: Contract) -> List[OptionChain]:
-        return await self.ib.reqSecDefOptParamsAsync(
+        """
+        Returns the option chains for the underlying. Strikes and expirations
+        only change between sessions, so chains are cached (in memory and in
+        the DataStore) until the next session of the exchange calendar opens.
+        """
+        key = f"{contract.conId}|{contract.symbol}|{contract.secType}"
+        now = utcnow()
+        cached = self.__option_chains.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        if self.data_store:
+            stored = self.data_store.get_option_chains(key)
+            if stored:
+                chains = [OptionChain(**chain) for chain in stored[0]]
+                self.__option_chains[key] = (chains, stored[1])
+                return chains
+
+        chains = await self.ib.reqSecDefOptParamsAsync(
             contract.symbol, "", contract.secType, contract.conId
         )
+        if not chains:
+            # Don't hold on to an empty response, it's most likely transient
+            return chains
+        expires_at = self.__chains_expire_at__(now)
+        self.__option_chains[key] = (chains, expires_at)
+        if self.data_store:
+            self.data_store.record_option_chains(
+                key,
+                contract.symbol,
+                [util.dataclassAsDict(chain) for chain in chains],
+                expires_at,
+            )
+        return chains
+
+    def __chains_expire_at__(self, now: datetime) -> datetime:
+        try:
+            next_open = next_session_open(
+                self.exchange_calendar, now.replace(tzinfo=timezone.utc)
+            )
+        except Exception as exc:
+            log.warning(
+                f"Unable to look up the next {self.exchange_calendar} session: {exc}"
+            )
+            next_open = None
+        if next_open is None:
+            # Fall back to the start of the next day
+            return datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return next_open
 
     async def qualify_contracts(self, *contracts: Contract) -> List[Contract]:
-        results = await self.ib.qualifyContractsAsync(*contracts)
+        """
+        Qualifies the contracts, updating them in place like
+        qualifyContractsAsync does.
+
+        Earlier qualifications are kept in memory and in the DataStore until
+        the contract expires, or for NON_EXPIRING_CONTRACT_TTL for stocks and
+        indices, so only contracts that haven't been seen before need a round
+        trip. Contracts that couldn't be qualified (e.g. SPX as a stock, before
+        falling back to the index) are only remembered until the end of the
+        run, since ib_async also gives up on timeouts and disconnects.
+        """
+        keys = [contract_cache_key(contract) for contract in contracts]
+        cached = self.__cached_qualifications__(keys)
+        results: List[Any] = [None] * len(contracts)
+        misses: List[int] = []
+        for i, (contract, key) in enumerate(zip(contracts, keys)):
+            if key in cached:
+                util.dataclassUpdate(contract, **cached[key])
+                results[i] = contract
+            elif key not in self.__unqualified_contracts:
+                misses.append(i)
+
+        if misses:
+            fresh = await self.ib.qualifyContractsAsync(*[contracts[i] for i in misses])
+            entries: List[Tuple[str, Dict[str, Any], datetime]] = []
+            for i, result in zip(misses, fresh):
+                results[i] = result
+                if isinstance(result, list):
+                    # Ambiguous, let the caller pick and try again next time
+                    continue
+                if result is None:
+                    self.__unqualified_contracts.add(keys[i])
+                else:
+                    entries.append(
+                        (
+                            keys[i],
+                            util.dataclassAsDict(result),
+                            contract_expires_at(result),
+                        )
+                    )
+            self.__store_qualifications__(entries)
+
         # Filter out None values and flatten any nested lists
         qualified: List[Contract] = []
         for result in results:
@@ -168,6 +649,40 @@ class IBKR:
                 qualified.append(result)
         return qualified
 
+    def forget_missing_open_interest(self) -> None:
+        """Lets contracts IBKR didn't report open interest for be asked for
+        again, as each run starts."""
+        self.__open_interest_misses.clear()
+
+    def forget_unqualified_contracts(self) -> None:
+        """Lets contracts that couldn't be qualified be tried again, as each
+        run starts."""
+        self.__unqualified_contracts.clear()
+
+    def __cached_qualifications__(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        now = utcnow()
+        cached: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        for key in keys:
+            entry = self.__qualified_contracts.get(key)
+            if entry and entry[1] > now:
+                cached[key] = entry[0]
+            else:
+                missing.append(key)
+        if missing and self.data_store:
+            stored = self.data_store.get_qualified_contracts(missing)
+            self.__qualified_contracts.update(stored)
+            cached.update({key: fields for key, (fields, _) in stored.items()})
+        return cached
+
+    def __store_qualifications__(
+        self, entries: List[Tuple[str, Dict[str, Any], datetime]]
+    ) -> None:
+        for key, fields, expires_at in entries:
+            self.__qualified_contracts[key] = (fields, expires_at)
+        if entries and self.data_store:
+            self.data_store.record_qualified_contracts(entries)
+
     async def get_ticker_for_stock(
         self,
         symbol: str,
@@ -176,6 +691,7 @@ class IBKR:
         generic_tick_list: str = "",
         required_fields: List[TickerField] = [TickerField.MARKET_PRICE],
         optional_fields: List[TickerField] = [TickerField.MIDPOINT],
+        snapshot: bool = False,
     ) -> Ticker:
         stock = Stock(
             symbol,
@@ -195,7 +711,12 @@ class IBKR:
                 contract = qualified_index[0]
 
         return await self.get_ticker_for_contract(
-            contract, generic_tick_list, required_fields, optional_fields
+            contract,
+            generic_tick_list,
+            required_fields,
+            optional_fields,
+            priority=MarketDataPriority.UNDERLYING,
+            snapshot=snapshot,
         )
 
     async def get_tickers_for_contracts(
@@ -205,10 +726,17 @@ class IBKR:
         generic_tick_list: str = "",
         required_fields: List[TickerField] = [TickerField.MARKET_PRICE],
         optional_fields: List[TickerField] = [TickerField.MIDPOINT],
+        priority: MarketDataPriority = MarketDataPriority.OPTION_CHAIN,
+        snapshot: bool = False,
     ) -> List[Ticker]:
         async def get_ticker_task(contract: Contract) -> Ticker:
             return await self.get_ticker_for_contract(
-                contract, generic_tick_list, required_fields, optional_fields
+                contract,
+                generic_tick_list,
+                required_fields,
+                optional_fields,
+                priority=priority,
+                snapshot=snapshot,
             )
 
         tasks: List[Coroutine[Any, Any, Ticker]] = [
@@ -220,99 +748,174 @@ class IBKR:
         )
         return tickers
 
+    async def get_open_interest(
+        self,
+        underlying_symbol: str,
+        contracts: List[Contract],
+        today: Optional[date] = None,
+    ) -> Dict[int, float]:
+        """
+        Returns the open interest of each option contract by conId, leaving
+        out contracts IBKR didn't report it for. Open interest only changes
+        overnight, so values are cached for the rest of the day (today, or
+        the day the run started on if given). Contracts IBKR didn't report it
+        for aren't asked for again until the next run, as each request for
+        them waits out api_response_wait_time.
+        """
+        today = today or date.today()
+        open_interest: Dict[int, float] = {}
+        missing: List[Contract] = []
+        for contract in contracts:
+            if contract.conId in self.__open_interest_misses:
+                continue
+            cached = self.__open_interest.get(contract.conId)
+            if cached and cached[1] == today:
+                open_interest[contract.conId] = cached[0]
+            else:
+                missing.append(contract)
+
+        if missing:
+            tickers = await self.get_tickers_for_contracts(
+                underlying_symbol,
+                missing,
+                generic_tick_list="101",
+                required_fields=[],
+                optional_fields=[TickerField.OPEN_INTEREST],
+            )
+            for ticker in tickers:
+                if not ticker.contract:
+                    continue
+                value = (
+                    ticker.putOpenInterest
+                    if ticker.contract.right.startswith("P")
+                    else ticker.callOpenInterest
+                )
+                if util.isNan(value):
+                    self.__open_interest_misses.add(ticker.contract.conId)
+                    continue
+                open_interest[ticker.contract.conId] = value
+                self.__open_interest[ticker.contract.conId] = (value, today)
+        return open_interest
+
     async def get_ticker_for_contract(
         self,
         contract: Contract,
         generic_tick_list: str = "",
         required_fields: List[TickerField] = [TickerField.MARKET_PRICE],
         optional_fields: List[TickerField] = [TickerField.MIDPOINT],
+        priority: MarketDataPriority = MarketDataPriority.OPTION_CHAIN,
+        snapshot: bool = False,
     ) -> Ticker:
-        required_handlers = [
-            (field, self.__ticker_field_handler__(field)) for field in required_fields
-        ]
-        optional_handlers = [
-            (field, self.__ticker_field_handler__(field)) for field in optional_fields
-        ]
+        """
+        Returns a ticker for the contract once the required fields are
+        populated, waiting (up to api_response_wait_time) for the optional
+        ones too.
 
+        With snapshot=True, a one-shot snapshot quote is requested instead of
+        a streaming subscription, provided that every requested field is in
+        SNAPSHOT_TICKER_FIELDS and no generic ticks are needed. Otherwise the
+        streaming path is used regardless.
+
+        Tickers fetched recently enough (see TickerCache) are returned without
+        another request.
+        """
+        cached = self.ticker_cache.get(contract, required_fields, optional_fields)
+        if cached:
+            return cached
+
+        if (
+            snapshot
+            and not generic_tick_list
+            and set(required_fields + optional_fields) <= SNAPSHOT_TICKER_FIELDS
+        ):
+            ticker = await self.get_ticker_snapshot(
+                contract, required_fields, optional_fields, priority
+            )
+        else:
+            ticker = await self.__stream_ticker_for_contract__(
+                contract, generic_tick_list, required_fields, optional_fields, priority
+            )
+        self.ticker_cache.put(ticker, required_fields + optional_fields)
+        return ticker
+
+    async def __stream_ticker_for_contract__(
+        self,
+        contract: Contract,
+        generic_tick_list: str,
+        required_fields: List[TickerField],
+        optional_fields: List[TickerField],
+        priority: MarketDataPriority,
+    ) -> Ticker:
         async def ticker_handler(ticker: Ticker) -> None:
-            required_tasks = [handler(ticker) for _, handler in required_handlers]
-            optional_tasks = [handler(ticker) for _, handler in optional_handlers]
-
-            # Gather results, allowing optional tasks to potentially fail (timeout)
-            results = await asyncio.gather(
-                asyncio.gather(*required_tasks),
-                asyncio.gather(
-                    *optional_tasks, return_exceptions=False
-                ),  # Don't raise exceptions here for optional
+            (
+                failed_required_fields,
+                failed_optional_fields,
+            ) = await self.__ticker_wait_for_fields__(
+                ticker, required_fields, optional_fields, self.api_response_wait_time
             )
-            required_results = results[0]
-            optional_results = results[1]
-
-            # Check required results
-            failed_required_fields = [
-                field.name
-                for i, (field, _) in enumerate(required_handlers)
-                if not required_results[i]
-            ]
             if failed_required_fields:
                 raise RequiredFieldValidationError(
-                    f"Required fields timed out for {contract.localSymbol}: {', '.join(failed_required_fields)}"
+                    f"Required fields timed out for {contract.localSymbol}: {', '.join(f.name for f in failed_required_fields)}"
                 )
 
             # Log warnings for optional results that timed out
-            failed_optional_fields = [
-                field.name
-                for i, (field, _) in enumerate(optional_handlers)
-                if not optional_results[i]
-            ]
             if failed_optional_fields:
                 log.warning(
-                    f"Optional fields timed out for {contract.localSymbol}: {', '.join(failed_optional_fields)}"
+                    f"Optional fields timed out for {contract.localSymbol}: {', '.join(f.name for f in failed_optional_fields)}"
                 )
 
         return await self.__market_data_streaming_handler__(
             contract,
             generic_tick_list,
             lambda ticker: ticker_handler(ticker),
+            priority,
         )
 
-    async def __wait_for_midpoint_price__(self, ticker: Ticker) -> bool:
-        return await self.__ticker_wait_for_condition__(
-            ticker, lambda t: not util.isNan(t.midpoint()), self.api_response_wait_time
-        )
-
-    async def __wait_for_market_price__(self, ticker: Ticker) -> bool:
-        return await self.__ticker_wait_for_condition__(
-            ticker,
-            lambda t: not util.isNan(t.marketPrice()),
-            self.api_response_wait_time,
-        )
-
-    async def __wait_for_greeks__(self, ticker: Ticker) -> bool:
-        return await self.__ticker_wait_for_condition__(
-            ticker,
-            lambda t: not (
-                t.modelGreeks is None
-                or t.modelGreeks.delta is None
-                or util.isNan(t.modelGreeks.delta)
-            ),
-            self.api_response_wait_time,
-        )
-
-    async def __wait_for_open_interest__(self, ticker: Ticker) -> bool:
-        def open_interest_is_not_ready(ticker: Ticker) -> bool:
-            if not ticker.contract:
-                return False
-            if ticker.contract.right.startswith("P"):
-                return util.isNan(ticker.putOpenInterest)
-            else:
-                return util.isNan(ticker.callOpenInterest)
+    async def get_ticker_snapshot(
+        self,
+        contract: Contract,
+        required_fields: List[TickerField] = [TickerField.MARKET_PRICE],
+        optional_fields: List[TickerField] = [TickerField.MIDPOINT],
+        priority: MarketDataPriority = MarketDataPriority.OPTION_CHAIN,
+    ) -> Ticker:
+        """
+        Requests a one-shot snapshot quote for the contract. The line is only
+        held until IBKR signals the end of the snapshot, and nothing needs to
+        be cancelled afterwards.
+        """
+        contract = await self.__qualify_for_market_data__(contract)
+        await self.market_data_scheduler.acquire(priority)
+        try:
+            tickers = await asyncio.wait_for(
+                self.ib.reqTickersAsync(contract), timeout=self.api_response_wait_time
+            )
+            ticker = tickers[0]
+        except asyncio.TimeoutError:
+            # Keep whatever arrived before the timeout, the field checks below
+            # decide whether that's good enough
+            ticker = self.ib.ticker(contract) or Ticker(contract=contract)
+        finally:
+            self.market_data_scheduler.release()
 
-        return await self.__ticker_wait_for_condition__(
-            ticker,
-            lambda t: not open_interest_is_not_ready(t),
-            self.api_response_wait_time,
-        )
+        failed_required_fields = [
+            field.name
+            for field in required_fields
+            if not ticker_field_is_ready(ticker, field)
+        ]
+        if failed_required_fields:
+            raise RequiredFieldValidationError(
+                f"Required fields missing from snapshot for {contract.localSymbol}: {', '.join(failed_required_fields)}"
+            )
+        failed_optional_fields = [
+            field.name
+            for field in optional_fields
+            if not ticker_field_is_ready(ticker, field)
+        ]
+        if failed_optional_fields:
+            log.warning(
+                f"Optional fields missing from snapshot for {contract.localSymbol}: {', '.join(failed_optional_fields)}"
+            )
+        return ticker
 
     def orderStatusEvent(self, trade: Trade) -> None:
         if "Filled" in trade.orderStatus.status:
@@ -376,22 +979,36 @@ class IBKR:
         contract: Contract,
         generic_tick_list: str,
         handler: Callable[[Ticker], Awaitable[Any]],
+        priority: MarketDataPriority = MarketDataPriority.OPTION_CHAIN,
     ) -> Ticker:
         """
         Handles the streaming of market data for a given contract.
 
-        This asynchronous method qualifies the contract, requests market data,
-        and processes the data using the provided handler. Once the handler
-        completes, the market data request is canceled.
+        This asynchronous method qualifies the contract, acquires a (possibly
+        shared) market data subscription, and processes the data using the
+        provided handler. Once the handler completes, the subscription is
+        released so the line can be handed to the next queued request; the
+        returned ticker keeps the last values it received.
 
         Args:
             contract (Contract): The contract for which market data is requested.
             handler (Callable[[Ticker], Awaitable[None]]): An asynchronous function
                 that processes the received market data ticker.
+            priority (MarketDataPriority): Where the request is queued when all
+                market data lines are in use.
 
         Returns:
             Ticker: The market data ticker for the given contract.
         """
+        contract = await self.__qualify_for_market_data__(contract)
+        ticker = await self.acquire_ticker(contract, generic_tick_list, priority)
+        try:
+            await handler(ticker)
+        finally:
+            self.release_ticker(contract)
+        return ticker
+
+    async def __qualify_for_market_data__(self, contract: Contract) -> Contract:
         if not contract.conId:
             qualified = await self.qualify_contracts(contract)
             if qualified:
@@ -400,27 +1017,125 @@ class IBKR:
             raise ValueError(
                 f"Contract {contract} can't be qualified because no 'conId' value exists."
             )
-        ticker = self.ib.reqMktData(contract, genericTickList=generic_tick_list)
-        await handler(ticker)
+        return contract
+
+    async def acquire_ticker(
+        self,
+        contract: Contract,
+        generic_tick_list: str = "",
+        priority: MarketDataPriority = MarketDataPriority.OPTION_CHAIN,
+    ) -> Ticker:
+        """
+        Returns the live ticker for a qualified contract, subscribing only if
+        there's no existing market data line for it.
+
+        Subscriptions are keyed by conId and reference counted, so every call
+        must eventually be paired with release_ticker() (or release_all_tickers()
+        at the end of a run). New subscriptions wait for a free line from the
+        market data scheduler. If the existing line is missing some of the
+        requested generic ticks, it's re-requested with the union of both.
+        """
+        requested_ticks = {tick for tick in generic_tick_list.split(",") if tick}
+        subscription = self.subscriptions.get(contract.conId)
+        if not subscription:
+            await self.market_data_scheduler.acquire(priority)
+            # Someone else may have subscribed while we were queued
+            subscription = self.subscriptions.get(contract.conId)
+            if subscription:
+                self.market_data_scheduler.release()
+        if subscription and requested_ticks <= subscription.generic_ticks:
+            subscription.ref_count += 1
+            return subscription.ticker
+
+        ref_count = 0
+        if subscription:
+            ref_count = subscription.ref_count
+            requested_ticks |= subscription.generic_ticks
+            self.ib.cancelMktData(subscription.ticker.contract or contract)
+
+        ticker = self.ib.reqMktData(
+            contract, genericTickList=",".join(sorted(requested_ticks))
+        )
+        subscription = MarketDataSubscription(ticker, requested_ticks)
+        subscription.ref_count = ref_count + 1
+        self.subscriptions[contract.conId] = subscription
         return ticker
 
-    async def __ticker_wait_for_condition__(
-        self, ticker: Ticker, condition: Callable[[Ticker], bool], timeout: float
-    ) -> bool:
-        event = asyncio.Event()
+    def release_ticker(self, contract: Contract) -> None:
+        """Drops one reference to a contract's market data line, cancelling it
+        once nobody is using it any more."""
+        subscription = self.subscriptions.get(contract.conId)
+        if not subscription:
+            return
+        subscription.ref_count -= 1
+        if subscription.ref_count <= 0:
+            del self.subscriptions[contract.conId]
+            self.ib.cancelMktData(subscription.ticker.contract or contract)
+            self.market_data_scheduler.release()
+
+    def release_tickers(self, tickers: List[Ticker]) -> None:
+        for ticker in tickers:
+            if ticker.contract:
+                self.release_ticker(ticker.contract)
+
+    def release_all_tickers(self) -> None:
+        """Cancels every outstanding market data line, regardless of how many
+        references are still held."""
+        for subscription in self.subscriptions.values():
+            if subscription.ticker.contract:
+                self.ib.cancelMktData(subscription.ticker.contract)
+            self.market_data_scheduler.release()
+        self.subscriptions.clear()
+
+    async def __ticker_wait_for_fields__(
+        self,
+        ticker: Ticker,
+        required_fields: List[TickerField],
+        optional_fields: List[TickerField],
+        timeout: float,
+    ) -> Tuple[List[TickerField], List[TickerField]]:
+        """
+        Waits until the ticker has every requested field, or until the timeout
+        expires. A single updateEvent handler checks all of the pending fields
+        on each update and resolves one future per set of fields, instead of
+        attaching a handler per field.
 
-        def onTicker(ticker: Ticker) -> None:
-            if condition(ticker):
-                event.set()
+        Returns the required and optional fields that never arrived.
+        """
+        loop = asyncio.get_running_loop()
+        pending_required = set(required_fields)
+        pending_optional = set(optional_fields)
+        required_ready: asyncio.Future[None] = loop.create_future()
+        optional_ready: asyncio.Future[None] = loop.create_future()
 
-        ticker.updateEvent += onTicker
-        try:
-            await asyncio.wait_for(event.wait(), timeout=timeout)
-            return True
-        except asyncio.TimeoutError:
-            return False
-        finally:
-            ticker.updateEvent -= onTicker
+        def onTicker(ticker: Ticker) -> None:
+            for pending, ready in (
+                (pending_required, required_ready),
+                (pending_optional, optional_ready),
+            ):
+                if ready.done():
+                    continue
+                pending.difference_update(
+                    [field for field in pending if ticker_field_is_ready(ticker, field)]
+                )
+                if not pending:
+                    ready.set_result(None)
+
+        # The ticker may already be populated, e.g. when the line is shared
+        onTicker(ticker)
+        if not (required_ready.done() and optional_ready.done()):
+            ticker.updateEvent += onTicker
+            try:
+                await asyncio.wait([required_ready, optional_ready], timeout=timeout)
+            finally:
+                ticker.updateEvent -= onTicker
+                required_ready.cancel()
+                optional_ready.cancel()
+
+        return (
+            [field for field in required_fields if field in pending_required],
+            [field for field in optional_fields if field in pending_optional],
+        )
 
     async def wait_for_submitting_orders(
         self, trades: List[Trade], timetout: int = 60
@@ -491,15 +1206,3 @@ class IBKR:
             return False
         finally:
             trade.statusEvent -= onStatusEvent
-
-    def __ticker_field_handler__(
-        self, ticker_field: TickerField
-    ) -> Callable[[Ticker], Awaitable[bool]]:
-        if ticker_field == TickerField.MIDPOINT:
-            return self.__wait_for_midpoint_price__
-        if ticker_field == TickerField.MARKET_PRICE:
-            return self.__wait_for_market_price__
-        if ticker_field == TickerField.GREEKS:
-            return self.__wait_for_greeks__
-        if ticker_field == TickerField.OPEN_INTEREST:
-            return self.__wait_for_open_interest__
@@ -59,12 +59,19 @@ async def track_async(tasks: List[Coroutine[Any, Any, T]], description: str) ->
         TaskProgressColumn(),
     )
 
-    with progress:
-        progress_task = progress.add_task(description, total=total_tasks)
-        for coro in asyncio.as_completed(tasks):
-            result = await coro
-            results.append(result)
-            progress.advance(progress_task)
+    futures = [asyncio.ensure_future(task) for task in tasks]
+    try:
+        with progress:
+            progress_task = progress.add_task(description, total=total_tasks)
+            for coro in asyncio.as_completed(futures):
+                result = await coro
+                results.append(result)
+                progress.advance(progress_task)
+    finally:
+        # If we're cancelled (or one of the tasks fails), don't leave the rest
+        # running in the background
+        for future in futures:
+            future.cancel()
 
     return results
 
@@ -33,7 +33,13 @@ CONTEXT_SETTINGS = dict(
     is_flag=True,
     help="Perform a dry run. This will display the the orders without sending any live trades.",
 )
-def cli(config: str, without_ibc: bool, dry_run: bool) -> None:
+@click.option(
+    "--daemon",
+    is_flag=True,
+    help="Keep running and repeat the run every daemon.interval seconds during "
+    "exchange hours, reusing the IB connection and cached data between runs.",
+)
+def cli(config: str, without_ibc: bool, dry_run: bool, daemon: bool) -> None:
     """ThetaGang is an IBKR bot for collecting money.
 
     You can configure this tool by supplying a toml configuration file.
@@ -50,4 +56,4 @@ def cli(config: str, without_ibc: bool, dry_run: bool) -> None:
 
     from .thetagang import start
 
-    start(config, without_ibc, dry_run)
+    start(config, without_ibc, dry_run, daemon)
@@ -1,6 +1,15 @@
+import math
 from datetime import date, datetime
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
+import numpy.typing as npt
 
+
+# A run only sees a few hundred distinct expirations, but parses them over and
+# over (in sorts, filters and tables), so parsed dates are kept around
+@lru_cache(maxsize=4096)
 def contract_date_to_datetime(expiration: str) -> datetime:
     if len(expiration) == 8:
         return datetime.strptime(expiration, "%Y%m%d")
@@ -8,6 +17,62 @@ def contract_date_to_datetime(expiration: str) -> datetime:
         return datetime.strptime(expiration, "%Y%m")
 
 
-def option_dte(expiration: str) -> int:
-    dte = contract_date_to_datetime(expiration).date() - date.today()
+def option_dte(expiration: str, today: Optional[date] = None) -> int:
+    """
+    Days to expiry, counted from today unless a date is given. Pass the date
+    the run started on to keep DTEs consistent for a run that crosses
+    midnight.
+    """
+    dte = contract_date_to_datetime(expiration).date() - (today or date.today())
     return dte.days
+
+
+def option_dtes(
+    expirations: Iterable[str], today: Optional[date] = None
+) -> npt.NDArray[np.int64]:
+    """option_dte() over many expirations at once, as an array."""
+    expiration_dates = np.array(
+        [contract_date_to_datetime(expiration) for expiration in expirations],
+        dtype="datetime64[D]",
+    )
+    return (expiration_dates - np.datetime64(today or date.today(), "D")).astype(
+        np.int64
+    )
+
+
+def sample_strikes(strikes: Sequence[float], count: int) -> List[float]:
+    """Picks count strikes spread evenly across the sorted strikes, always
+    including both ends."""
+    if count >= len(strikes):
+        return list(strikes)
+    if count < 2:
+        return [strikes[len(strikes) // 2]]
+    step = (len(strikes) - 1) / (count - 1)
+    return [strikes[idx] for idx in sorted({round(i * step) for i in range(count)})]
+
+
+def strikes_bracketing_delta(
+    sampled_deltas: Sequence[Tuple[float, float]], target_delta: float
+) -> Tuple[float, float]:
+    """
+    Given (strike, absolute delta) samples sorted by strike, returns the
+    (lowest, highest) strikes of the interval where the delta crosses
+    target_delta. If it never crosses, the interval spans the neighbours of
+    the sample closest to the target (running off the end of the chain when
+    that sample is the first or last one).
+    """
+    for (strike, delta), (next_strike, next_delta) in zip(
+        sampled_deltas, sampled_deltas[1:]
+    ):
+        if min(delta, next_delta) <= target_delta <= max(delta, next_delta):
+            return (strike, next_strike)
+    closest = min(
+        range(len(sampled_deltas)),
+        key=lambda idx: abs(sampled_deltas[idx][1] - target_delta),
+    )
+    return (
+        sampled_deltas[closest - 1][0] if closest > 0 else -math.inf,
+        sampled_deltas[closest + 1][0]
+        if closest + 1 < len(sampled_deltas)
+        else math.inf,
+    )
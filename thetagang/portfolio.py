@@ -0,0 +1,273 @@
+import math
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from ib_async import PortfolioItem
+from ib_async.contract import Option, Stock
+
+from thetagang.options import contract_date_to_datetime, option_dte
+from thetagang.util import match_net_short_positions
+
+RIGHTS = ("P", "C")
+
+
+def _right_key(right: str) -> str:
+    return right.upper()[:1]
+
+
+def _weighted_avg_strike(options: List["PositionRecord"]) -> Optional[float]:
+    num = sum([abs(r.quantity) * r.strike for r in options])
+    den = sum([abs(r.quantity) for r in options])
+    if den > 0:
+        return num / den
+    return None
+
+
+class PositionRecord:
+    """
+    The fields of an IB portfolio item that the calculations and the data
+    store read, copied out once into slots. Reading them is a plain slot
+    lookup rather than a walk through the item and its contract, and an
+    option's expiry is parsed once, into a date ordinal, rather than every
+    time its DTE is needed.
+    """
+
+    __slots__ = (
+        "con_id",
+        "symbol",
+        "sec_type",
+        "right",
+        "strike",
+        "expiry",
+        "expiry_ordinal",
+        "quantity",
+        "avg_cost",
+        "market_price",
+        "market_value",
+        "unrealized_pnl",
+        "realized_pnl",
+        "currency",
+        "exchange",
+        "multiplier",
+    )
+
+    def __init__(
+        self,
+        con_id: Optional[int],
+        symbol: Optional[str],
+        sec_type: Optional[str],
+        right: Optional[str],
+        strike: Optional[float],
+        expiry: Optional[str],
+        expiry_ordinal: Optional[int],
+        quantity: float,
+        avg_cost: Optional[float] = None,
+        market_price: Optional[float] = None,
+        market_value: Optional[float] = None,
+        unrealized_pnl: Optional[float] = None,
+        realized_pnl: Optional[float] = None,
+        currency: Optional[str] = None,
+        exchange: Optional[str] = None,
+        multiplier: Optional[str] = None,
+    ) -> None:
+        self.con_id = con_id
+        self.symbol = symbol
+        self.sec_type = sec_type
+        self.right = right
+        self.strike = strike
+        self.expiry = expiry
+        self.expiry_ordinal = expiry_ordinal
+        self.quantity = quantity
+        self.avg_cost = avg_cost
+        self.market_price = market_price
+        self.market_value = market_value
+        self.unrealized_pnl = unrealized_pnl
+        self.realized_pnl = realized_pnl
+        self.currency = currency
+        self.exchange = exchange
+        self.multiplier = multiplier
+
+    @classmethod
+    def from_portfolio_item(cls, item: PortfolioItem) -> "PositionRecord":
+        """
+        Copies a PortfolioItem. Missing fields are left as None, as the data
+        store has always tolerated them.
+        """
+        contract = getattr(item, "contract", None)
+        expiry = getattr(contract, "lastTradeDateOrContractMonth", None)
+        expiry_ordinal = None
+        if isinstance(contract, Option) and expiry:
+            try:
+                expiry_ordinal = contract_date_to_datetime(expiry).toordinal()
+            except ValueError:
+                pass
+        return cls(
+            con_id=getattr(contract, "conId", None),
+            symbol=getattr(contract, "symbol", None),
+            sec_type=getattr(contract, "secType", None),
+            right=getattr(contract, "right", None),
+            strike=getattr(contract, "strike", None),
+            expiry=expiry,
+            expiry_ordinal=expiry_ordinal,
+            quantity=getattr(item, "position", 0.0),
+            avg_cost=getattr(item, "averageCost", None),
+            market_price=getattr(item, "marketPrice", None),
+            market_value=getattr(item, "marketValue", None),
+            unrealized_pnl=getattr(item, "unrealizedPNL", None),
+            realized_pnl=getattr(item, "realizedPNL", None),
+            currency=getattr(contract, "currency", None),
+            exchange=getattr(contract, "exchange", None),
+            multiplier=getattr(contract, "multiplier", None),
+        )
+
+    def dte(self, today: Optional[date] = None) -> int:
+        if self.expiry_ordinal is None:
+            # Not an expiry we could parse, so let option_dte raise for it
+            return option_dte(self.expiry or "", today)
+        return self.expiry_ordinal - (today or date.today()).toordinal()
+
+    def lot(self, today: Optional[date] = None) -> Tuple[int, float, float]:
+        """The (dte, strike, position) lot that match_net_short_positions
+        takes."""
+        return (self.dte(today), float(self.strike or 0.0), float(self.quantity))
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"PositionRecord({fields})"
+
+
+class SymbolPositions:
+    """
+    The positions held in one symbol, sorted into stock, short options and
+    long options (by right) in a single pass. Each position is also copied
+    into a PositionRecord, which the counts and weighted strikes are worked
+    out from up front, and net short counts on first use, so reading them
+    again costs nothing. The portfolio items themselves are kept for the
+    phases that build orders from them.
+    """
+
+    def __init__(
+        self, positions: List[PortfolioItem], today: Optional[date] = None
+    ) -> None:
+        self.positions = positions
+        self.today = today
+        self.records = [PositionRecord.from_portfolio_item(p) for p in positions]
+        self.stocks: List[PortfolioItem] = []
+        self.short_options: Dict[str, List[PortfolioItem]] = {r: [] for r in RIGHTS}
+        self.long_options: Dict[str, List[PortfolioItem]] = {r: [] for r in RIGHTS}
+        stock_records: List[PositionRecord] = []
+        short_records: Dict[str, List[PositionRecord]] = {r: [] for r in RIGHTS}
+        long_records: Dict[str, List[PositionRecord]] = {r: [] for r in RIGHTS}
+        for position, record in zip(positions, self.records):
+            if isinstance(position.contract, Stock):
+                self.stocks.append(position)
+                stock_records.append(record)
+            elif isinstance(position.contract, Option):
+                right = _right_key(record.right or "")
+                if right not in self.short_options:
+                    continue
+                if record.quantity < 0:
+                    self.short_options[right].append(position)
+                    short_records[right].append(record)
+                elif record.quantity > 0:
+                    self.long_options[right].append(position)
+                    long_records[right].append(record)
+
+        self.stock_quantity = math.floor(sum([r.quantity for r in stock_records]))
+        self.stock_average_costs = [r.avg_cost or 0 for r in stock_records]
+        self.__short_records = short_records
+        self.__long_records = long_records
+        self.__short_counts = {
+            right: math.floor(-sum([r.quantity for r in short_records[right]]))
+            for right in RIGHTS
+        }
+        self.__long_counts = {
+            right: math.floor(sum([r.quantity for r in long_records[right]]))
+            for right in RIGHTS
+        }
+        self.__avg_short_strikes = {
+            right: _weighted_avg_strike(short_records[right]) for right in RIGHTS
+        }
+        self.__avg_long_strikes = {
+            right: _weighted_avg_strike(long_records[right]) for right in RIGHTS
+        }
+        self.__net_short_counts: Dict[str, int] = {}
+
+    @property
+    def stock(self) -> Optional[PortfolioItem]:
+        """The stock position, or the last one listed if there are several."""
+        return self.stocks[-1] if self.stocks else None
+
+    def short_count(self, right: str) -> int:
+        return self.__short_counts[_right_key(right)]
+
+    def long_count(self, right: str) -> int:
+        return self.__long_counts[_right_key(right)]
+
+    def avg_short_strike(self, right: str) -> Optional[float]:
+        return self.__avg_short_strikes[_right_key(right)]
+
+    def avg_long_strike(self, right: str) -> Optional[float]:
+        return self.__avg_long_strikes[_right_key(right)]
+
+    def net_short_count(self, right: str) -> int:
+        """Short contracts left once those covered by a long spread leg are
+        netted off (see calculate_net_short_positions)."""
+        right = _right_key(right)
+        if right not in self.__net_short_counts:
+            self.__net_short_counts[right] = match_net_short_positions(
+                [r.lot(self.today) for r in self.__short_records[right]],
+                [r.lot(self.today) for r in self.__long_records[right]],
+                right,
+            )
+        return self.__net_short_counts[right]
+
+
+class PortfolioIndex:
+    """
+    Per-symbol view of the portfolio positions, built once per run (from
+    get_portfolio_positions) and shared by each phase of manage(), rather than
+    each phase filtering the raw positions again. Symbols without positions
+    read as empty.
+    """
+
+    def __init__(
+        self,
+        portfolio_positions: Dict[str, List[PortfolioItem]],
+        today: Optional[date] = None,
+    ) -> None:
+        self.portfolio_positions = portfolio_positions
+        self.symbols: Dict[str, SymbolPositions] = {
+            symbol: SymbolPositions(positions, today)
+            for symbol, positions in portfolio_positions.items()
+        }
+        self.__empty = SymbolPositions([])
+
+    def __getitem__(self, symbol: str) -> SymbolPositions:
+        return self.symbols.get(symbol, self.__empty)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.symbols
+
+    def stocks(self) -> Dict[str, PortfolioItem]:
+        """Stock position by symbol, for the symbols holding stock."""
+        return {
+            symbol: positions.stocks[-1]
+            for symbol, positions in self.symbols.items()
+            if positions.stocks
+        }
+
+    def short_options(self, right: str) -> List[PortfolioItem]:
+        """Every short option position of the given right, symbol by symbol."""
+        return [
+            position
+            for positions in self.symbols.values()
+            for position in positions.short_options[_right_key(right)]
+        ]
+
+    def records(self) -> Dict[str, List[PositionRecord]]:
+        """The position records, by symbol."""
+        return {
+            symbol: list(positions.records)
+            for symbol, positions in self.symbols.items()
+        }
@@ -1,11 +1,13 @@
 import asyncio
+import inspect
 import logging
 import math
 import random
 import sys
+import time
 from asyncio import Future
 from datetime import date, datetime, timedelta
-from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, TypeVar
 
 import exchange_calendars as xcals
 import numpy as np
@@ -26,41 +28,47 @@ from rich.panel import Panel
 from rich.table import Table
 
 from thetagang import log
+from thetagang.allocation import TargetAllocation
+from thetagang.chain import ChainSnapshot
 from thetagang.config import Config
 from thetagang.db import DataStore
 from thetagang.fmt import dfmt, ffmt, ifmt, pfmt
+from thetagang.greeks import annualized_volatility, strikes_near_target_delta
 from thetagang.ibkr import (
     IBKR,
     IBKRRequestTimeout,
+    MarketDataPriority,
     RequiredFieldValidationError,
     TickerField,
 )
 from thetagang.orders import Orders
+from thetagang.portfolio import PortfolioIndex, PositionRecord
 from thetagang.trades import Trades
 from thetagang.util import (
     account_summary_to_dict,
-    calculate_net_short_positions,
-    count_long_option_positions,
-    count_short_option_positions,
     get_higher_price,
     get_lower_price,
-    get_short_positions,
     get_target_calls,
     midpoint_or_market_price,
     net_option_positions,
     portfolio_positions_to_dict,
     position_pnl,
-    weighted_avg_long_strike,
-    weighted_avg_short_strike,
     would_increase_spread,
 )
 
-from .options import option_dte
+from .options import (
+    option_dte,
+    option_dtes,
+    sample_strikes,
+    strikes_bracketing_delta,
+)
 
 # Turn off some of the more annoying logging output from ib_async
 logging.getLogger("ib_async.ib").setLevel(logging.ERROR)
 logging.getLogger("ib_async.wrapper").setLevel(logging.CRITICAL)
 
+T = TypeVar("T")
+
 
 class NoValidContractsError(Exception):
     def __init__(self, message: str) -> None:
@@ -84,6 +92,7 @@ class PortfolioManager:
         completion_future: Future[bool],
         dry_run: bool,
         data_store: Optional[DataStore] = None,
+        daemon: bool = False,
     ) -> None:
         self.account_number = config.account.number
         self.config = config
@@ -93,6 +102,10 @@ class PortfolioManager:
             config.ib_async.api_response_wait_time,
             config.orders.exchange,
             data_store=data_store,
+            max_market_data_lines=config.ib_async.max_market_data_lines,
+            underlying_ticker_ttl=config.ib_async.underlying_ticker_ttl,
+            option_ticker_ttl=config.ib_async.option_ticker_ttl,
+            exchange_calendar=config.exchange_hours.exchange,
         )
         self.completion_future = completion_future
         self.has_excess_calls: set[str] = set()
@@ -102,8 +115,34 @@ class PortfolioManager:
         self.target_quantities: Dict[str, int] = {}
         self.qualified_contracts: Dict[int, Contract] = {}
         self.dry_run = dry_run
+        self.daemon = daemon
         self.regime_rebalance_order_ref_prefix = "tg:regime-rebalance"
         self.last_untracked_positions: Dict[str, List[PortfolioItem]] = {}
+        self.scanned_chain_tickers: Dict[
+            Tuple[str, str, str, float], Tuple[Optional[Ticker], float]
+        ] = {}
+        self.portfolio_index: Optional[PortfolioIndex] = None
+        # DTEs are counted from the day the run started, even if it runs past
+        # midnight
+        self.today: date = date.today()
+
+    def reset_run_state(self) -> None:
+        """Clear per-run state so manage() can be invoked again on the same
+        connection. Caches held by the IBKR wrapper are left warm, except for
+        quotes, which are only meant to be reused within a run, and contracts
+        that couldn't be qualified or had no open interest reported."""
+        self.ibkr.ticker_cache.clear()
+        self.ibkr.forget_unqualified_contracts()
+        self.ibkr.forget_missing_open_interest()
+        self.has_excess_calls = set()
+        self.has_excess_puts = set()
+        self.orders = Orders()
+        self.trades = Trades(self.ibkr, data_store=self.data_store)
+        self.target_quantities = {}
+        self.last_untracked_positions = {}
+        self.scanned_chain_tickers = {}
+        self.portfolio_index = None
+        self.today = date.today()
 
     def get_short_calls(
         self, portfolio_positions: Dict[str, List[PortfolioItem]]
@@ -136,137 +175,29 @@ class PortfolioManager:
     def get_short_contracts(
         self, portfolio_positions: Dict[str, List[PortfolioItem]], right: str
     ) -> List[PortfolioItem]:
-        ret: List[PortfolioItem] = []
-        for symbol in portfolio_positions:
-            ret = ret + get_short_positions(portfolio_positions[symbol], right)
-        return ret
-
-    async def put_is_itm(self, contract: Contract) -> bool:
-        ticker = await self.ibkr.get_ticker_for_stock(
-            contract.symbol, contract.primaryExchange
-        )
-        return contract.strike >= ticker.marketPrice()
-
-   
-
-    def wait_for_greeks(self, ticker, wait_time):
-        try:
-            wait_n_seconds(
-                lambda: ticker.modelGreeks is None
-                or util.isNan(ticker.modelGreeks.delta),
-                lambda remaining: self.ib.waitOnUpdate(timeout=remaining),
-                wait_time,
-            )
-        except RuntimeError:
-            return False
-        return True
-
-    def wait_for_market_price_for(self, tickers: list[Ticker], wait_time):
-        try:
-            wait_n_seconds(
-                lambda: any(util.isNan(ticker.marketPrice()) for ticker in tickers),
-                lambda remaining: self.ib.waitOnUpdate(timeout=remaining),
-                wait_time,
-            )
-        except RuntimeError:
-            return False
-        return True
-
-    def wait_for_greeks_for(self, tickers: list[Ticker], wait_time):
-        try:
-            wait_n_seconds(
-                lambda: any(
-                    ticker.modelGreeks is None
-                    or ticker.modelGreeks.delta is None
-                    or util.isNan(ticker.modelGreeks.delta)
-                    for ticker in tickers
-                ),
-                lambda remaining: self.ib.waitOnUpdate(timeout=remaining),
-                wait_time,
-            )
-        except RuntimeError:
-            return False
-        return True
-
-    def wait_for_open_interest_for(self, tickers: list[Ticker], wait_time):
-        def open_interest_is_not_ready(ticker):
-            if ticker.contract.right.startswith("P"):
-                print(ticker.contract)
-                print(ticker.marketPrice())
-                return util.isNan(ticker.putOpenInterest)
-            return util.isNan(ticker.callOpenInterest)
-
-        try:
-            print("wait_time" + str(wait_time))
-            wait_n_seconds(
-                lambda: any(open_interest_is_not_ready(ticker) for ticker in tickers),
-                lambda remaining: self.ib.waitOnUpdate(timeout=remaining),
-                wait_time,
-            )
-        except RuntimeError:
-            console.print(
-                f"Timeout waiting on market data for contracts="
-                f"{[ticker.contract for ticker in tickers if open_interest_is_not_ready(ticker)]}, continuing...",
-            )
-            return False
-        finally:
-            for ticker in tickers:
-                if open_interest_is_not_ready(ticker):
-                    self.ib.cancelMktData(ticker.contract)
-
-    @lru_cache(maxsize=32)
-    def get_chains_for_contract(self, contract):
-        return self.ib.reqSecDefOptParams(
-            contract.symbol, "", contract.secType, contract.conId
-        )
+        return self.get_portfolio_index(portfolio_positions).short_options(right)
 
-    @lru_cache(maxsize=32)
-    def get_ticker_for_stock(
-        self, symbol, primary_exchange, order_exchange=None
-    ) -> Ticker:
-        stock = Stock(
-            symbol,
-            order_exchange or self.get_order_exchange(),
-            currency="USD",
-            primaryExchange=primary_exchange,
+    def get_portfolio_index(
+        self, portfolio_positions: Dict[str, List[PortfolioItem]]
+    ) -> PortfolioIndex:
+        """Returns the index of portfolio_positions, which is only built again
+        if they aren't the positions it was built from."""
+        if (
+            self.portfolio_index is None
+            or self.portfolio_index.portfolio_positions is not portfolio_positions
+        ):
+            self.portfolio_index = PortfolioIndex(portfolio_positions, self.today)
+        return self.portfolio_index
+
+    async def put_is_itm(
+        self, contract: Contract, underlying_ticker: Optional[Ticker] = None
+    ) -> bool:
+        ticker = underlying_ticker or await self.ibkr.get_ticker_for_stock(
+            contract.symbol, contract.primaryExchange, snapshot=True
         )
-        self.ib.qualifyContracts(stock)
-        return self.get_ticker_for(stock)
-
-    @lru_cache(maxsize=32)
-    def get_ticker_for(self, contract, midpoint=False) -> Ticker:
-        [ticker] = self.ib.reqTickers(contract)
-
-        if midpoint:
-            self.wait_for_midpoint_price(
-                ticker, wait_time=self.api_response_wait_time()
-            )
-        else:
-            self.wait_for_market_price(ticker, wait_time=self.api_response_wait_time())
-
-        return ticker
-
-    @lru_cache(maxsize=32)
-    def get_ticker_list_for(self, contracts) -> list[Ticker]:
-        ticker_list = self.ib.reqTickers(*contracts)
-
-        try:
-            wait_n_seconds(
-                lambda: any([util.isNan(t.midpoint()) for t in ticker_list]),
-                lambda remaining: self.ib.waitOnUpdate(timeout=remaining),
-                self.api_response_wait_time(),
-            )
-        except RuntimeError:
-            pass
-
-        return ticker_list
-
-    def put_is_itm(self, contract):
-        ticker = self.get_ticker_for_stock(contract.symbol, contract.primaryExchange)
-
         return contract.strike >= ticker.marketPrice()
 
- def position_can_be_closed(self, position: PortfolioItem, table: Table) -> bool:
+    def position_can_be_closed(self, position: PortfolioItem, table: Table) -> bool:
         if not self.config.trading_is_allowed(position.contract.symbol):
             return False
         close_at_pnl = self.config.roll_when.close_at_pnl
@@ -335,7 +266,7 @@ class PortfolioManager:
             )
             return False
 
-        dte = option_dte(put.contract.lastTradeDateOrContractMonth)
+        dte = option_dte(put.contract.lastTradeDateOrContractMonth, self.today)
         pnl = position_pnl(put)
 
         roll_when_dte = self.config.roll_when.dte
@@ -380,10 +311,12 @@ class PortfolioManager:
         # Special case for handling VIX
         if contract.symbol == "VIX":
             vix_contract = Index("VIX", "CBOE", "USD")
-            ticker = await self.ibkr.get_ticker_for_contract(vix_contract)
+            ticker = await self.ibkr.get_ticker_for_contract(
+                vix_contract, snapshot=True
+            )
         else:
             ticker = await self.ibkr.get_ticker_for_stock(
-                contract.symbol, contract.primaryExchange
+                contract.symbol, contract.primaryExchange, snapshot=True
             )
         return contract.strike <= ticker.marketPrice()
 
@@ -431,7 +364,7 @@ class PortfolioManager:
             )
             return False
 
-        dte = option_dte(call.contract.lastTradeDateOrContractMonth)
+        dte = option_dte(call.contract.lastTradeDateOrContractMonth, self.today)
         pnl = position_pnl(call)
 
         roll_when_dte = self.config.roll_when.dte
@@ -503,6 +436,11 @@ class PortfolioManager:
         return (tracked_positions, untracked_positions)
 
     async def get_portfolio_positions(self) -> Dict[str, List[PortfolioItem]]:
+        portfolio_positions = await self.load_portfolio_positions()
+        self.portfolio_index = PortfolioIndex(portfolio_positions, self.today)
+        return portfolio_positions
+
+    async def load_portfolio_positions(self) -> Dict[str, List[PortfolioItem]]:
         attempts = 3
         symbols = set(self.get_symbols())
         self.last_untracked_positions = {}
@@ -686,14 +624,11 @@ class PortfolioManager:
         untracked_positions = self.last_untracked_positions
         if self.data_store:
             self.data_store.record_account_snapshot(account_summary)
-            combined_positions: Dict[str, List[PortfolioItem]] = dict(
-                portfolio_positions
-            )
+            combined_positions = self.get_portfolio_index(portfolio_positions).records()
             for symbol, positions in untracked_positions.items():
-                if symbol in combined_positions:
-                    combined_positions[symbol].extend(positions)
-                else:
-                    combined_positions[symbol] = positions
+                combined_positions.setdefault(symbol, []).extend(
+                    PositionRecord.from_portfolio_item(p) for p in positions
+                )
             self.data_store.record_positions_snapshot(combined_positions)
 
         position_values: Dict[int, Dict[str, str]] = {}
@@ -734,7 +669,7 @@ class PortfolioManager:
                     pos.contract.strike
                 )
                 position_values[pos.contract.conId]["dte"] = str(
-                    option_dte(pos.contract.lastTradeDateOrContractMonth)
+                    option_dte(pos.contract.lastTradeDateOrContractMonth, self.today)
                 )
                 position_values[pos.contract.conId]["exp"] = str(
                     pos.contract.lastTradeDateOrContractMonth
@@ -775,7 +710,7 @@ class PortfolioManager:
             sorted_positions = sorted(
                 positions,
                 key=lambda p: (
-                    option_dte(p.contract.lastTradeDateOrContractMonth)
+                    option_dte(p.contract.lastTradeDateOrContractMonth, self.today)
                     if isinstance(p.contract, Option)
                     else -1
                 ),  # Keep stonks on top
@@ -836,6 +771,7 @@ class PortfolioManager:
 
     async def manage(self) -> None:
         had_error = False
+        self.reset_run_state()
         try:
             if self.data_store:
                 self.data_store.record_event("run_start", {"dry_run": self.dry_run})
@@ -955,7 +891,10 @@ class PortfolioManager:
 
                 await self.ibkr.wait_for_submitting_orders(self.trades.records())
 
-            log.info("ThetaGang is done, shutting down! Cya next time. :sparkles:")
+            if self.daemon:
+                log.info("ThetaGang run complete, waiting for the next one. :sparkles:")
+            else:
+                log.info("ThetaGang is done, shutting down! Cya next time. :sparkles:")
         except:
             had_error = True
             log.error("ThetaGang terminated with error...")
@@ -963,9 +902,12 @@ class PortfolioManager:
 
         finally:
             # Shut it down
+            self.ibkr.release_all_tickers()
+            self.ibkr.ticker_cache.log_stats()
             if self.data_store:
                 self.data_store.record_event("run_end", {"success": not had_error})
-            self.completion_future.set_result(True)
+            if not self.daemon:
+                self.completion_future.set_result(True)
 
     async def check_puts(
         self, portfolio_positions: Dict[str, List[PortfolioItem]]
@@ -1064,14 +1006,14 @@ class PortfolioManager:
         symbol: str,
         primary_exchange: str,
         account_summary: Dict[str, AccountValue],
+        underlying_ticker: Optional[Ticker] = None,
     ) -> int:
         total_buying_power = self.get_buying_power(account_summary)
         max_buying_power = (
             self.config.target.maximum_new_contracts_percent * total_buying_power
         )
-        ticker = await self.ibkr.get_ticker_for_stock(
-            symbol,
-            primary_exchange,
+        ticker = underlying_ticker or await self.ibkr.get_ticker_for_stock(
+            symbol, primary_exchange, snapshot=True
         )
         price = midpoint_or_market_price(ticker)
 
@@ -1090,35 +1032,25 @@ class PortfolioManager:
 
         to_write: List[Tuple[str, str, int, int]] = []
         symbols = set(self.get_symbols())
+        portfolio_index = self.get_portfolio_index(portfolio_positions)
 
         async def update_to_write_task(symbol: str) -> None:
             if symbol not in symbols:
                 # skip positions we don't care about
                 return
+            positions = portfolio_index[symbol]
             short_call_count = (
-                calculate_net_short_positions(portfolio_positions[symbol], "C")
+                positions.net_short_count("C")
                 if calculate_net_contracts
-                else count_short_option_positions(portfolio_positions[symbol], "C")
-            )
-            stock_count = math.floor(
-                sum(
-                    [
-                        p.position
-                        for p in portfolio_positions[symbol]
-                        if isinstance(p.contract, Stock)
-                    ]
-                )
+                else positions.short_count("C")
             )
+            stock_count = positions.stock_quantity
             strike_limit = math.ceil(
                 max(
                     [
                         self.config.get_strike_limit(symbol, "C") or 0,
                     ]
-                    + [
-                        p.averageCost or 0
-                        for p in portfolio_positions[symbol]
-                        if isinstance(p.contract, Stock)
-                    ]
+                    + positions.stock_average_costs
                 )
             )
 
@@ -1298,52 +1230,34 @@ class PortfolioManager:
         return (call_actions_table, to_write)
 
     async def write_calls(self, calls: List[Any]) -> None:
-        for symbol, primary_exchange, quantity, strike_limit in calls:
-            try:
-                sell_ticker = await self.find_eligible_contracts(
-                    Stock(
-                        symbol,
-                        self.get_order_exchange(),
-                        currency="USD",
-                        primaryExchange=primary_exchange,
-                    ),
-                    "C",
-                    strike_limit,
-                    minimum_price=lambda: self.config.orders.minimum_credit,
-                )
-            except (RuntimeError, NoValidContractsError):
-                log.error(
-                    f"{symbol}: Finding eligible contracts failed. Continuing anyway..."
-                )
-                continue
-
-            # Create order
-            order = LimitOrder(
-                "SELL",
-                quantity,
-                round(get_higher_price(sell_ticker), 2),
-                algoStrategy=self.get_algo_strategy(),
-                algoParams=self.get_algo_params(),
-                tif="DAY",
-                account=self.account_number,
-            )
-
-            # Enqueue order
-            self.enqueue_order(sell_ticker.contract, order)
+        await self.write_options("C", calls)
 
     async def write_puts(
         self, puts: List[Tuple[str, str, int, Optional[float]]]
     ) -> None:
-        for symbol, primary_exchange, quantity, strike_limit in puts:
+        await self.write_options("P", puts)
+
+    async def write_options(
+        self, right: str, to_write: List[Tuple[str, str, int, Optional[float]]]
+    ) -> None:
+        """
+        Finds a contract to write for each symbol and enqueues the orders. The
+        chain scans run concurrently (see run_chain_scans), but orders are
+        enqueued in the same order as to_write.
+        """
+
+        async def find_contract(
+            symbol: str, primary_exchange: str, strike_limit: Optional[float]
+        ) -> Optional[Ticker]:
             try:
-                sell_ticker = await self.find_eligible_contracts(
+                return await self.find_eligible_contracts(
                     Stock(
                         symbol,
                         self.get_order_exchange(),
                         currency="USD",
                         primaryExchange=primary_exchange,
                     ),
-                    "P",
+                    right,
                     strike_limit,
                     minimum_price=lambda: self.config.orders.minimum_credit,
                 )
@@ -1351,6 +1265,24 @@ class PortfolioManager:
                 log.error(
                     f"{symbol}: Finding eligible contracts failed. Continuing anyway..."
                 )
+                return None
+            except Exception as e:
+                # Anything else (a quote missing required fields, a contract
+                # that won't qualify) only costs this symbol its order
+                log.error(
+                    f"{symbol}: Finding eligible contracts failed: {e}. Continuing anyway..."
+                )
+                return None
+
+        sell_tickers = await self.run_chain_scans(
+            [
+                find_contract(symbol, primary_exchange, strike_limit)
+                for symbol, primary_exchange, _, strike_limit in to_write
+            ]
+        )
+
+        for (_, _, quantity, _), sell_ticker in zip(to_write, sell_tickers):
+            if sell_ticker is None:
                 continue
 
             # Create order
@@ -1367,6 +1299,49 @@ class PortfolioManager:
             # Enqueue order
             self.enqueue_order(sell_ticker.contract, order)
 
+    def chain_scan_concurrency(self) -> int:
+        """
+        How many chain scans may run at once: the configured maximum, capped
+        at the number of scans needed to fill the market data line budget.
+        Lines beyond the budget are queued by the market data scheduler, so
+        this only keeps scans from piling up behind each other.
+        """
+        option_chains = self.config.option_chains
+        strikes = (
+            option_chains.delta_prefilter_strikes
+            if option_chains.delta_prefilter
+            else option_chains.strikes
+        )
+        lines_per_scan = max(1, option_chains.expirations * strikes)
+        lines = self.config.ib_async.max_market_data_lines
+        return max(
+            1,
+            min(option_chains.max_concurrent_scans, math.ceil(lines / lines_per_scan)),
+        )
+
+    async def run_chain_scans(self, scans: List[Coroutine[Any, Any, T]]) -> List[T]:
+        """Runs the scans concurrently, at most chain_scan_concurrency() at a
+        time, returning their results in the same order as scans. If one
+        fails, the others are cancelled before the error is raised."""
+        semaphore = asyncio.Semaphore(self.chain_scan_concurrency())
+
+        async def run(scan: Coroutine[Any, Any, T]) -> T:
+            async with semaphore:
+                return await scan
+
+        futures = [asyncio.ensure_future(run(scan)) for scan in scans]
+        try:
+            return list(await asyncio.gather(*futures))
+        finally:
+            # If we're cancelled (or one of the scans fails), don't leave the
+            # rest running in the background, holding market data lines
+            for future in futures:
+                future.cancel()
+            for scan in scans:
+                # Scans still waiting for the semaphore were never started
+                if inspect.getcoroutinestate(scan) == inspect.CORO_CREATED:
+                    scan.close()
+
     def get_primary_exchange(self, symbol: str) -> str:
         return self.config.symbols[symbol].primary_exchange
 
@@ -1376,6 +1351,56 @@ class PortfolioManager:
             * self.config.account.margin_usage
         )
 
+    async def get_stock_tickers(
+        self, symbols: List[str], description: str
+    ) -> Dict[str, Ticker]:
+        """Stock quotes for each of the symbols, fetched concurrently."""
+        tickers: Dict[str, Ticker] = {}
+
+        async def get_ticker_task(symbol: str) -> None:
+            tickers[symbol] = await self.ibkr.get_ticker_for_stock(
+                symbol, self.get_primary_exchange(symbol)
+            )
+
+        tasks: List[Coroutine[Any, Any, None]] = [
+            get_ticker_task(symbol) for symbol in symbols
+        ]
+        await log.track_async(tasks, description=description)
+        return tickers
+
+    def get_target_allocation(
+        self,
+        prices: Dict[str, float],
+        stock_symbols: Dict[str, PortfolioItem],
+        total_value: float,
+        round_to_cents: bool = True,
+    ) -> TargetAllocation:
+        """
+        Targets for each symbol priced in prices, from its configured weight
+        of total_value and the stock held in it, worked out for all of them at
+        once (see TargetAllocation).
+        """
+        symbols = list(prices.keys())
+        return TargetAllocation(
+            symbols,
+            np.fromiter(
+                (self.config.symbols[symbol].weight for symbol in symbols),
+                dtype=np.float64,
+                count=len(symbols),
+            ),
+            np.fromiter(prices.values(), dtype=np.float64, count=len(symbols)),
+            np.fromiter(
+                (
+                    stock_symbols[symbol].position if symbol in stock_symbols else 0
+                    for symbol in symbols
+                ),
+                dtype=np.float64,
+                count=len(symbols),
+            ),
+            total_value,
+            round_to_cents=round_to_cents,
+        )
+
     def format_weight_info(
         self,
         symbol: str,
@@ -1417,31 +1442,19 @@ class PortfolioManager:
         account_summary: Dict[str, AccountValue],
         portfolio_positions: Dict[str, List[PortfolioItem]],
     ) -> Tuple[Table, Table, List[Tuple[str, str, int, Optional[float]]]]:
-        # Get stock positions
-        stock_positions = [
-            position
-            for symbol in portfolio_positions
-            for position in portfolio_positions[symbol]
-            if isinstance(position.contract, Stock)
-        ]
+        portfolio_index = self.get_portfolio_index(portfolio_positions)
+        stock_symbols = portfolio_index.stocks()
 
         total_buying_power = self.get_buying_power(account_summary)
 
-        stock_symbols: Dict[str, PortfolioItem] = dict()
-        for stock in stock_positions:
-            symbol = stock.contract.symbol
-            stock_symbols[symbol] = stock
-
         # Track position market values (excluding VIX and cash fund) for reporting
         position_values: Dict[str, float] = dict()
-        for stock in stock_positions:
-            symbol = stock.contract.symbol
+        for symbol, stock in stock_symbols.items():
             # Exclude VIX and cash fund from portfolio value calculation
             if symbol != "VIX" and symbol != self.config.cash_management.cash_fund:
                 value = stock.marketValue
                 position_values[symbol] = value
 
-        targets: Dict[str, float] = dict()
         target_additional_quantity: Dict[str, Dict[str, int | bool]] = dict()
 
         calculate_net_contracts = self.config.write_when.calculate_net_contracts
@@ -1470,68 +1483,61 @@ class PortfolioManager:
         put_actions_table.add_column("Action")
         put_actions_table.add_column("Detail")
 
-        async def calculate_target_position_task(symbol: str) -> None:
-            ticker = await self.ibkr.get_ticker_for_stock(
-                symbol, self.get_primary_exchange(symbol)
-            )
-
-            current_position = math.floor(
-                stock_symbols[symbol].position if symbol in stock_symbols else 0
-            )
+        tickers = await self.get_stock_tickers(
+            list(self.config.symbols.keys()), "Fetching stock prices..."
+        )
+        prices: Dict[str, float] = {}
+        for symbol in self.config.symbols.keys():
+            ticker = tickers[symbol]
+            market_price = ticker.marketPrice()
+            if not market_price or math.isnan(market_price) or market_price <= 0:
+                # Fall back to the last trade or previous close when the
+                # live quote hasn't arrived yet
+                for fallback_price in (ticker.last, ticker.close):
+                    if fallback_price and not util.isNan(fallback_price):
+                        market_price = fallback_price
+                        break
+            if (
+                not market_price
+                or math.isnan(market_price)
+                or math.isclose(market_price, 0)
+                or market_price < 0
+            ):
+                log.error(
+                    f"Invalid market price for {symbol} (market_price={market_price}), skipping for now"
+                )
+                continue
+            prices[symbol] = market_price
+        allocation = self.get_target_allocation(
+            prices, stock_symbols, total_buying_power
+        )
 
-            targets[symbol] = round(
-                self.config.symbols[symbol].weight * total_buying_power, 2
-            )
-            print("symbol:" + str(symbol))
-            print("targets[symbol]:" + str(targets[symbol]))
-            print(ticker)
-            print("ticker.marketPrice():" + str(ticker.marketPrice()))
-            target_quantity = math.floor(targets[symbol] / ticker.marketPrice())
+        async def calculate_target_position_task(symbol: str) -> None:
+            ticker = tickers[symbol]
+            target = allocation[symbol]
+            current_position = target.current_shares
+            self.target_quantities[symbol] = target.target_shares
 
             # Track current position value if not already calculated
             if symbol not in position_values:
-                position_values[symbol] = current_position * market_price
+                position_values[symbol] = target.current_value
+
+            # Symbols without positions read as empty from the index
+            positions = portfolio_index[symbol]
+            # Current number of puts
+            net_short_put_count = short_put_count = positions.short_count("P")
+            short_put_avg_strike = positions.avg_short_strike("P")
+            long_put_count = positions.long_count("P")
+            long_put_avg_strike = positions.avg_long_strike("P")
+            # Current number of calls
+            net_short_call_count = short_call_count = positions.short_count("C")
+            short_call_avg_strike = positions.avg_short_strike("C")
+            long_call_count = positions.long_count("C")
+            long_call_avg_strike = positions.avg_long_strike("C")
 
-            if symbol in portfolio_positions:
-                # Current number of puts
-                net_short_put_count = short_put_count = count_short_option_positions(
-                    portfolio_positions[symbol], "P"
-                )
-                short_put_avg_strike = weighted_avg_short_strike(
-                    portfolio_positions[symbol], "P"
-                )
-                long_put_count = count_long_option_positions(
-                    portfolio_positions[symbol], "P"
-                )
-                long_put_avg_strike = weighted_avg_long_strike(
-                    portfolio_positions[symbol], "P"
-                )
-                # Current number of calls
-                net_short_call_count = short_call_count = count_short_option_positions(
-                    portfolio_positions[symbol], "C"
-                )
-                short_call_avg_strike = weighted_avg_short_strike(
-                    portfolio_positions[symbol], "C"
-                )
-                long_call_count = count_long_option_positions(
-                    portfolio_positions[symbol], "C"
-                )
-                long_call_avg_strike = weighted_avg_long_strike(
-                    portfolio_positions[symbol], "C"
-                )
-
-                if calculate_net_contracts:
-                    net_short_put_count = calculate_net_short_positions(
-                        portfolio_positions[symbol], "P"
-                    )
-                    net_short_call_count = calculate_net_short_positions(
-                        portfolio_positions[symbol], "C"
-                    )
-            else:
-                net_short_put_count = short_put_count = long_put_count = 0
-                short_put_avg_strike = long_put_avg_strike = None
-                net_short_call_count = short_call_count = long_call_count = 0
-                short_call_avg_strike = long_call_avg_strike = None
+            if calculate_net_contracts:
+                net_short_put_count = positions.net_short_count("P")
+                net_short_call_count = positions.net_short_count("C")
 
             # Check if this symbol is in buy-only rebalancing mode
             if self.config.is_buy_only_rebalancing(symbol):
@@ -1558,7 +1564,7 @@ class PortfolioManager:
                     ifmt(short_call_count),
                     ifmt(long_call_count),
                     ifmt(net_short_call_count),
-                    dfmt(targets[symbol]),
+                    dfmt(target.target_value),
                     ifmt(self.target_quantities[symbol]),
                     ifmt(net_target_shares),
                     ifmt(net_target_puts),
@@ -1601,7 +1607,7 @@ class PortfolioManager:
                     ifmt(long_put_count),
                     ifmt(short_call_count),
                     ifmt(long_call_count),
-                    dfmt(targets[symbol]),
+                    dfmt(target.target_value),
                     ifmt(self.target_quantities[symbol]),
                     ifmt(net_target_shares),
                     ifmt(net_target_puts),
@@ -1688,8 +1694,7 @@ class PortfolioManager:
             }
 
         tasks: List[Coroutine[Any, Any, None]] = [
-            calculate_target_position_task(symbol)
-            for symbol in self.config.symbols.keys()
+            calculate_target_position_task(symbol) for symbol in allocation.symbols
         ]
         await log.track_async(tasks, description="Calculating target positions...")
 
@@ -1991,39 +1996,13 @@ class PortfolioManager:
             log.error("Buying power is not positive, skipping rebalancing.")
             raise ValueError("Regime-aware rebalancing requires positive buying power.")
 
-        stock_positions = [
-            position
-            for symbol in portfolio_positions
-            for position in portfolio_positions[symbol]
-            if isinstance(position.contract, Stock)
-        ]
-        stock_symbols: Dict[str, PortfolioItem] = {
-            position.contract.symbol: position for position in stock_positions
-        }
-
-        async def get_ticker_task(symbol: str) -> Tuple[str, Ticker]:
-            ticker = await self.ibkr.get_ticker_for_stock(
-                symbol, self.get_primary_exchange(symbol)
-            )
-            return symbol, ticker
+        stock_symbols = self.get_portfolio_index(portfolio_positions).stocks()
 
-        ticker_tasks: List[Coroutine[Any, Any, Tuple[str, Ticker]]] = [
-            get_ticker_task(symbol) for symbol in symbols
-        ]
-        ticker_results = await log.track_async(
-            ticker_tasks, description="Fetching regime rebalancing prices..."
+        tickers = await self.get_stock_tickers(
+            symbols, "Fetching regime rebalancing prices..."
         )
-        tickers = {symbol: ticker for symbol, ticker in ticker_results}
 
-        current_weights: Dict[str, float] = {}
-        current_positions: Dict[str, int] = {}
-        current_values: Dict[str, float] = {}
         market_prices: Dict[str, float] = {}
-        target_shares: Dict[str, int] = {}
-        target_values: Dict[str, float] = {}
-        relative_ratios: Dict[str, float] = {}
-        relative_drifts: Dict[str, float] = {}
-        share_gaps: Dict[str, int] = {}
         for symbol in symbols:
             ticker = tickers[symbol]
             market_price = ticker.marketPrice()
@@ -2040,20 +2019,21 @@ class PortfolioManager:
                 )
             market_prices[symbol] = market_price
 
-            current_position = math.floor(
-                stock_symbols[symbol].position if symbol in stock_symbols else 0
-            )
-            current_positions[symbol] = current_position
-            current_value = current_position * market_price
-            current_values[symbol] = current_value
-            current_weights[symbol] = current_value / total_value
-            target_weight = self.config.symbols[symbol].weight
-            target_values[symbol] = target_weight * total_value
-            target_shares[symbol] = math.floor(target_values[symbol] / market_price)
-            share_gaps[symbol] = target_shares[symbol] - current_position
-            relative_ratio = current_weights[symbol] / target_weight
-            relative_ratios[symbol] = relative_ratio
-            relative_drifts[symbol] = abs(relative_ratio - 1.0)
+        allocation = self.get_target_allocation(
+            market_prices, stock_symbols, total_value, round_to_cents=False
+        )
+        current_weights: Dict[str, float] = allocation.by_symbol(
+            allocation.current_weights
+        )
+        current_positions: Dict[str, int] = allocation.by_symbol(
+            allocation.current_shares
+        )
+        current_values: Dict[str, float] = allocation.by_symbol(
+            allocation.current_values
+        )
+        target_shares: Dict[str, int] = allocation.by_symbol(allocation.target_shares)
+        target_values: Dict[str, float] = allocation.by_symbol(allocation.target_values)
+        share_gaps: Dict[str, int] = allocation.by_symbol(allocation.share_gaps)
 
         invested_value = sum(current_values.values())
         proxy_symbols = [symbol for symbol in symbols if current_values[symbol] > 0]
@@ -2186,16 +2166,13 @@ class PortfolioManager:
                 last_rebalance, regime_rebalance.cooldown_days
             )
 
-        soft_breach = any(
-            drift + regime_rebalance.eps >= regime_rebalance.soft_band
-            for drift in relative_drifts.values()
-        )
-        hard_breach = any(
-            drift + regime_rebalance.eps >= regime_rebalance.hard_band
-            for drift in relative_drifts.values()
-        )
+        drifts = allocation.relative_drifts + regime_rebalance.eps
+        soft_breach = bool(np.any(drifts >= regime_rebalance.soft_band))
+        hard_breach = bool(np.any(drifts >= regime_rebalance.hard_band))
 
-        max_relative_drift = max(relative_drifts.values()) if relative_drifts else 0.0
+        max_relative_drift = (
+            float(allocation.relative_drifts.max()) if len(allocation) else 0.0
+        )
         hard_rebalance = hard_breach
         ratio_enabled = (
             bool(getattr(ratio_gate, "enabled", False)) if ratio_gate else False
@@ -2671,21 +2648,10 @@ class PortfolioManager:
         portfolio_positions: Dict[str, List[PortfolioItem]],
     ) -> Tuple[Table, List[Tuple[str, str, int]]]:
         """Check which buy-only rebalancing symbols need direct stock purchases."""
-        # Get stock positions
-        stock_positions = [
-            position
-            for symbol in portfolio_positions
-            for position in portfolio_positions[symbol]
-            if isinstance(position.contract, Stock)
-        ]
+        stock_symbols = self.get_portfolio_index(portfolio_positions).stocks()
 
         total_buying_power = self.get_buying_power(account_summary)
 
-        stock_symbols: Dict[str, PortfolioItem] = dict()
-        for stock in stock_positions:
-            symbol = stock.contract.symbol
-            stock_symbols[symbol] = stock
-
         buy_actions_table = Table(title="Buy-only rebalancing summary")
         buy_actions_table.add_column("Symbol")
         buy_actions_table.add_column("Current shares", justify="right")
@@ -2707,19 +2673,12 @@ class PortfolioManager:
         if not buy_only_symbols:
             return (buy_actions_table, to_buy)
 
-        async def check_buy_position_task(symbol: str) -> None:
-            ticker = await self.ibkr.get_ticker_for_stock(
-                symbol, self.get_primary_exchange(symbol)
-            )
-
-            current_position = math.floor(
-                stock_symbols[symbol].position if symbol in stock_symbols else 0
-            )
-
-            target_value = round(
-                self.config.symbols[symbol].weight * total_buying_power, 2
-            )
-            market_price = ticker.marketPrice()
+        tickers = await self.get_stock_tickers(
+            buy_only_symbols, "Fetching buy-only prices..."
+        )
+        prices: Dict[str, float] = {}
+        for symbol in buy_only_symbols:
+            market_price = tickers[symbol].marketPrice()
             if (
                 not market_price
                 or math.isnan(market_price)
@@ -2728,9 +2687,18 @@ class PortfolioManager:
                 log.error(
                     f"Invalid market price for {symbol} (market_price={market_price}), skipping for now"
                 )
-                return
+                continue
+            prices[symbol] = market_price
+        allocation = self.get_target_allocation(
+            prices, stock_symbols, total_buying_power
+        )
 
-            target_shares = math.floor(target_value / market_price)
+        def check_buy_position(symbol: str) -> None:
+            target = allocation[symbol]
+            market_price = target.price
+            current_position = target.current_shares
+            target_value = target.target_value
+            target_shares = target.target_shares
             shares_to_buy = target_shares - current_position
 
             # Check minimum thresholds
@@ -2877,10 +2845,8 @@ class PortfolioManager:
                     "[cyan]At or above target",
                 )
 
-        tasks: List[Coroutine[Any, Any, None]] = [
-            check_buy_position_task(symbol) for symbol in buy_only_symbols
-        ]
-        await log.track_async(tasks, description="Checking buy-only positions...")
+        for symbol in allocation.symbols:
+            check_buy_position(symbol)
 
         return (buy_actions_table, to_buy)
 
@@ -2900,6 +2866,7 @@ class PortfolioManager:
                     stock_contract,
                     required_fields=[],
                     optional_fields=[TickerField.MIDPOINT, TickerField.MARKET_PRICE],
+                    snapshot=True,
                 )
 
                 # Use limit order at midpoint or slightly above ask
@@ -2935,21 +2902,10 @@ class PortfolioManager:
         portfolio_positions: Dict[str, List[PortfolioItem]],
     ) -> Tuple[Table, List[Tuple[str, str, int]]]:
         """Check which sell-only rebalancing symbols need direct stock sales."""
-        # Get stock positions
-        stock_positions = [
-            position
-            for symbol in portfolio_positions
-            for position in portfolio_positions[symbol]
-            if isinstance(position.contract, Stock)
-        ]
+        stock_symbols = self.get_portfolio_index(portfolio_positions).stocks()
 
         total_buying_power = self.get_buying_power(account_summary)
 
-        stock_symbols: Dict[str, PortfolioItem] = dict()
-        for stock in stock_positions:
-            symbol = stock.contract.symbol
-            stock_symbols[symbol] = stock
-
         sell_actions_table = Table(title="Sell-only rebalancing summary")
         sell_actions_table.add_column("Symbol")
         sell_actions_table.add_column("Current shares", justify="right")
@@ -2971,19 +2927,12 @@ class PortfolioManager:
         if not sell_only_symbols:
             return (sell_actions_table, to_sell)
 
-        async def check_sell_position_task(symbol: str) -> None:
-            ticker = await self.ibkr.get_ticker_for_stock(
-                symbol, self.get_primary_exchange(symbol)
-            )
-
-            current_position = math.floor(
-                stock_symbols[symbol].position if symbol in stock_symbols else 0
-            )
-
-            target_value = round(
-                self.config.symbols[symbol].weight * total_buying_power, 2
-            )
-            market_price = ticker.marketPrice()
+        tickers = await self.get_stock_tickers(
+            sell_only_symbols, "Fetching sell-only prices..."
+        )
+        prices: Dict[str, float] = {}
+        for symbol in sell_only_symbols:
+            market_price = tickers[symbol].marketPrice()
             if (
                 not market_price
                 or math.isnan(market_price)
@@ -2992,9 +2941,18 @@ class PortfolioManager:
                 log.error(
                     f"Invalid market price for {symbol} (market_price={market_price}), skipping for now"
                 )
-                return
+                continue
+            prices[symbol] = market_price
+        allocation = self.get_target_allocation(
+            prices, stock_symbols, total_buying_power
+        )
 
-            target_shares = math.floor(target_value / market_price)
+        def check_sell_position(symbol: str) -> None:
+            target = allocation[symbol]
+            market_price = target.price
+            current_position = target.current_shares
+            target_value = target.target_value
+            target_shares = target.target_shares
             shares_to_sell = current_position - target_shares
 
             # Check minimum thresholds
@@ -3083,10 +3041,8 @@ class PortfolioManager:
                     "[cyan]At or below target",
                 )
 
-        tasks: List[Coroutine[Any, Any, None]] = [
-            check_sell_position_task(symbol) for symbol in sell_only_symbols
-        ]
-        await log.track_async(tasks, description="Checking sell-only positions...")
+        for symbol in allocation.symbols:
+            check_sell_position(symbol)
 
         return (sell_actions_table, to_sell)
 
@@ -3108,6 +3064,7 @@ class PortfolioManager:
                     stock_contract,
                     required_fields=[],
                     optional_fields=[TickerField.MIDPOINT, TickerField.MARKET_PRICE],
+                    snapshot=True,
                 )
 
                 # Place sell order near the tape using midpoint with market fallback
@@ -3162,15 +3119,37 @@ class PortfolioManager:
 
     async def close_positions(self, right: str, positions: List[PortfolioItem]) -> None:
         log.notice(f"Close {right} positions...")
-        for position in positions:
+
+        async def get_close_ticker(position: PortfolioItem) -> Optional[Ticker]:
             try:
                 position.contract.exchange = self.get_order_exchange()
-                price = None
-                ticker = await self.ibkr.get_ticker_for_contract(
+                return await self.ibkr.get_ticker_for_contract(
                     position.contract,
                     required_fields=[],
                     optional_fields=[TickerField.MIDPOINT, TickerField.MARKET_PRICE],
+                    snapshot=True,
+                )
+            except Exception as e:
+                # A quote that times out or can't be qualified only holds back
+                # its own close
+                log.error(
+                    f"{position.contract.localSymbol}: Error occurred when trying "
+                    f"to close position: {e}. Continuing anyway..."
                 )
+                return None
+
+        # Quote every position up front, so a batch of closes isn't held up
+        # waiting on each snapshot in turn. IBKR has no multi-contract quote
+        # request (reqTickers sends a snapshot request per contract too), so
+        # this is as batched as it gets.
+        tickers = await asyncio.gather(
+            *(get_close_ticker(position) for position in positions)
+        )
+
+        for position, ticker in zip(positions, tickers):
+            if ticker is None:
+                continue
+            try:
                 is_short = position.position < 0
                 price = (
                     round(get_lower_price(ticker), 2)
@@ -3213,216 +3192,316 @@ class PortfolioManager:
         account_summary: Dict[str, AccountValue],
         portfolio_positions: Optional[Dict[str, List[PortfolioItem]]] = None,
     ) -> List[PortfolioItem]:
-        closeable_positions: List[PortfolioItem] = []
-
+        """
+        Rolls the positions, returning the ones that should be closed instead.
+
+        Positions on different underlyings are rolled concurrently (capped the
+        same way as chain scans), while positions on the same underlying are
+        rolled one after the other. They share one underlying quote, loaded
+        once for the group, and the later ones reuse the chain scan loaded for
+        the first, as scans are kept for the rest of the run (unless
+        option_chains.scan_cache_ttl is set). Orders are enqueued in the same
+        order as positions.
+        """
         log.notice(f"Rolling {right} positions...")
 
+        positions_by_symbol: Dict[str, List[PortfolioItem]] = {}
         for position in positions:
-            try:
-                symbol = position.contract.symbol
+            positions_by_symbol.setdefault(position.contract.symbol, []).append(
+                position
+            )
+        rolls: Dict[int, Tuple[Optional[Tuple[Contract, LimitOrder]], bool]] = {}
 
-                position.contract.exchange = self.get_order_exchange()
-                buy_ticker = await self.ibkr.get_ticker_for_contract(
-                    position.contract,
-                    required_fields=[],
-                    optional_fields=[TickerField.MIDPOINT, TickerField.MARKET_PRICE],
+        async def roll_symbol(
+            symbol: str, symbol_positions: List[PortfolioItem]
+        ) -> None:
+            try:
+                underlying_ticker = await self.get_scan_underlying_ticker(
+                    self.get_roll_underlying(symbol)
                 )
-
-                strike_limit = self.config.get_strike_limit(symbol, right)
-                if right.startswith("C"):
-                    average_cost = (
-                        [
-                            p.averageCost
-                            for p in portfolio_positions[symbol]
-                            if isinstance(p.contract, Stock)
-                        ]
-                        if portfolio_positions and symbol in portfolio_positions
-                        else [0]
-                    )
-                    strike_limit = round(
-                        max([strike_limit or 0] + average_cost),
-                        2,
+            except Exception as e:
+                log.error(
+                    f"{symbol}: Error occurred when trying to roll positions: {e}. Continuing anyway..."
+                )
+                for position in symbol_positions:
+                    rolls[id(position)] = (None, False)
+                return
+            for position in symbol_positions:
+                try:
+                    rolls[id(position)] = await self._roll_position(
+                        position,
+                        right,
+                        account_summary,
+                        portfolio_positions,
+                        underlying_ticker=underlying_ticker,
                     )
-                    if self.config.maintain_high_water_mark(symbol):
-                        strike_limit = max([strike_limit, position.contract.strike])
-
-                elif right.startswith("P"):
-                    strike_limit = round(
-                        min(
-                            [strike_limit or sys.float_info.max]
-                            + [
-                                max(
-                                    [
-                                        position.contract.strike,
-                                        position.contract.strike
-                                        + (
-                                            position.averageCost
-                                            / float(position.contract.multiplier)
-                                        )
-                                        - midpoint_or_market_price(buy_ticker),
-                                    ]
-                                )
-                            ]
-                        ),
-                        2,
+                except Exception as e:
+                    # Only this position misses out on its roll (or close)
+                    log.error(
+                        f"{position.contract.symbol}: Error occurred when trying to roll position: {e}. Continuing anyway..."
                     )
-                    # special case: if we're rolling a put that's ITM, we want to roll to an equal or lower strike, not higher
-                    if isinstance(position.contract, Option) and await self.put_is_itm(
-                        position.contract
-                    ):
-                        strike_limit = min([strike_limit, position.contract.strike])
+                    rolls[id(position)] = (None, False)
 
-                kind = "calls" if right.startswith("C") else "puts"
+        await self.run_chain_scans(
+            [
+                roll_symbol(symbol, symbol_positions)
+                for symbol, symbol_positions in positions_by_symbol.items()
+            ]
+        )
 
-                minimum_price = (
-                    (lambda: self.config.orders.minimum_credit)
-                    if not getattr(self.config.roll_when, kind).credit_only
-                    else (
-                        lambda: midpoint_or_market_price(buy_ticker)
-                        + self.config.orders.minimum_credit
-                    )
-                )
+        closeable_positions: List[PortfolioItem] = []
+        for position in positions:
+            roll, close_instead = rolls[id(position)]
+            if roll:
+                # Enqueue order
+                self.enqueue_order(*roll)
+            elif close_instead:
+                closeable_positions.append(position)
 
-                def fallback_minimum_price() -> float:
-                    return midpoint_or_market_price(buy_ticker)
+        return closeable_positions
 
-                sell_ticker = await self.find_eligible_contracts(
-                    Stock(
-                        symbol,
-                        self.get_order_exchange(),
-                        "USD",
-                        primaryExchange=self.get_primary_exchange(symbol),
-                    ),
-                    right,
-                    strike_limit,
-                    exclude_expirations_before=position.contract.lastTradeDateOrContractMonth,
-                    exclude_exp_strike=(
-                        position.contract.strike,
-                        position.contract.lastTradeDateOrContractMonth,
-                    ),
-                    minimum_price=minimum_price,
-                    fallback_minimum_price=fallback_minimum_price,
-                )
-                if not sell_ticker.contract:
-                    raise RuntimeError(f"Invalid ticker (no contract): {sell_ticker}")
+    def get_roll_underlying(self, symbol: str) -> Stock:
+        return Stock(
+            symbol,
+            self.get_order_exchange(),
+            "USD",
+            primaryExchange=self.get_primary_exchange(symbol),
+        )
 
-                qty_to_roll = math.floor(abs(position.position))
-                maximum_new_contracts = await self.get_maximum_new_contracts_for(
-                    symbol,
-                    self.get_primary_exchange(symbol),
-                    account_summary,
-                )
-                from_dte = option_dte(position.contract.lastTradeDateOrContractMonth)
-                roll_when_dte = self.config.roll_when.dte
-                if from_dte > roll_when_dte:
-                    qty_to_roll = min([qty_to_roll, maximum_new_contracts])
+    async def _roll_position(
+        self,
+        position: PortfolioItem,
+        right: str,
+        account_summary: Dict[str, AccountValue],
+        portfolio_positions: Optional[Dict[str, List[PortfolioItem]]] = None,
+        underlying_ticker: Optional[Ticker] = None,
+    ) -> Tuple[Optional[Tuple[Contract, LimitOrder]], bool]:
+        """Works out the combo order to roll the position, returning it (or
+        None if it can't be rolled) and whether the position should be closed
+        instead. The underlying is quoted here unless a ticker for it is
+        given."""
+        try:
+            symbol = position.contract.symbol
+
+            position.contract.exchange = self.get_order_exchange()
+            buy_ticker = await self.ibkr.get_ticker_for_contract(
+                position.contract,
+                required_fields=[],
+                optional_fields=[TickerField.MIDPOINT, TickerField.MARKET_PRICE],
+            )
 
-                price = midpoint_or_market_price(buy_ticker) - midpoint_or_market_price(
-                    sell_ticker
+            strike_limit = self.config.get_strike_limit(symbol, right)
+            if right.startswith("C"):
+                average_cost = (
+                    self.get_portfolio_index(portfolio_positions)[
+                        symbol
+                    ].stock_average_costs
+                    if portfolio_positions and symbol in portfolio_positions
+                    else [0]
                 )
-                # a buy order should be at most the minimum price, when we expect a credit
-                price = (
-                    min([price, -self.config.orders.minimum_credit])
-                    if getattr(self.config.roll_when, kind).credit_only
-                    else price
+                strike_limit = round(
+                    max([strike_limit or 0] + average_cost),
+                    2,
                 )
+                if self.config.maintain_high_water_mark(symbol):
+                    strike_limit = max([strike_limit, position.contract.strike])
 
-                # Round VIX prices according to contract specifications
-                if position.contract.symbol == "VIX":
-                    price = self.round_vix_price(price)
+            elif right.startswith("P"):
+                strike_limit = round(
+                    min(
+                        [strike_limit or sys.float_info.max]
+                        + [
+                            max(
+                                [
+                                    position.contract.strike,
+                                    position.contract.strike
+                                    + (
+                                        position.averageCost
+                                        / float(position.contract.multiplier)
+                                    )
+                                    - midpoint_or_market_price(buy_ticker),
+                                ]
+                            )
+                        ]
+                    ),
+                    2,
+                )
+                # special case: if we're rolling a put that's ITM, we want to roll to an equal or lower strike, not higher
+                if isinstance(position.contract, Option) and await self.put_is_itm(
+                    position.contract, underlying_ticker
+                ):
+                    strike_limit = min([strike_limit, position.contract.strike])
+
+            kind = "calls" if right.startswith("C") else "puts"
 
-                # store a copy of the contracts so we can retrieve them later by conId
-                self.qualified_contracts[position.contract.conId] = position.contract
-                self.qualified_contracts[sell_ticker.contract.conId] = (
-                    sell_ticker.contract
+            minimum_price = (
+                (lambda: self.config.orders.minimum_credit)
+                if not getattr(self.config.roll_when, kind).credit_only
+                else (
+                    lambda: (
+                        midpoint_or_market_price(buy_ticker)
+                        + self.config.orders.minimum_credit
+                    )
                 )
+            )
 
-                # Create combo legs
-                comboLegs = [
-                    ComboLeg(
-                        conId=position.contract.conId,
-                        ratio=1,
-                        exchange=self.get_order_exchange(),
-                        action="BUY",
-                    ),
-                    ComboLeg(
-                        conId=sell_ticker.contract.conId,
-                        ratio=1,
-                        exchange=self.get_order_exchange(),
-                        action="SELL",
-                    ),
-                ]
+            def fallback_minimum_price() -> float:
+                return midpoint_or_market_price(buy_ticker)
 
-                # Create contract
-                combo = Contract(
-                    secType="BAG",
-                    symbol=symbol,
-                    currency="USD",
+            sell_ticker = await self.find_eligible_contracts(
+                self.get_roll_underlying(symbol),
+                right,
+                strike_limit,
+                exclude_expirations_before=position.contract.lastTradeDateOrContractMonth,
+                exclude_exp_strike=(
+                    position.contract.strike,
+                    position.contract.lastTradeDateOrContractMonth,
+                ),
+                minimum_price=minimum_price,
+                fallback_minimum_price=fallback_minimum_price,
+                underlying_ticker=underlying_ticker,
+            )
+            if not sell_ticker.contract:
+                raise RuntimeError(f"Invalid ticker (no contract): {sell_ticker}")
+
+            qty_to_roll = math.floor(abs(position.position))
+            maximum_new_contracts = await self.get_maximum_new_contracts_for(
+                symbol,
+                self.get_primary_exchange(symbol),
+                account_summary,
+                underlying_ticker,
+            )
+            from_dte = option_dte(
+                position.contract.lastTradeDateOrContractMonth, self.today
+            )
+            roll_when_dte = self.config.roll_when.dte
+            if from_dte > roll_when_dte:
+                qty_to_roll = min([qty_to_roll, maximum_new_contracts])
+
+            price = midpoint_or_market_price(buy_ticker) - midpoint_or_market_price(
+                sell_ticker
+            )
+            # a buy order should be at most the minimum price, when we expect a credit
+            price = (
+                min([price, -self.config.orders.minimum_credit])
+                if getattr(self.config.roll_when, kind).credit_only
+                else price
+            )
+
+            # Round VIX prices according to contract specifications
+            if position.contract.symbol == "VIX":
+                price = self.round_vix_price(price)
+
+            # store a copy of the contracts so we can retrieve them later by conId
+            self.qualified_contracts[position.contract.conId] = position.contract
+            self.qualified_contracts[sell_ticker.contract.conId] = sell_ticker.contract
+
+            # Create combo legs
+            comboLegs = [
+                ComboLeg(
+                    conId=position.contract.conId,
+                    ratio=1,
                     exchange=self.get_order_exchange(),
-                    comboLegs=comboLegs,
-                )
+                    action="BUY",
+                ),
+                ComboLeg(
+                    conId=sell_ticker.contract.conId,
+                    ratio=1,
+                    exchange=self.get_order_exchange(),
+                    action="SELL",
+                ),
+            ]
 
-                # Create order
-                order = LimitOrder(
-                    "BUY",
-                    qty_to_roll,
-                    round(price, 2),
-                    tif="DAY",
-                    account=self.account_number,
-                )
+            # Create contract
+            combo = Contract(
+                secType="BAG",
+                symbol=symbol,
+                currency="USD",
+                exchange=self.get_order_exchange(),
+                comboLegs=comboLegs,
+            )
 
-                to_dte = option_dte(sell_ticker.contract.lastTradeDateOrContractMonth)
-                from_strike = position.contract.strike
-                to_strike = sell_ticker.contract.strike
-                log.info(
-                    f"{symbol}: Rolling from_strike={from_strike} to_strike={to_strike} from_dte={from_dte} to_dte={to_dte} price={dfmt(price, 3)} qty_to_roll={qty_to_roll}"
-                )
+            # Create order
+            order = LimitOrder(
+                "BUY",
+                qty_to_roll,
+                round(price, 2),
+                tif="DAY",
+                account=self.account_number,
+            )
 
-                # Enqueue order
-                self.enqueue_order(combo, order)
-            except NoValidContractsError:
-                dte = option_dte(position.contract.lastTradeDateOrContractMonth)
-                if (
-                    self.config.close_if_unable_to_roll(position.contract.symbol)
-                    and self.config.roll_when.max_dte
-                    and dte <= self.config.roll_when.max_dte
-                    and position_pnl(position) > 0
-                ):
-                    log.warning(
-                        f"{position.contract.symbol}: Unable to find a suitable contract to roll to for {position.contract.localSymbol}. Closing position instead..."
-                    )
-                    closeable_positions.append(position)
-                    continue
-                else:
-                    log.error(
-                        f"{position.contract.symbol}: Error occurred when trying to roll position. Continuing anyway..."
-                    )
-            except RuntimeError:
+            to_dte = option_dte(
+                sell_ticker.contract.lastTradeDateOrContractMonth, self.today
+            )
+            from_strike = position.contract.strike
+            to_strike = sell_ticker.contract.strike
+            log.info(
+                f"{symbol}: Rolling from_strike={from_strike} to_strike={to_strike} from_dte={from_dte} to_dte={to_dte} price={dfmt(price, 3)} qty_to_roll={qty_to_roll}"
+            )
+
+            return ((combo, order), False)
+        except NoValidContractsError:
+            dte = option_dte(position.contract.lastTradeDateOrContractMonth, self.today)
+            if (
+                self.config.close_if_unable_to_roll(position.contract.symbol)
+                and self.config.roll_when.max_dte
+                and dte <= self.config.roll_when.max_dte
+                and position_pnl(position) > 0
+            ):
+                log.warning(
+                    f"{position.contract.symbol}: Unable to find a suitable contract to roll to for {position.contract.localSymbol}. Closing position instead..."
+                )
+                return (None, True)
+            else:
                 log.error(
                     f"{position.contract.symbol}: Error occurred when trying to roll position. Continuing anyway..."
                 )
-                continue
+        except RuntimeError:
+            log.error(
+                f"{position.contract.symbol}: Error occurred when trying to roll position. Continuing anyway..."
+            )
+        return (None, False)
 
-        return closeable_positions
+    async def get_scan_underlying_ticker(self, underlying: Contract) -> Ticker:
+        """
+        Quotes the underlying for a chain scan, along with its implied
+        volatility (generic tick 106) when the chain is pre-filtered by delta.
+        """
+        if self.config.option_chains.delta_prefilter:
+            return await self.ibkr.get_ticker_for_contract(
+                underlying,
+                generic_tick_list="106",
+                optional_fields=[TickerField.MIDPOINT, TickerField.IMPLIED_VOLATILITY],
+                priority=MarketDataPriority.UNDERLYING,
+            )
+        return await self.ibkr.get_ticker_for_contract(
+            underlying, priority=MarketDataPriority.UNDERLYING
+        )
 
     async def find_eligible_contracts(
         self,
-        main_contract,
-        right,
-        strike_limit,
-        exclude_expirations_before=None,
-        exclude_exp_strike=None,
-        minimum_price=0.0,
-        preferred_minimum_price=None,
-        target_dte=None,
-        target_delta=None,
-    ):
-        print(f"Searching for contracts: Type={right}, Strike Limit={strike_limit}, Target DTE={target_dte}, Target Delta={target_delta}")
-        console.print(f"Searching for contracts: Type={right}, Strike Limit={strike_limit}, Target DTE={target_dte}, Target Delta={target_delta}")
-        if not target_dte:
-            target_dte = self.config["target"]["dte"]
-        if not target_delta:
-            target_delta = get_target_delta(self.config, main_contract.symbol, right)
+        underlying: Contract,
+        right: str,
+        strike_limit: Optional[float],
+        minimum_price: Callable[[], float],
+        exclude_expirations_before: Optional[str] = None,
+        exclude_exp_strike: Optional[Tuple[float, str]] = None,
+        fallback_minimum_price: Optional[Callable[[], float]] = None,
+        target_dte: Optional[int] = None,
+        target_delta: Optional[float] = None,
+        underlying_ticker: Optional[Ticker] = None,
+    ) -> Ticker:
+        contract_target_dte: int = (
+            target_dte if target_dte else self.config.get_target_dte(underlying.symbol)
+        )
+        contract_target_delta: float = (
+            target_delta
+            if target_delta
+            else self.config.get_target_delta(underlying.symbol, right)
+        )
+        contract_max_dte = self.config.get_max_dte_for(
+            underlying.symbol,
+        )
 
         log.notice(
             f"{underlying.symbol}: Searching option chain for "
@@ -3432,20 +3511,16 @@ class PortfolioManager:
             f"contract_target_delta={contract_target_delta}, "
             "this can take a while...",
         )
-        with console.status(
-            "[bold blue_violet]Hunting for juicy contracts... 😎"
-        ) as status:
-            print("main_contract:" + str(main_contract))
-            self.ib.qualifyContracts(main_contract)
 
-        underlying_ticker = await self.ibkr.get_ticker_for_contract(underlying)
+        if underlying_ticker is None:
+            underlying_ticker = await self.get_scan_underlying_ticker(underlying)
 
         underlying_price = midpoint_or_market_price(underlying_ticker)
 
         chains = await self.ibkr.get_chains_for_contract(underlying)
 
         # Some option contracts (e.g. IWM) have multiple trading classes; pick the one that matches the underlying exchange and trading class
-        chain = next(
+        matching_chains = [
             c
             for c in chains
             if (
@@ -3455,15 +3530,18 @@ class PortfolioManager:
                 # If we find other cases that need special handling, it might be better to loosen the matching criteria here, i.e. incrementally add filters if more than 1 chain found.
                 and c.tradingClass == underlying.symbol
             )
-            strikes = sorted(strike for strike in chain.strikes if valid_strike(strike))
-            console.print(f"Valid strikes after filtering: {strikes}")
-            expirations = sorted(
-                exp
-                for exp in chain.expirations
-                if option_dte(exp) >= target_dte and option_dte(exp) >= min_dte
-            )[:chain_expirations]
-            rights = [right]
-            console.print(f"Valid expirations after filtering: {expirations}")
+        ]
+        if not matching_chains:
+            raise NoValidContractsError(
+                f"No option chain found for {underlying.symbol}. Continuing anyway...",
+            )
+        # Some symbols (e.g. SPY, QQQ) list extra chains on the same exchange
+        # with only a handful of adjusted strikes, so prefer the widest chain
+        chain = max(matching_chains, key=lambda c: len(c.strikes))
+        log.info(
+            f"{underlying.symbol}: Selected option chain with {len(chain.strikes)} strikes"
+            f" and {len(chain.expirations)} expirations"
+        )
 
         def valid_strike(strike: float) -> bool:
             if right.startswith("P") and strike_limit:
@@ -3478,21 +3556,22 @@ class PortfolioManager:
 
         chain_expirations = self.config.option_chains.expirations
         min_dte = (
-            option_dte(exclude_expirations_before) if exclude_expirations_before else 0
+            option_dte(exclude_expirations_before, self.today)
+            if exclude_expirations_before
+            else 0
         )
         strikes = sorted(strike for strike in chain.strikes if valid_strike(strike))
+        chain_dtes = option_dtes(chain.expirations, self.today)
+        valid_dtes = (chain_dtes >= contract_target_dte) & (chain_dtes >= min_dte)
+        if contract_max_dte:
+            valid_dtes &= chain_dtes <= contract_max_dte
         expirations = sorted(
-            exp
-            for exp in chain.expirations
-            if option_dte(exp) >= contract_target_dte
-            and option_dte(exp) >= min_dte
-            and (not contract_max_dte or option_dte(exp) <= contract_max_dte)
+            exp for exp, valid in zip(chain.expirations, valid_dtes.tolist()) if valid
         )[:chain_expirations]
         if len(expirations) < 1:
             raise NoValidContractsError(
                 f"No valid contract expirations found for {underlying.symbol}. Continuing anyway...",
             )
-        rights = [right]
 
         def nearest_strikes(strikes: List[float]) -> List[float]:
             chain_strikes = self.config.option_chains.strikes
@@ -3500,7 +3579,38 @@ class PortfolioManager:
                 return strikes[-chain_strikes:]
             return strikes[:chain_strikes]
 
-        strikes = nearest_strikes(strikes)
+        volatility = None
+        if self.config.option_chains.delta_prefilter and strikes:
+            volatility = await self.estimate_volatility(
+                underlying_ticker.contract or underlying, underlying_ticker
+            )
+        if volatility:
+            # Only load market data for the strikes whose estimated delta is
+            # near the target, rather than every strike near the money
+            near_target = strikes_near_target_delta(
+                underlying_price,
+                strikes,
+                option_dtes(expirations, self.today),
+                self.config.option_chains.risk_free_rate,
+                volatility,
+                right,
+                contract_target_delta,
+                self.config.option_chains.delta_prefilter_strikes,
+            )
+            strikes_by_expiration = {
+                expiration: [strike for strike, keep in zip(strikes, row_mask) if keep]
+                for expiration, row_mask in zip(expirations, near_target)
+            }
+            strikes = sorted(
+                {strike for row in strikes_by_expiration.values() for strike in row}
+            )
+            log.info(
+                f"{underlying.symbol}: Pre-filtered strikes by estimated delta "
+                f"with volatility={pfmt(volatility, 1)}"
+            )
+        else:
+            strikes = nearest_strikes(strikes)
+            strikes_by_expiration = {expiration: strikes for expiration in expirations}
         if len(strikes) < 1:
             raise NoValidContractsError(
                 f"No valid contract strikes found for {underlying.symbol}. Continuing anyway...",
@@ -3510,187 +3620,355 @@ class PortfolioManager:
             f" from expirations {expirations[0]} to {expirations[-1]}"
         )
 
-        contracts = [
-            Option(
-                underlying.symbol,
-                expiration,
-                strike,
-                right,
-                self.get_order_exchange(),
-                # tradingClass=chain.tradingClass,
-            )
-            for right in rights
-            for expiration in expirations
-            for strike in strikes
-        ]
-
-        contracts = await self.ibkr.qualify_contracts(*contracts)
-
-        # Filter out None values
-        contracts = [c for c in contracts if c is not None]
-
-        # exclude strike, but only for the first exp
-        if exclude_exp_strike:
-            contracts = [
-                c
-                for c in contracts
-                if (
-                    c.lastTradeDateOrContractMonth != exclude_exp_strike[1]
-                    or c.strike != exclude_exp_strike[0]
-                )
-            ]
+        async def filter_remaining(
+            snapshot: ChainSnapshot, delta_ord_desc: bool
+        ) -> ChainSnapshot:
+            minimum_open_interest = self.config.target.minimum_open_interest
 
-            contracts = self.ib.qualifyContracts(*contracts)
-            console.print(f"Qualified contracts from API: {contracts}")
-            # exclude strike, but only for the first exp
-            if exclude_exp_strike:
-                contracts = [
-                    c
-                    for c in contracts
-                    if (
-                        c.lastTradeDateOrContractMonth != exclude_exp_strike[1]
-                        or c.strike != exclude_exp_strike[0]
+            if minimum_open_interest > 0 and len(snapshot) > 0:
+                snapshot.set_open_interest(
+                    await self.ibkr.get_open_interest(
+                        underlying.symbol,
+                        [t.contract for t in snapshot.tickers if t.contract],
+                        today=self.today,
                     )
-                ]
+                )
+                snapshot = snapshot.take(
+                    snapshot.open_interest_is_valid(minimum_open_interest)
+                )
 
-        def delta_is_valid(ticker: Ticker) -> bool:
-            model_greeks = ticker.modelGreeks
-            delta = model_greeks.delta if model_greeks is not None else None
-            return (
-                delta is not None
-                and not util.isNan(delta)
-                and abs(delta) <= contract_target_delta
+            # Sort by expiry date, then by delta
+            return snapshot.ranked(delta_ord_desc)
+
+        async def select_contract(
+            tickers: List[Ticker],
+        ) -> Tuple[Optional[Ticker], bool]:
+            """
+            Picks the contract to trade from the scanned tickers, or None if
+            there isn't one. Also returns whether the choice is settled, i.e.
+            scanning later expirations (which always rank after the ones
+            already scanned) can't change it.
+            """
+            snapshot = ChainSnapshot(tickers, right, self.today)
+
+            # Filter out invalid price
+            snapshot = snapshot.take(
+                snapshot.price_is_valid(minimum_price(), underlying_price)
             )
 
-        def price_is_valid(ticker: Ticker) -> bool:
-            def cost_doesnt_exceed_market_price(ticker: Ticker) -> bool:
-                # when writing puts, we need to be sure that the strike +
-                # credit is less than or equal to the current market price, so
-                # that we don't exceed the target capital allocation for this
-                # position
-                return (
-                    right.startswith("C")
-                    or isinstance(ticker.contract, Option)
-                    and ticker.contract.strike
-                    <= midpoint_or_market_price(ticker) + underlying_price
-                )
+            # Filter out invalid greeks
+            delta_valid = snapshot.delta_is_valid(contract_target_delta)
+            delta_reject_snapshot = snapshot.take(~delta_valid)
+            snapshot = await filter_remaining(snapshot.take(delta_valid), True)
+
+            if len(snapshot) == 0:
+                if not math.isclose(minimum_price(), 0.0):
+                    # if we arrive here, it means that 1) we expect to roll for
+                    # a credit only, but 2) we didn't find any suitable
+                    # contracts, most likely because we can't roll out and
+                    # up/down to the target delta
+                    #
+                    # because of this, we'll allow rolling to a
+                    # less-than-optimal strike, provided it's still a credit
+                    snapshot = await filter_remaining(delta_reject_snapshot, False)
+                if len(snapshot) < 1:
+                    return (None, False)
+                return (snapshot.tickers[0], False)
+
+            if fallback_minimum_price is not None:
+                # if there's a fallback minimum price specified, try to find
+                # contracts that are at least that price first
+                above_fallback = np.flatnonzero(snapshot.mid > fallback_minimum_price())
+                if above_fallback.size > 0:
+                    return (snapshot.tickers[int(above_fallback[0])], True)
+                # uh of, if we make it here then all of these options are
+                # net debits, so let's at least choose the ticker that will
+                # result in the smallest debit (i.e., minimize the max loss)
+                return (snapshot.tickers[int(np.argmax(snapshot.mid))], False)
 
-            return midpoint_or_market_price(
-                ticker
-            ) > minimum_price() and cost_doesnt_exceed_market_price(ticker)
+            # fall back to the first suitable result
+            return (snapshot.tickers[0], True)
 
-        # Filter out invalid price
-        tickers = [
-            ticker
-            for ticker in log.track(
-                tickers,
-                description=f"{underlying.symbol}: Filtering invalid prices...",
-                total=len(tickers),
+        async def scan(strikes_by_expiration: Dict[str, List[float]]) -> List[Ticker]:
+            if self.config.option_chains.two_phase_scan:
+                return await self._scan_chain_in_two_phases(
+                    underlying,
+                    right,
+                    strikes_by_expiration,
+                    contract_target_delta,
+                    exclude_exp_strike,
+                )
+            return await self._scan_chain(
+                underlying, right, strikes_by_expiration, exclude_exp_strike
             )
-            if price_is_valid(ticker)
-        ]
-
-        # Filter out invalid greeks
-        new_tickers = []
-        delta_reject_tickers = []
-        for ticker in log.track(
-            tickers,
-            description=f"{underlying.symbol}: Filtering invalid deltas...",
-            total=len(tickers),
-        ):
-            if delta_is_valid(ticker):
-                new_tickers.append(ticker)
-            else:
-                delta_reject_tickers.append(ticker)
-        tickers = new_tickers
-
-        def filter_remaining_tickers(
-            tickers: List[Ticker], delta_ord_desc: bool
-        ) -> List[Ticker]:
-            minimum_open_interest = self.config.target.minimum_open_interest
 
-            if minimum_open_interest > 0:
-                tickers = [
-                    ticker
-                    for ticker in log.track(
-                        tickers,
-                        description=f"{underlying.symbol}: Filtering by open interest with delta_ord_desc={delta_ord_desc}...",
-                        total=len(tickers),
-                    )
-                    if open_interest_is_valid(ticker, minimum_open_interest)
-                ]
+        async def is_settled(tickers: List[Ticker]) -> bool:
+            _, settled = await select_contract(tickers)
+            return settled
 
-            # Sort by delta first, then expiry date
-            tickers = sorted(
-                sorted(
-                    tickers,
-                    key=lambda t: (
-                        abs(t.modelGreeks.delta)
-                        if t.modelGreeks and t.modelGreeks.delta
-                        else 0
-                    ),
-                    reverse=delta_ord_desc,
-                ),
-                key=lambda t: (
-                    option_dte(t.contract.lastTradeDateOrContractMonth)
-                    if t.contract
-                    else 0
-                ),
+        if self.config.option_chains.streaming_scan:
+            tickers = await self._scan_expirations_until_settled(
+                underlying,
+                strikes_by_expiration,
+                scan,
+                is_settled,
             )
+        else:
+            tickers = await scan(strikes_by_expiration)
 
-            return tickers
-
-        tickers = filter_remaining_tickers(list(tickers), True)
-
-        the_chosen_ticker = None
-
-        if len(tickers) == 0:
-            if not math.isclose(minimum_price(), 0.0):
-                # if we arrive here, it means that 1) we expect to roll for a
-                # credit only, but 2) we didn't find any suitable contracts,
-                # most likely because we can't roll out and up/down to the
-                # target delta
-                #
-                # because of this, we'll allow rolling to a less-than-optimal
-                # strike, provided it's still a credit
-                tickers = filter_remaining_tickers(list(delta_reject_tickers), False)
-            if len(tickers) < 1:
-                # if there are _still_ no tickers remaining, there's nothing
-                # more we can do
-                raise NoValidContractsError(
-                    f"No valid contracts found for {underlying.symbol}. Continuing anyway...",
-                )
-        elif fallback_minimum_price is not None:
-            # if there's a fallback minimum price specified, try to find
-            # contracts that are at least that price first
-            for ticker in tickers:
-                if midpoint_or_market_price(ticker) > fallback_minimum_price():
-                    the_chosen_ticker = ticker
-                    break
-            if the_chosen_ticker is None:
-                # uh of, if we make it here then all of these options are
-                # net debits, so let's at least choose the ticker that will
-                # result in the smallest debit (i.e., minimize the max loss)
-                tickers = sorted(tickers, key=midpoint_or_market_price, reverse=True)
-
+        the_chosen_ticker, _ = await select_contract(tickers)
         if the_chosen_ticker is None:
-            # fall back to the first suitable result
-            the_chosen_ticker = tickers[0]
+            # if there are _still_ no tickers remaining, there's nothing
+            # more we can do
+            raise NoValidContractsError(
+                f"No valid contracts found for {underlying.symbol}. Continuing anyway...",
+            )
 
         if not the_chosen_ticker or not the_chosen_ticker.contract:
             raise RuntimeError(
                 f"{underlying.symbol}: Something went wrong, the_chosen_ticker={the_chosen_ticker}"
             )
+        the_chosen_ticker = await self._requote_scanned_ticker(the_chosen_ticker)
 
         log.notice(
             f"{underlying.symbol}: Found suitable contract at "
             f"strike={the_chosen_ticker.contract.strike} "
-            f"dte={option_dte(the_chosen_ticker.contract.lastTradeDateOrContractMonth)} "
+            f"dte={option_dte(the_chosen_ticker.contract.lastTradeDateOrContractMonth, self.today)} "
             f"price={dfmt(midpoint_or_market_price(the_chosen_ticker), 3)}"
         )
 
         return the_chosen_ticker
 
+    async def _scan_chain(
+        self,
+        underlying: Contract,
+        right: str,
+        strikes_by_expiration: Dict[str, List[float]],
+        exclude_exp_strike: Optional[Tuple[float, str]] = None,
+    ) -> List[Ticker]:
+        """
+        Loads market data for the given strikes of each expiration, returning
+        the tickers in the same order. Contracts already scanned earlier in
+        the run (or within option_chains.scan_cache_ttl seconds, if set) are
+        reused rather than subscribed to again.
+        """
+        keys = [
+            (underlying.symbol, right, expiration, strike)
+            for expiration, strikes in strikes_by_expiration.items()
+            for strike in strikes
+            # exclude strike, but only for the first exp
+            if not exclude_exp_strike
+            or expiration != exclude_exp_strike[1]
+            or strike != exclude_exp_strike[0]
+        ]
+        now = time.monotonic()
+        ttl = self.config.option_chains.scan_cache_ttl
+
+        def is_cached(key: Tuple[str, str, str, float]) -> bool:
+            cached = self.scanned_chain_tickers.get(key)
+            if cached is None:
+                return False
+            return ttl is None or (ttl > 0 and now - cached[1] <= ttl)
+
+        missing = [key for key in keys if not is_cached(key)]
+        if missing:
+            options = [
+                Option(
+                    symbol,
+                    expiration,
+                    strike,
+                    right,
+                    self.get_order_exchange(),
+                    # tradingClass=chain.tradingClass,
+                )
+                for symbol, right, expiration, strike in missing
+            ]
+
+            contracts = await self.ibkr.qualify_contracts(*options)
+
+            # Filter out None values
+            contracts = [c for c in contracts if c is not None]
+
+            # Tickers are stored under the key each contract was requested
+            # with, not one rebuilt from the ticker, as IBKR may write the
+            # expiry differently. Qualification updates the contracts in
+            # place, so they're matched back by conId (or by identity, for
+            # contracts without one). Any returned as new objects can only be
+            # keyed by their own fields
+            key_by_option = {id(option): key for option, key in zip(options, missing)}
+            key_by_id: Dict[int, Tuple[str, str, str, float]] = {}
+            key_by_con_id: Dict[int, Tuple[str, str, str, float]] = {}
+            for contract in contracts:
+                key = key_by_option.get(
+                    id(contract),
+                    (
+                        underlying.symbol,
+                        right,
+                        contract.lastTradeDateOrContractMonth,
+                        contract.strike,
+                    ),
+                )
+                key_by_id[id(contract)] = key
+                if contract.conId:
+                    key_by_con_id[contract.conId] = key
+
+            # Open interest is loaded separately, only for the contracts that
+            # make it past the price and delta filters
+            tickers = await self.ibkr.get_tickers_for_contracts(
+                underlying.symbol,
+                contracts,
+                required_fields=[],
+                optional_fields=[
+                    TickerField.MARKET_PRICE,
+                    TickerField.GREEKS,
+                    TickerField.MIDPOINT,
+                ],
+            )
+
+            # Contracts that couldn't be qualified are remembered as misses
+            scanned_at = time.monotonic()
+            for key in missing:
+                self.scanned_chain_tickers[key] = (None, scanned_at)
+            for ticker in tickers:
+                if not ticker.contract:
+                    continue
+                key = key_by_con_id.get(ticker.contract.conId) or key_by_id.get(
+                    id(ticker.contract)
+                )
+                if key:
+                    self.scanned_chain_tickers[key] = (ticker, scanned_at)
+
+        return [
+            ticker
+            for ticker, _ in (self.scanned_chain_tickers[key] for key in keys)
+            if ticker is not None
+        ]
+
+    async def _requote_scanned_ticker(self, ticker: Ticker) -> Ticker:
+        """
+        Scanned tickers are reused for the rest of the run, but orders are
+        priced from the chosen one, so it's quoted again unless it was scanned
+        within the option ticker TTL.
+        """
+        for key, (scanned, scanned_at) in self.scanned_chain_tickers.items():
+            if scanned is ticker:
+                break
+        else:
+            return ticker
+        if (
+            not ticker.contract
+            or time.monotonic() - scanned_at <= self.config.ib_async.option_ticker_ttl
+        ):
+            return ticker
+
+        fresh = await self.ibkr.get_ticker_for_contract(
+            ticker.contract,
+            required_fields=[],
+            optional_fields=[
+                TickerField.MARKET_PRICE,
+                TickerField.GREEKS,
+                TickerField.MIDPOINT,
+            ],
+        )
+        self.scanned_chain_tickers[key] = (fresh, time.monotonic())
+        return fresh
+
+    async def _scan_expirations_until_settled(
+        self,
+        underlying: Contract,
+        strikes_by_expiration: Dict[str, List[float]],
+        scan: Callable[[Dict[str, List[float]]], Coroutine[Any, Any, List[Ticker]]],
+        is_settled: Callable[[List[Ticker]], Coroutine[Any, Any, bool]],
+    ) -> List[Ticker]:
+        """
+        Scans every expiration at once, but consumes the results nearest
+        expiration first, and stops as soon as is_settled() says the tickers
+        gathered so far are enough. Scans of the remaining expirations are
+        then cancelled, which releases their market data lines.
+        """
+        scans = [
+            asyncio.ensure_future(scan({expiration: strikes}))
+            for expiration, strikes in strikes_by_expiration.items()
+        ]
+        tickers: List[Ticker] = []
+        try:
+            for expiration, expiration_scan in zip(strikes_by_expiration, scans):
+                tickers += await expiration_scan
+                if await is_settled(tickers):
+                    log.info(
+                        f"{underlying.symbol}: Found a suitable contract expiring"
+                        f" {expiration}, skipping later expirations"
+                    )
+                    break
+        finally:
+            pending = [s for s in scans if not s.done()]
+            for pending_scan in pending:
+                pending_scan.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return tickers
+
+    async def _scan_chain_in_two_phases(
+        self,
+        underlying: Contract,
+        right: str,
+        strikes_by_expiration: Dict[str, List[float]],
+        target_delta: float,
+        exclude_exp_strike: Optional[Tuple[float, str]] = None,
+    ) -> List[Ticker]:
+        """
+        Scans the chain coarse to fine: first a few strikes sampled across
+        each expiration to find where the delta crosses the target, then only
+        the strikes bracketing it. Expirations where none of the samples
+        returned a delta are scanned in full in the second phase.
+        """
+        sampled = {
+            expiration: sample_strikes(
+                strikes, self.config.option_chains.two_phase_sample_strikes
+            )
+            for expiration, strikes in strikes_by_expiration.items()
+        }
+        tickers = await self._scan_chain(underlying, right, sampled, exclude_exp_strike)
+
+        sampled_deltas: Dict[str, List[Tuple[float, float]]] = {}
+        for ticker in tickers:
+            if (
+                isinstance(ticker.contract, Option)
+                and ticker.modelGreeks
+                and ticker.modelGreeks.delta is not None
+                and not util.isNan(ticker.modelGreeks.delta)
+            ):
+                sampled_deltas.setdefault(
+                    ticker.contract.lastTradeDateOrContractMonth, []
+                ).append((ticker.contract.strike, abs(ticker.modelGreeks.delta)))
+
+        remaining: Dict[str, List[float]] = {}
+        for expiration, strikes in strikes_by_expiration.items():
+            lowest, highest = (
+                strikes_bracketing_delta(
+                    sorted(sampled_deltas[expiration]), target_delta
+                )
+                if expiration in sampled_deltas
+                else (-math.inf, math.inf)
+            )
+            already_scanned = set(sampled[expiration])
+            bracket = [
+                strike
+                for strike in strikes
+                if lowest <= strike <= highest and strike not in already_scanned
+            ]
+            if bracket:
+                remaining[expiration] = bracket
+
+        if remaining:
+            log.info(
+                f"{underlying.symbol}: Scanning {sum(len(s) for s in remaining.values())}"
+                " strikes around the target delta"
+            )
+            tickers = list(tickers) + await self._scan_chain(
+                underlying, right, remaining, exclude_exp_strike
+            )
+        return tickers
+
     def get_algo_strategy(self) -> str:
         return self.config.orders.algo.strategy
 
@@ -3745,7 +4023,7 @@ class PortfolioManager:
             ignore_dte = self.config.vix_call_hedge.ignore_dte
 
             net_vix_call_count = net_option_positions(
-                "VIX", portfolio_positions, "C", ignore_dte=ignore_dte
+                "VIX", portfolio_positions, "C", ignore_dte=ignore_dte, today=self.today
             )
             if net_vix_call_count > 0:
                 log.info(
@@ -4010,12 +4288,10 @@ class PortfolioManager:
                                 f" price={price}, but we have no position to sell"
                             )
                             return (None, None)
-                        positions = [
-                            p.position
-                            for p in portfolio_positions[symbol]
-                            if isinstance(p.contract, Stock)
-                        ]
-                        position = positions[0] if len(positions) > 0 else 0
+                        stocks = self.get_portfolio_index(portfolio_positions)[
+                            symbol
+                        ].stocks
+                        position = stocks[0].position if stocks else 0
                         qty = min([max([-math.floor(position), qty]), 0])
                         # if for some reason the qty is zero, do nothing
                         if qty == 0:
@@ -4125,6 +4401,7 @@ class PortfolioManager:
                     trade.contract,
                     required_fields=[TickerField.MIDPOINT],
                     optional_fields=[TickerField.MARKET_PRICE],
+                    priority=MarketDataPriority.REPRICE,
                 )
 
                 (contract, order) = (trade.contract, trade.order)
@@ -4192,6 +4469,35 @@ class PortfolioManager:
                 )
                 continue
 
+    async def estimate_volatility(
+        self, underlying: Contract, underlying_ticker: Optional[Ticker] = None
+    ) -> Optional[float]:
+        """
+        Estimates the underlying's annualized volatility, for pricing the
+        chain before any option market data is loaded: its implied volatility
+        if the ticker has one, or else the realized volatility of its recent
+        daily closes. Returns None if it can't be estimated.
+        """
+        if underlying_ticker is not None:
+            implied_volatility = underlying_ticker.impliedVolatility
+            if not util.isNan(implied_volatility) and implied_volatility > 0:
+                return implied_volatility
+            log.info(
+                f"{underlying.symbol}: No implied volatility, estimating it from"
+                " recent closes instead"
+            )
+        try:
+            bars = await self.ibkr.request_historical_data(
+                underlying, self.config.constants.daily_stddev_window
+            )
+        except Exception as exc:
+            log.warning(
+                f"{underlying.symbol}: Unable to load historical data to estimate"
+                f" volatility: {exc}"
+            )
+            return None
+        return annualized_volatility(bar.close for bar in bars)
+
     async def get_write_threshold(
         self, ticker: Ticker, right: str
     ) -> tuple[float, float]:
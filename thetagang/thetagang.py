@@ -1,5 +1,7 @@
 import asyncio
 from asyncio import Future
+from datetime import datetime, timezone
+from typing import Optional
 
 import toml
 from ib_async import IB, IBC, Contract, Watchdog, util
@@ -8,7 +10,11 @@ from rich.console import Console
 from thetagang import log
 from thetagang.config import Config, normalize_config
 from thetagang.db import DataStore, sqlite_db_path
-from thetagang.exchange_hours import need_to_exit
+from thetagang.exchange_hours import (
+    determine_action,
+    need_to_exit,
+    seconds_until_open,
+)
 from thetagang.portfolio_manager import PortfolioManager
 
 try:
@@ -21,7 +27,35 @@ else:
 console = Console()
 
 
-def start(config_path: str, without_ibc: bool = False, dry_run: bool = False) -> None:
+async def run_daemon(
+    ib: IB, portfolio_manager: PortfolioManager, config: Config
+) -> None:
+    """Invoke manage() repeatedly on a live connection, sleeping between runs
+    and outside of exchange hours."""
+    interval = config.daemon.interval
+    while True:
+        now = datetime.now(tz=timezone.utc)
+        delay: float = interval
+        if determine_action(config.exchange_hours, now) != "continue":
+            delay = seconds_until_open(config.exchange_hours, now) or interval
+            log.info(f"Exchange is closed, next run in {delay:.0f}s")
+        elif not ib.isConnected():
+            log.warning(f"Not connected to IB Gateway, retrying in {interval}s")
+        else:
+            try:
+                await portfolio_manager.manage()
+            except Exception:
+                log.error("ThetaGang run failed, will retry on the next interval...")
+            log.info(f"Next run in {interval}s")
+        await asyncio.sleep(delay)
+
+
+def start(
+    config_path: str,
+    without_ibc: bool = False,
+    dry_run: bool = False,
+    daemon: bool = False,
+) -> None:
     with open(config_path, "r", encoding="utf8") as file:
         raw_config = file.read()
         config = toml.loads(raw_config)
@@ -41,20 +75,31 @@ def start(config_path: str, without_ibc: bool = False, dry_run: bool = False) ->
     if config.ib_async.logfile:
         util.logToFile(config.ib_async.logfile)
 
-    # Check if exchange is open before continuing
-    if need_to_exit(config.exchange_hours):
+    # Check if exchange is open before continuing. In daemon mode the run
+    # loop waits for the exchange to open by itself.
+    if not daemon and need_to_exit(config.exchange_hours):
         return
 
+    daemon_task: Optional[asyncio.Task[None]] = None
+
     async def onConnected() -> None:
+        nonlocal daemon_task
         log.info(f"Connected to IB Gateway, serverVersion={ib.client.serverVersion()}")
-        await portfolio_manager.manage()
+        if not daemon:
+            await portfolio_manager.manage()
+        elif daemon_task is None or daemon_task.done():
+            # The watchdog fires this again after a reconnect, but the loop
+            # (along with its warm caches) is kept running across reconnects
+            daemon_task = asyncio.ensure_future(
+                run_daemon(ib, portfolio_manager, config)
+            )
 
     ib = IB()
     ib.connectedEvent += onConnected
 
     completion_future: Future[bool] = util.getLoop().create_future()
     portfolio_manager = PortfolioManager(
-        config, ib, completion_future, dry_run, data_store=data_store
+        config, ib, completion_future, dry_run, data_store=data_store, daemon=daemon
     )
 
     probe_contract_config = config.watchdog.probeContract
@@ -65,15 +110,12 @@ def start(config_path: str, without_ibc: bool = False, dry_run: bool = False) ->
         currency=probe_contract_config.currency,
         exchange=probe_contract_config.exchange,
     )
-    print("without_ibc:" + str(without_ibc))
+
     if not without_ibc:
         # TWS version is pinned to current stable
-        ibc_config = config.get("ibc", {})
-        # Remove any config params that aren't valid keywords for IBC
-        ibc_keywords = {
-            k: ibc_config[k] for k in ibc_config if k not in ["RaiseRequestErrors"]
-        }
-        ibc = IBC(10.19, **ibc_keywords)
+        ibc_config = config.ibc
+        ibc = IBC(1037, **ibc_config.to_dict())
+        log.info(f"Starting TWS with twsVersion={ibc.twsVersion}")
 
         ib.RaiseRequestErrors = ibc_config.RaiseRequestErrors
 
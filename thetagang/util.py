@@ -1,4 +1,6 @@
 import math
+from bisect import bisect_left
+from datetime import date
 from operator import itemgetter
 from typing import Dict, List, Optional, Tuple
 
@@ -97,10 +99,57 @@ def count_long_option_positions(positions: List[PortfolioItem], right: str) -> i
     return math.floor(sum([p.position for p in get_long_positions(positions, right)]))
 
 
-def calculate_net_short_positions(positions: List[PortfolioItem], right: str) -> int:
+class _LeftmostAtLeast:
+    """
+    Segment tree over a list of values, answering "what is the leftmost index
+    in [lo, hi) whose value is at least threshold" in O(log n), with values
+    that can be removed as they're used up.
+    """
+
+    def __init__(self, values: List[float]) -> None:
+        self.size = 1
+        while self.size < len(values):
+            self.size *= 2
+        self.tree = [-math.inf] * (2 * self.size)
+        self.tree[self.size : self.size + len(values)] = values
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def remove(self, index: int) -> None:
+        node = index + self.size
+        self.tree[node] = -math.inf
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def find(self, lo: int, hi: int, threshold: float) -> Optional[int]:
+        def search(node: int, node_lo: int, node_hi: int) -> Optional[int]:
+            if node_hi <= lo or node_lo >= hi or self.tree[node] < threshold:
+                return None
+            if node_hi - node_lo == 1:
+                return node_lo
+            mid = (node_lo + node_hi) // 2
+            found = search(2 * node, node_lo, mid)
+            if found is None:
+                found = search(2 * node + 1, mid, node_hi)
+            return found
+
+        return search(1, 0, self.size)
+
+
+def calculate_net_short_positions(
+    positions: List[PortfolioItem], right: str, today: Optional[date] = None
+) -> int:
+    """
+    Counts the short contracts that aren't covered by a long contract of the
+    same right, as in a spread. A long covers a short if it expires no earlier
+    and its strike is at least as protective (the same or higher for puts, the
+    same or lower for calls).
+    """
     shorts: List[Tuple[int, float, float]] = [
         (
-            option_dte(p.contract.lastTradeDateOrContractMonth),
+            option_dte(p.contract.lastTradeDateOrContractMonth, today),
             float(p.contract.strike),
             float(p.position),
         )
@@ -108,39 +157,83 @@ def calculate_net_short_positions(positions: List[PortfolioItem], right: str) ->
     ]
     longs: List[Tuple[int, float, float]] = [
         (
-            option_dte(p.contract.lastTradeDateOrContractMonth),
+            option_dte(p.contract.lastTradeDateOrContractMonth, today),
             float(p.contract.strike),
             float(p.position),
         )
         for p in get_long_positions(positions, right)
     ]
-    shorts = sorted(shorts, key=itemgetter(0, 1), reverse=right.upper().startswith("P"))
-    longs = sorted(longs, key=itemgetter(0, 1), reverse=right.upper().startswith("P"))
+    return match_net_short_positions(shorts, longs, right)
+
+
+def match_net_short_positions(
+    shorts: List[Tuple[int, float, float]],
+    longs: List[Tuple[int, float, float]],
+    right: str,
+) -> int:
+    """
+    The matching behind calculate_net_short_positions, on (dte, strike,
+    position) lots of one right.
+
+    Shorts are matched in order, each one taking from the first longs (in the
+    same order) that cover it until it's fully covered. Longs covering a short
+    on DTE make up a prefix (puts) or suffix (calls) of that order, so the
+    first one also covering it on strike is found with a segment tree, and
+    the whole match runs in O((shorts + longs) log longs).
+    """
+    is_put = right.upper().startswith("P")
+    shorts = sorted(shorts, key=itemgetter(0, 1), reverse=is_put)
+    longs = sorted(longs, key=itemgetter(0, 1), reverse=is_put)
+
+    def covers(long_strike: float, short_strike: float) -> bool:
+        return (
+            math.isclose(short_strike, long_strike)
+            or (is_put and long_strike >= short_strike)
+            or (not is_put and long_strike <= short_strike)
+        )
 
-    def calc_net(short_dte: int, short_strike: float, short_position: float) -> float:
-        for i in range(len(longs)):
-            if short_position > -1:
+    # Flip call strikes so that "more protective" is "larger" for both rights
+    sign = 1.0 if is_put else -1.0
+    remaining = [long_position for _, _, long_position in longs]
+    available = _LeftmostAtLeast(
+        [
+            sign * long_strike if long_position >= 1 else -math.inf
+            for _, long_strike, long_position in longs
+        ]
+    )
+    # Longs are sorted by DTE, descending for puts and ascending for calls
+    long_dtes = [long_dte for long_dte, _, _ in longs]
+    if is_put:
+        long_dtes.reverse()
+
+    nets = []
+    for short_dte, short_strike, short_position in shorts:
+        if is_put:
+            lo, hi = 0, len(longs) - bisect_left(long_dtes, short_dte)
+        else:
+            lo, hi = bisect_left(long_dtes, short_dte), len(longs)
+        # Widened a little so that strikes only matching by isclose() are
+        # found too, then checked exactly
+        threshold = sign * short_strike - 2e-9 * abs(short_strike)
+        while short_position <= -1:
+            index = available.find(lo, hi, threshold)
+            if index is None:
                 break
-            (long_dte, long_strike, long_position) = longs[i]
+            if not covers(longs[index][1], short_strike):
+                lo = index + 1
+                continue
+            long_position = remaining[index]
+            if short_position + long_position > 0:
+                long_position = short_position + long_position
+                short_position = 0
+            else:
+                short_position += long_position
+                long_position = 0
+            remaining[index] = long_position
             if long_position < 1:
                 # ignore empty long positions
-                continue
-            if long_dte >= short_dte:
-                if (
-                    math.isclose(short_strike, long_strike)
-                    or (right.upper().startswith("P") and long_strike >= short_strike)
-                    or (right.upper().startswith("C") and long_strike <= short_strike)
-                ):
-                    if short_position + long_position > 0:
-                        long_position = short_position + long_position
-                        short_position = 0
-                    else:
-                        short_position += long_position
-                        long_position = 0
-            longs[i] = (long_dte, long_strike, long_position)
-        return min([0.0, short_position])
-
-    nets = [calc_net(*short) for short in shorts]
+                available.remove(index)
+        nets.append(min([0.0, short_position]))
 
     return math.floor(-sum(nets))
 
@@ -150,21 +243,21 @@ def net_option_positions(
     portfolio_positions: Dict[str, List[PortfolioItem]],
     right: str,
     ignore_dte: Optional[int] = None,
+    today: Optional[date] = None,
 ) -> int:
     if symbol in portfolio_positions:
+        options = [
+            (p.position, option_dte(p.contract.lastTradeDateOrContractMonth, today))
+            for p in portfolio_positions[symbol]
+            if isinstance(p.contract, Option)
+            and p.contract.right.upper().startswith(right.upper())
+        ]
         return math.floor(
             sum(
                 [
-                    p.position
-                    for p in portfolio_positions[symbol]
-                    if isinstance(p.contract, Option)
-                    and p.contract.right.upper().startswith(right.upper())
-                    and option_dte(p.contract.lastTradeDateOrContractMonth) >= 0
-                    and (
-                        not ignore_dte
-                        or option_dte(p.contract.lastTradeDateOrContractMonth)
-                        > ignore_dte
-                    )
+                    position
+                    for position, dte in options
+                    if dte >= 0 and (not ignore_dte or dte > ignore_dte)
                 ]
             )
         )